@@ -4,6 +4,11 @@ import os
 import subprocess
 import math
 
+from nanovna_analysis import resonance_spacing, vswr_to_power
+from nanovna_device import NanoVNA, ProtocolError
+from nanovna_metrics import METRICS, start_from_env, dump_from_env
+from nanovna_trace import span, enable_from_env
+
 try:
     import RPi.GPIO as GPIO
     RASPBERRY_PI = True
@@ -13,89 +18,44 @@ except ImportError:
 
 class CableAnalyzer:
     def __init__(self):
-        self.ser = None
+        self.vna = None
 
-    def send_command(self, command, wait_time=0.5):
+    def send_command(self, command, timeout=None):
+        """Команда с ожиданием приглашения ch>; ответ без эха, при сбое - исключение"""
         print(f"Отправка команды: {command}")
-        try:
-            self.ser.reset_input_buffer()
-            self.ser.reset_output_buffer()
-            
-            self.ser.write((command + '\r\n').encode())
-            time.sleep(wait_time)
-            
-            response = b''
-            start_time = time.time()
-            while time.time() - start_time < wait_time:
-                if self.ser.in_waiting > 0:
-                    response += self.ser.read(self.ser.in_waiting)
-                time.sleep(0.01)
-            
-            return response.decode('ascii', errors='ignore').strip()
-            
-        except Exception as e:
-            print(f"Ошибка при отправке команды: {e}")
-            return ""
+        return self.vna.send_command(command, timeout)
 
     def setup_nanovna(self, start_freq=1e6, stop_freq=300e6, points=201):
         print("Настройка NanoVNA для измерения кабеля...")
-        test_response = self.send_command("info", 1)
-        if not test_response or "ch>" not in test_response:
-            print("Ошибка: NanoVNA не отвечает")
+        try:
+            self.send_command("info")
+        except ProtocolError as e:
+            print(f"Ошибка: NanoVNA не отвечает ({e})")
             return False
         commands = [
             f"sweep {int(start_freq)} {int(stop_freq)} {points}",
             "pause",
         ]
         for cmd in commands:
-            response = self.send_command(cmd, 0.5)
+            response = self.send_command(cmd)
             if response:
                 print(f"Ответ: {response}")
-        
-        time.sleep(1)
         return True
 
-    def get_s11_data(self):
-        print("Получение данных S11...")
-        self.send_command("resume", 2)
-        freq_data = self.send_command("frequencies", 1)
-        s11_data = self.send_command("data 0", 1)
-        return freq_data, s11_data
-
-    def parse_frequency_data(self, data):
-        frequencies = []
-        if not data:
-            return frequencies
-        lines = data.strip().split('\n')
-        for line in lines:
-            line = line.strip()
-            if line and not line.startswith('ch>'):
-                try:
-                    parts = line.split()
-                    for part in parts:
-                        freq = float(part)
-                        frequencies.append(freq)
-                except ValueError:
-                    continue
-        return frequencies
+    def query_table(self, command, width):
+        """Числовой ответ, разобранный по мере приема в таблицу строк по width чисел"""
+        print(f"Отправка команды: {command}")
+        return self.vna.query_table(command, width)
 
-    def parse_s11_data(self, data):
-        s11_points = []
-        if not data:
-            return s11_points
-        lines = data.strip().split('\n')
-        for line in lines:
-            line = line.strip()
-            if line and not line.startswith('ch>'):
-                try:
-                    parts = line.split()
-                    if len(parts) >= 2:
-                        real = float(parts[0])
-                        imag = float(parts[1])
-                        s11_points.append((real, imag))
-                except ValueError:
-                    continue
-        return s11_points
+    def get_s11_data(self, sweep_time=2):
+        print("Получение данных S11...")
+        self.send_command("resume")
+        time.sleep(sweep_time)
+        self.send_command("pause")
+        # Частоты (Гц) и S11 - строки real imag
+        frequencies = self.query_table("frequencies", 1)[:, 0]
+        s11_points = self.query_table("data 0", 2)
+        return frequencies, s11_points
 
     def calculate_vswr(self, s11_points):
         vswr_values = []
@@ -144,18 +104,12 @@ class CableAnalyzer:
                     return electrical_length, electrical_length, freq_diff/10, frequencies[0], frequencies[-1]
                 return None, None, None, None, None
             
-            # Берем первые два пика
-            peak1_idx = peaks[0]
-            peak2_idx = peaks[1]
-            
-            freq1 = frequencies[peak1_idx]
-            freq2 = frequencies[peak2_idx]
-            
-            delta_f = abs(freq2 - freq1)
-            
-            if delta_f == 0:
+            # Первые два резонанса, уточненные между точками сетки
+            spacing = resonance_spacing(frequencies, peaks, vswr_to_power(vswr_values))
+            if spacing is None:
                 print("Нулевая разность частот")
                 return None, None, None, None, None
+            delta_f, freq1, freq2 = spacing
                 
             c = 3e8
             cable_length = c / (2 * delta_f * vf)
@@ -174,13 +128,7 @@ class CableAnalyzer:
         if not self.setup_nanovna(start_freq=1e6, stop_freq=500e6, points=101):
             return
         
-        freq_data, s11_data = self.get_s11_data()
-        if not freq_data or not s11_data:
-            print("Не удалось получить данные от NanoVNA")
-            return
-        
-        frequencies = self.parse_frequency_data(freq_data)
-        s11_points = self.parse_s11_data(s11_data)
+        frequencies, s11_points = self.get_s11_data()
         
         if len(frequencies) < 10 or len(s11_points) < 10:
             print("Недостаточно данных для анализа")
@@ -203,21 +151,23 @@ class CableAnalyzer:
         print("="*60)
         
         results = {}
-        for cable_type, vf in cable_types.items():
-            length, _, delta_f, freq1, freq2 = self.find_cable_length(
+        with METRICS.timer('nanovna_analysis_seconds', analysis='cable'), span('find_cable_length'):
+            for cable_type, vf in cable_types.items():
+                length, _, delta_f, freq1, freq2 = self.find_cable_length(
+                    frequencies, phases, vswr_values, vf)
+                if length:
+                    results[cable_type] = length
+                    print(f"{cable_type:30} (VF={vf}): {length:.2f} м")
+            
+            # Основной результат
+            vf = 0.66
+            cable_length, electrical_length, delta_f, freq1, freq2 = self.find_cable_length(
                 frequencies, phases, vswr_values, vf)
-            if length:
-                results[cable_type] = length
-                print(f"{cable_type:30} (VF={vf}): {length:.2f} м")
-        
-        # Основной результат
-        vf = 0.66
-        cable_length, electrical_length, delta_f, freq1, freq2 = self.find_cable_length(
-            frequencies, phases, vswr_values, vf)
         
         if cable_length:
             self.print_detailed_results(cable_length, delta_f, frequencies, vswr_values)
-            self.save_results(frequencies, s11_points, cable_length, results)
+            with METRICS.timer('nanovna_save_seconds', kind='results'), span('save_results'):
+                self.save_results(frequencies, s11_points, cable_length, results)
         else:
             print("Не удалось определить длину кабеля")
 
@@ -273,11 +223,10 @@ class CableAnalyzer:
             print(f"Ошибка сохранения: {e}")
 
     def run(self):
+        start_from_env()
+        enable_from_env()
         try:
-            self.ser = serial.Serial('/dev/ttyACM0', 115200, timeout=1)
-            time.sleep(2)
-            self.ser.reset_input_buffer()
-            self.ser.reset_output_buffer()
+            self.vna = NanoVNA('/dev/ttyACM0', timeout=2).open()
             print("Подключение к NanoVNA установлено")
             self.measure_cable()
             
@@ -288,9 +237,10 @@ class CableAnalyzer:
         except Exception as e:
             print(f"Ошибка: {e}")
         finally:
-            if self.ser and self.ser.is_open:
-                self.ser.close()
+            if self.vna:
+                self.vna.close()
                 print("Порт закрыт")
+            dump_from_env()
 
 if __name__ == "__main__":
     analyzer = CableAnalyzer()
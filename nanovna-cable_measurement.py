@@ -1,25 +1,18 @@
-import serial
 import matplotlib.pyplot as plt
 import numpy as np
 import time
-from scipy.signal import find_peaks
 import math
 
-def send_command(ser, command, wait_time=0.5):
+from nanovna_analysis import find_cable_length
+from nanovna_device import NanoVNA
+from nanovna_trace import span, enable_from_env
+
+def send_command(vna, command, timeout=None):
+    """Команда с ожиданием приглашения ch>; ответ без эха, при сбое - исключение"""
     print(f"Отправка команды: {command}")
-    ser.write((command + '\r\n').encode())
-    time.sleep(wait_time)
-    
-    response = b''
-    start_time = time.time()
-    while time.time() - start_time < wait_time:
-        if ser.in_waiting > 0:
-            response += ser.read(ser.in_waiting)
-        time.sleep(0.01)
-    
-    return response.decode('ascii', errors='ignore')
+    return vna.send_command(command, timeout)
 
-def setup_nanovna_for_cable_measurement(ser, start_freq=1e6, stop_freq=300e6, points=201):
+def setup_nanovna_for_cable_measurement(vna, start_freq=1e6, stop_freq=300e6, points=201):
     print("Настройка NanoVNA для измерения кабеля...")
     
     commands = [
@@ -28,59 +21,27 @@ def setup_nanovna_for_cable_measurement(ser, start_freq=1e6, stop_freq=300e6, po
     ]
     
     for cmd in commands:
-        response = send_command(ser, cmd, 0.5)
+        response = send_command(vna, cmd)
         if response:
-            print(f"Ответ на {cmd}: {response.strip()}")
-    
-    time.sleep(1)
+            print(f"Ответ на {cmd}: {response}")
 
-def get_s11_data(ser):
-    print("Получение данных S11...")
-    
-    send_command(ser, "resume", 2)
-    
-    # Получаем данные частот
-    freq_data = send_command(ser, "frequencies", 1)
-    
-    # Получаем данные S11
-    s11_data = send_command(ser, "data 0", 1)  # S11 - reflection
-    
-    return freq_data, s11_data
+def query_table(vna, command, width):
+    """Числовой ответ, разобранный по мере приема в таблицу строк по width чисел"""
+    print(f"Отправка команды: {command}")
+    return vna.query_table(command, width)
 
-def parse_frequency_data(data):
-    frequencies = []
-    lines = data.strip().split('\n')
-    
-    for line in lines:
-        line = line.strip()
-        if line and not line.startswith('ch>'):
-            try:
-                parts = line.split()
-                for part in parts:
-                    freq = float(part)
-                    frequencies.append(freq)
-            except ValueError:
-                continue
+def get_s11_data(vna, sweep_time=2):
+    print("Получение данных S11...")
     
-    return frequencies
-
-def parse_s11_data(data):
-    s11_points = []
-    lines = data.strip().split('\n')
+    send_command(vna, "resume")
+    time.sleep(sweep_time)
+    send_command(vna, "pause")
     
-    for line in lines:
-        line = line.strip()
-        if line and not line.startswith('ch>'):
-            try:
-                parts = line.split()
-                if len(parts) >= 2:
-                    real = float(parts[0])
-                    imag = float(parts[1])
-                    s11_points.append((real, imag))
-            except ValueError:
-                continue
+    # Частоты (Гц) и S11 - строки real imag
+    frequencies = query_table(vna, "frequencies", 1)[:, 0]
+    s11_points = query_table(vna, "data 0", 2)  # S11 - reflection
     
-    return s11_points
+    return frequencies, s11_points
 
 def calculate_phase(s11_points):
     phases = []
@@ -100,45 +61,16 @@ def calculate_vswr(s11_points):
         vswr_values.append(vswr)
     return vswr_values
 
-def find_cable_length(frequencies, phases, vswr_values, vf=0.66):
-    """
-    Определение длины кабеля по фазовому сдвигу
-    vf - коэффициент укорочения (velocity factor)
-    """
-    # Находим пики в КСВ (минимумы отражения)
-    peaks, _ = find_peaks(-np.array(vswr_values), prominence=0.1)
-    
-    if len(peaks) < 2:
-        print("Не удалось найти достаточное количество резонансов")
-        return None, None
-    
-    # Берем первые два резонансных пика
-    peak1_idx = peaks[0]
-    peak2_idx = peaks[1]
-    
-    freq1 = frequencies[peak1_idx]
-    freq2 = frequencies[peak2_idx]
-    
-    # Разность частот между соседними резонансами
-    delta_f = abs(freq2 - freq1)
-    
-    # Длина кабеля: L = c / (2 * delta_f * vf)
-    c = 3e8  # Скорость света м/с
-    cable_length = c / (2 * delta_f * vf)
-    
-    # Альтернативный метод: по фазовому сдвигу
-    phase_slope = np.polyfit(frequencies, phases, 1)[0]  # Наклон фазы
-    electrical_length = -phase_slope * c / (4 * np.pi * vf)
-    
-    return cable_length, electrical_length, delta_f, freq1, freq2
-
 def plot_cable_measurement(frequencies, phases, vswr_values, cable_length, delta_f):
     fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 10))
     
     print(f"\n=== РЕЗУЛЬТАТЫ ИЗМЕРЕНИЯ КАБЕЛЯ ===")
-    print(f"Разность частот между резонансами: {delta_f/1e6:.2f} МГц")
-    print(f"Расчетная длина кабеля: {cable_length:.2f} метров")
-    print(f"Длина кабеля в сантиметрах: {cable_length * 100:.1f} см")
+    if cable_length is None or delta_f is None:
+        print("Резонансы не найдены - длина кабеля не определена")
+    else:
+        print(f"Разность частот между резонансами: {delta_f/1e6:.2f} МГц")
+        print(f"Расчетная длина кабеля: {cable_length:.2f} метров")
+        print(f"Длина кабеля в сантиметрах: {cable_length * 100:.1f} см")
 
     # График 1: КСВ
     frequencies_mhz = [f / 1e6 for f in frequencies]
@@ -158,17 +90,17 @@ def plot_cable_measurement(frequencies, phases, vswr_values, cable_length, delta
     ax2.grid(True, alpha=0.3)
     ax2.legend()
     
-    plt.tight_layout()
-    plt.show()
+    with span('plot_layout'):
+        plt.tight_layout()
+    with span('plot_show'):
+        plt.show()
     
-def measure_cable_with_different_vf(ser):
-    setup_nanovna_for_cable_measurement(ser, start_freq=1e6, stop_freq=500e6, points=501)
+def measure_cable_with_different_vf(vna):
+    setup_nanovna_for_cable_measurement(vna, start_freq=1e6, stop_freq=500e6, points=501)
     
-    freq_data, s11_data = get_s11_data(ser)
-    frequencies = parse_frequency_data(freq_data)
-    s11_points = parse_s11_data(s11_data)
+    frequencies, s11_points = get_s11_data(vna)
     
-    if not frequencies or not s11_points:
+    if len(frequencies) == 0 or len(s11_points) == 0:
         print("Не удалось получить данные")
         return
     
@@ -189,7 +121,7 @@ def measure_cable_with_different_vf(ser):
     print("\n=== РЕЗУЛЬТАТЫ ДЛЯ РАЗНЫХ ТИПОВ КАБЕЛЕЙ ===")
     for cable_type, vf in cable_types.items():
         length, _, delta_f, freq1, freq2 = find_cable_length(frequencies, phases, vswr_values, vf)
-        if length:
+        if length is not None:
             print(f"{cable_type} (VF={vf}): {length:.2f} м")
         
 
@@ -197,25 +129,21 @@ def measure_cable_with_different_vf(ser):
     vf = 0.66
     
     # Расчет длины с выбранным коэффициентом
-    cable_length, electrical_length, delta_f, freq1, freq2 = find_cable_length(
-        frequencies, phases, vswr_values, vf)
+    with span('find_cable_length', vf=vf):
+        cable_length, electrical_length, delta_f, freq1, freq2 = find_cable_length(
+            frequencies, phases, vswr_values, vf)
     
-    if cable_length:
+    if cable_length is not None:
         plot_cable_measurement(frequencies, phases, vswr_values, cable_length, delta_f)
     else:
         print("Не удалось определить длину кабеля")
 
 def main():
-    ser = None
+    vna = None
+    enable_from_env()
     try:
-        ser = serial.Serial(
-            port='COM3',
-            baudrate=115200,
-            timeout=2,
-            write_timeout=2,
-        )
-        time.sleep(2)
-        measure_cable_with_different_vf(ser)
+        vna = NanoVNA('COM3', timeout=2).open()
+        measure_cable_with_different_vf(vna)
         
     except Exception as e:
         print(f"Ошибка: {e}")
@@ -223,8 +151,8 @@ def main():
         traceback.print_exc()
         
     finally:
-        if ser and ser.is_open:
-            ser.close()
+        if vna:
+            vna.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
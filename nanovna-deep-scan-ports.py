@@ -2,12 +2,21 @@ import serial.tools.list_ports
 import serial
 import time
 import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 
+from nanovna_discovery import (DiscoveryCache, SYSTEM_PORT_PREFIXES, identify_port, is_cdc_port,
+                               load_usb_ids, usb_score)
+from nanovna_hotplug import HotplugMonitor
+
 class NanoVNAPortFinder:
-    def __init__(self):
+    def __init__(self, usb_ids=None):
         self.found_devices = []
+        # Таблица (VID, PID) -> вес; по умолчанию с учетом NANOVNA_USB_IDS
+        self.usb_ids = load_usb_ids() if usb_ids is None else usb_ids
         self.test_results = {}
+        self.lock = threading.Lock()
+        self.cache = DiscoveryCache()
         
     def get_all_com_ports(self):
         """Получить список всех COM портов"""
@@ -26,12 +35,17 @@ class NanoVNAPortFinder:
                 'hwid': port.hwid,
                 'vid': None,
                 'pid': None,
+                'serial_number': getattr(port, 'serial_number', None),
                 'manufacturer': getattr(port, 'manufacturer', 'N/A'),
                 'product': getattr(port, 'product', 'N/A')
             }
             
-            # Парсим VID и PID из HWID
-            if 'VID' in port.hwid and 'PID' in port.hwid:
+            # VID и PID из структурированных полей list_ports (Linux, Windows, macOS)
+            if getattr(port, 'vid', None) is not None and getattr(port, 'pid', None) is not None:
+                info['vid'] = f"{port.vid:04x}"
+                info['pid'] = f"{port.pid:04x}"
+            # Иначе парсим из HWID в формате Windows (VID_xxxx&PID_xxxx)
+            elif 'VID_' in port.hwid and 'PID_' in port.hwid:
                 try:
                     vid_start = port.hwid.index('VID_') + 4
                     pid_start = port.hwid.index('PID_') + 4
@@ -51,15 +65,46 @@ class NanoVNAPortFinder:
             print(f"  Продукт: {info['product']}")
             if info['vid'] and info['pid']:
                 print(f"  VID:PID: {info['vid']}:{info['pid']}")
+            if info['serial_number']:
+                print(f"  Серийный номер: {info['serial_number']}")
             print(f"  HWID: {port.hwid}")
             print("-" * 40)
         
         return port_info
     
-    def test_nanovna_connection(self, port_info, baudrate=115200, timeout=2):
+    def fast_identify(self, port_info, baudrate=115200, timeout=0.3):
+        """Быстрая идентификация: одна команда info, чтение до приглашения ch>"""
+        device = port_info['device']
+        identity = identify_port(device, baudrate, command='info', timeout=timeout)
+        indicators = []
+        if identity['prompt']:
+            indicators.append('ch>')
+        if 'nanovna' in (identity['board'] or identity['response']).lower():
+            indicators.append('NanoVNA')
+        if identity['version']:
+            indicators.append('version')
+        result = {
+            'port': device,
+            'success': bool(identity['response']),
+            'responses': [identity['response']] if identity['response'] else [],
+            'indicators': indicators,
+            'is_nanovna': identity['prompt'] and len(indicators) >= 2,
+            'confidence': len(indicators),
+            'identity': {k: identity[k] for k in ('board', 'version', 'platform')},
+            'elapsed': identity['elapsed'],
+            'timestamp': datetime.now().strftime("%H:%M:%S")
+        }
+        if 'error' in identity:
+            print(f"  Ошибка: {identity['error']}")
+            result['error'] = identity['error']
+        return result
+    
+    def test_nanovna_connection(self, port_info, baudrate=115200, timeout=2, fast=False):
         """Тестирование подключения к порту для идентификации NanoVNA"""
         device = port_info['device']
         print(f"Тестирование порта {device}...")
+        if fast:
+            return self.fast_identify(port_info, baudrate)
         
         try:
             # Пробуем подключиться
@@ -136,23 +181,43 @@ class NanoVNAPortFinder:
             }
     
     def check_vid_pid_nanovna(self, port_info):
-        """Проверка по VID/PID - характерные для NanoVNA"""
-        # Известные VID:PID для NanoVNA и CH340 (USB-UART чип)
-        nanovna_vid_pid = [
-            ('1a86', '7523'),  # CH340 - самый распространенный
-            ('0403', '6001'),  # FT232 - иногда используется
-            ('10c4', 'ea60'),  # CP210x - реже
-        ]
-        
-        if port_info['vid'] and port_info['pid']:
-            for vid, pid in nanovna_vid_pid:
-                if (port_info['vid'].lower() == vid and 
-                    port_info['pid'].lower() == pid):
-                    return True
-        return False
+        """Проверка по VID/PID - характерные для NanoVNA (см. NANOVNA_USB_IDS)"""
+        return self.usb_weight(port_info) > 0
     
-    def scan_for_nanovna(self, baudrates=[115200, 9600, 57600]):
-        """Основная функция сканирования"""
+    def usb_weight(self, port_info):
+        if not port_info.get('vid') or not port_info.get('pid'):
+            return 0
+        try:
+            return usb_score(int(port_info['vid'], 16), int(port_info['pid'], 16), self.usb_ids)
+        except ValueError:
+            return 0
+    
+    def is_cdc(self, port_info):
+        vid, pid = port_info.get('vid'), port_info.get('pid')
+        return is_cdc_port(port_info['device'],
+                           int(vid, 16) if vid else None, int(pid, 16) if pid else None)
+    
+    def probe_port(self, port_info, baudrates, fast=True):
+        """Проверка одного порта на всех скоростях (выполняется в пуле потоков)"""
+        is_likely_nanovna = self.check_vid_pid_nanovna(port_info)
+        if fast and self.is_cdc(port_info):
+            # USB CDC не зависит от скорости - достаточно одной попытки
+            baudrates = baudrates[:1]
+        result = None
+        for baudrate in baudrates:
+            result = self.test_nanovna_connection(port_info, baudrate, fast=fast)
+            if result['success']:
+                return port_info, baudrate, result, is_likely_nanovna
+        return port_info, None, result, is_likely_nanovna
+
+    def is_confident(self, result, is_likely_nanovna):
+        """Уверенное совпадение - можно не ждать остальные порты"""
+        return result['is_nanovna'] and (is_likely_nanovna or result['confidence'] >= 3)
+
+    def scan_for_nanovna(self, baudrates=[115200, 9600, 57600], max_workers=8,
+                         port_timeout=30, first_match=False, fast=True):
+        """Основная функция сканирования: порты проверяются параллельно"""
+        # port_timeout - предельное время проверки одного порта на всех скоростях
         print("ЗАПУСК СКАНИРОВАНИЯ NANOVNA...")
         print("=" * 60)
         
@@ -163,40 +228,105 @@ class NanoVNAPortFinder:
             print("COM порты не найдены!")
             return []
         
-        print(f"\nТЕСТИРОВАНИЕ {len(ports)} ПОРТОВ...")
-        print("=" * 60)
+        # Порт из кэша подтверждается одной быстрой командой
+        if first_match:
+            cached = self.cache.find(serial.tools.list_ports.comports())
+            if cached:
+                port_info = next(p for p in ports if p['device'] == cached)
+                port_info['baudrate'] = self.cache.entry_for(cached).get('baudrate', baudrates[0])
+                port_info['test_result'] = {
+                    'port': cached, 'success': True, 'responses': [], 'indicators': ['ch>', 'cache'],
+                    'is_nanovna': True, 'confidence': 2,
+                    'timestamp': datetime.now().strftime("%H:%M:%S")
+                }
+                print(f"✅ {cached} - NanoVNA из кэша обнаружения")
+                return [port_info]
+        
+        # Сначала только кандидаты по VID/PID, остальные USB-порты - если NanoVNA среди них нет
+        candidates = sorted((p for p in ports if self.check_vid_pid_nanovna(p)),
+                            key=lambda p: -self.usb_weight(p))
+        others = [p for p in ports if not self.check_vid_pid_nanovna(p)
+                  and not p['device'].startswith(SYSTEM_PORT_PREFIXES)]
+        print(f"\nКАНДИДАТОВ ПО VID/PID: {len(candidates)}, ПРОЧИХ ПОРТОВ: {len(others)}")
         
         candidate_ports = []
+        for group in (candidates, others):
+            if not group:
+                continue
+            print(f"\nТЕСТИРОВАНИЕ {len(group)} ПОРТОВ (потоков: {min(max_workers, len(group))})...")
+            print("=" * 60)
+            candidate_ports += self._probe_ports(group, baudrates, max_workers, port_timeout,
+                                                 first_match, fast)
+            if any(p['test_result']['is_nanovna'] for p in candidate_ports):
+                break
         
-        for port_info in ports:
-            # Сначала проверяем по VID/PID
-            is_likely_nanovna = self.check_vid_pid_nanovna(port_info)
-            
-            if is_likely_nanovna:
-                print(f"🔍 {port_info['device']} - возможный NanoVNA (по VID/PID)")
-            
-            # Тестируем подключение на разных скоростях
-            for baudrate in baudrates:
-                print(f"  Скорость {baudrate}...")
-                result = self.test_nanovna_connection(port_info, baudrate)
+        # Сначала уверенные совпадения
+        candidate_ports.sort(key=lambda p: -p['test_result']['confidence'])
+        for port_info in candidate_ports:
+            if port_info['test_result']['is_nanovna']:
+                self.cache.remember(port_info['device'], port_info['baudrate'])
+        with self.lock:
+            self.found_devices = list(candidate_ports)
+        return candidate_ports
+    
+    def _probe_ports(self, ports, baudrates, max_workers, port_timeout, first_match, fast):
+        """Параллельная проверка группы портов в пуле потоков"""
+        candidate_ports = []
+        started = {}
+        
+        def probe(port_info):
+            started[port_info['device']] = time.monotonic()
+            return self.probe_port(port_info, baudrates, fast)
+        
+        executor = ThreadPoolExecutor(max_workers=min(max_workers, len(ports)))
+        futures = {executor.submit(probe, port_info): port_info for port_info in ports}
+        pending = set(futures)
+        
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=0.25, return_when=FIRST_COMPLETED)
                 
-                if result['success']:
+                # Порты, не ответившие за port_timeout с момента начала проверки
+                now = time.monotonic()
+                expired = {f for f in pending
+                           if now - started.get(futures[f]['device'], now) > port_timeout}
+                for future in expired:
+                    print(f"⏱ {futures[future]['device']} - превышено время ожидания")
+                pending -= expired
+                
+                for future in done:
+                    port_info, baudrate, result, is_likely_nanovna = future.result()
+                    with self.lock:
+                        self.test_results[port_info['device']] = result
+                    
+                    if is_likely_nanovna:
+                        print(f"🔍 {port_info['device']} - возможный NanoVNA (по VID/PID)")
+                    
+                    if baudrate is None:
+                        print(f"  {port_info['device']}: Ошибка подключения")
+                        continue
+                    
                     port_info['test_result'] = result
                     port_info['baudrate'] = baudrate
-                    
                     if result['is_nanovna'] or is_likely_nanovna:
                         candidate_ports.append(port_info)
                     
                     # Вывод результатов теста
                     status = "✅ NanoVNA обнаружен!" if result['is_nanovna'] else "❌ Не NanoVNA"
-                    print(f"  Результат: {status}")
+                    print(f"  {port_info['device']} ({baudrate}): {status}")
                     
                     if result['indicators']:
                         print(f"  Признаки: {', '.join(result['indicators'])}")
+                    identity = result.get('identity')
+                    if identity and identity['board']:
+                        print(f"  Плата: {identity['board']}, версия: {identity['version']}")
                     
-                    break  # Переходим к следующему порту
-                else:
-                    print(f"  Результат: Ошибка подключения")
+                    if first_match and self.is_confident(result, is_likely_nanovna):
+                        pending = set()
+                        break
+        finally:
+            # Не ждем зависшие порты - потоки завершатся по таймаутам serial
+            executor.shutdown(wait=False, cancel_futures=True)
         
         return candidate_ports
     
@@ -232,37 +362,30 @@ class NanoVNAPortFinder:
         
         print(f"\n🎯 РЕКОМЕНДУЕМЫЙ ПОРТ: {candidate_ports[0]['device']}")
     
-    def continuous_monitoring(self, interval=5):
-        """Непрерывный мониторинг портов"""
+    def continuous_monitoring(self, interval=1):
+        """Непрерывный мониторинг портов: inotify на Linux, иначе опрос каждые interval с"""
         print("🚀 ЗАПУСК НЕПРЕРЫВНОГО МОНИТОРИНГА")
         print("Нажмите Ctrl+C для остановки")
         
-        known_ports = set()
+        def probe(device):
+            port_info = {'device': device, 'description': 'Новое устройство'}
+            return self.test_nanovna_connection(port_info, fast=True)
+        
+        def on_event(message):
+            device = message['device']
+            if message['event'] == 'attach':
+                print(f"\n[{message['time']}] Новый порт: {device}")
+            elif message['event'] == 'detach':
+                print(f"[{message['time']}] Удален порт: {device}")
+            elif message['result'] and message['result']['is_nanovna']:
+                print(f"🎉 ОБНАРУЖЕН NANOVNA НА {device}!")
+                self.cache.remember(device)
+        
+        monitor = HotplugMonitor(probe=probe, poll_interval=interval)
+        monitor.subscribe(on_event)
         
         try:
-            while True:
-                current_ports = {port.device for port in serial.tools.list_ports.comports()}
-                
-                # Новые порты
-                new_ports = current_ports - known_ports
-                # Исчезнувшие порты
-                removed_ports = known_ports - current_ports
-                
-                if new_ports:
-                    print(f"\n[{datetime.now().strftime('%H:%M:%S')}] Новые порты: {', '.join(new_ports)}")
-                    # Проверяем новые порты на наличие NanoVNA
-                    for port_device in new_ports:
-                        port_info = {'device': port_device, 'description': 'Новое устройство'}
-                        result = self.test_nanovna_connection(port_info)
-                        if result['is_nanovna']:
-                            print(f"🎉 ОБНАРУЖЕН NANOVNA НА {port_device}!")
-                
-                if removed_ports:
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Удаленные порты: {', '.join(removed_ports)}")
-                
-                known_ports = current_ports
-                time.sleep(interval)
-                
+            monitor.run_forever()
         except KeyboardInterrupt:
             print("\nМониторинг остановлен")
 
@@ -285,8 +408,8 @@ def main():
         choice = input("\nВаш выбор (1-5): ").strip()
         
         if choice == '1':
-            # Быстрое сканирование на стандартной скорости
-            candidates = finder.scan_for_nanovna(baudrates=[115200])
+            # Быстрое сканирование на стандартной скорости до первого уверенного совпадения
+            candidates = finder.scan_for_nanovna(baudrates=[115200], first_match=True)
             finder.print_results(candidates)
             
         elif choice == '2':
@@ -4,6 +4,8 @@ import time
 import subprocess
 import os
 
+from nanovna_discovery import DiscoveryCache, rank_ports
+
 def find_nanovna_auto():
     print("Автопоиск NanoVNA на Raspberry Pi...")
 
@@ -13,15 +15,21 @@ def find_nanovna_auto():
         print("Не найдено последовательных портов")
         return None
 
+    # Сначала порт из кэша прошлых запусков
+    cache = DiscoveryCache()
+    cached = cache.find(ports)
+    if cached:
+        print(f"Порт из кэша подтвержден: {cached}")
+        return cached
+
     print(f"Найдено портов: {len(ports)}")
 
-    for port in ports:
-        print(f"Проверка порта: {port.device} - {port.description}")
+    # Сначала порты с известными VID/PID, затем прочие USB; системные UART пропускаются
+    candidates, others = rank_ports(ports)
+    print(f"Кандидатов по USB VID/PID: {len(candidates)}")
 
-        # Пропускаем порты, которые вряд ли будут NanoVNA
-        if 'ttyAMA' in port.device or 'ttyS' in port.device:
-            print(f"Пропуск системного порта: {port.device}")
-            continue
+    for port in candidates + others:
+        print(f"Проверка порта: {port.device} - {port.description}")
 
         try:
             with serial.Serial(port.device, 115200, timeout=1) as ser:
@@ -42,6 +50,7 @@ def find_nanovna_auto():
 
                 # Проверяем признаки NanoVNA
                 if any(keyword in response.lower() for keyword in ['nanovna', 'ch>', 'version']):
+                    cache.remember(port.device, ports=ports)
                     return port.device
 
         except serial.SerialException as e:
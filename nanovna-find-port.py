@@ -2,9 +2,16 @@ import serial.tools.list_ports
 import serial
 import time
 
+from nanovna_discovery import find_cached_port, remember_port, rank_ports
+
 def find_nanovna_auto():
     print("Автопоиск NanoVNA...")
-    for port in serial.tools.list_ports.comports():
+    port = find_cached_port()
+    if port:
+        return port
+    # Сначала порты с известными VID/PID NanoVNA
+    candidates, others = rank_ports(serial.tools.list_ports.comports())
+    for port in candidates + others:
         try:
             with serial.Serial(port.device, 115200, timeout=1) as ser:
                 time.sleep(2)
@@ -13,6 +20,7 @@ def find_nanovna_auto():
                 response = ser.read(100).decode('ascii', errors='ignore')
                 
                 if 'nanovna' in response.lower() or 'ch>' in response:
+                    remember_port(port.device)
                     return port.device
         except:
             continue
@@ -1,3 +1,4 @@
+import argparse
 import serial
 import time
 
@@ -21,5 +22,136 @@ def ultra_simple_generator(port='COM3', frequency_hz=1000000):
         ser.write(b"generator 0\n")
         ser.close()
 
+class GeneratorController:
+    """
+    Генератор с записью в порт только при смене частоты.
+    Команды кодируются заранее, переключения идут по монотонным часам
+    от общего начала, поэтому ошибка времени не накапливается.
+    """
+
+    def __init__(self, ser, unit_hz=1000, keepalive=None):
+        self.ser = ser
+        self.unit_hz = unit_hz        # Единица аргумента команды generator (в прошивке - кГц)
+        self.keepalive = keepalive    # Период повтора команды, если прошивка его требует
+        self.current = None
+        self.last_write = 0.0
+        self.writes = 0
+
+    def encode(self, frequency_hz):
+        value = int(round(frequency_hz / self.unit_hz))
+        return f"generator {value}\n".encode()
+
+    def actual_frequency(self, frequency_hz):
+        """Частота, которую реально установит команда с учетом единицы"""
+        return int(round(frequency_hz / self.unit_hz)) * self.unit_hz
+
+    def _write(self, command):
+        self.ser.write(command)
+        self.current = command
+        self.last_write = time.monotonic()
+        self.writes += 1
+
+    def set_command(self, command):
+        """Запись заранее закодированной команды, только если состояние меняется"""
+        if command != self.current:
+            self._write(command)
+            return True
+        return False
+
+    def set_frequency(self, frequency_hz):
+        return self.set_command(self.encode(frequency_hz))
+
+    def wait_until(self, deadline):
+        """Ожидание момента deadline с повтором команды по keepalive"""
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                return
+            wake = deadline
+            if self.keepalive and self.current is not None:
+                next_keepalive = self.last_write + self.keepalive
+                if next_keepalive <= now:
+                    self._write(self.current)
+                    continue
+                wake = min(wake, next_keepalive)
+            time.sleep(min(wake - now, 3600))
+
+    def hold(self, frequency_hz, duration=None):
+        """Удержание частоты (duration=None - до Ctrl+C)"""
+        self.set_frequency(frequency_hz)
+        deadline = float('inf') if duration is None else time.monotonic() + duration
+        self.wait_until(deadline)
+
+    def play(self, hops, repeat=False):
+        """Воспроизведение списка (частота Гц, задержка с) по расписанию"""
+        schedule = [(self.encode(frequency), dwell) for frequency, dwell in hops]
+        if not schedule:
+            return
+        start = time.monotonic()
+        elapsed = 0.0
+        while True:
+            for command, dwell in schedule:
+                self.set_command(command)
+                elapsed += dwell
+                self.wait_until(start + elapsed)
+            if not repeat:
+                return
+
+    def stop(self):
+        self.ser.write(b"generator 0\n")
+        self.current = None
+
+def sweep_hops(start_hz, stop_hz, step_hz, dwell):
+    """Список шагов для пошаговой перестройки от start до stop"""
+    count = int(round((stop_hz - start_hz) / step_hz)) + 1
+    return [(start_hz + i * step_hz, dwell) for i in range(count)]
+
+def parse_hops(text):
+    """Разбор списка "частота:задержка,..." (частота в Гц, задержка в секундах)"""
+    hops = []
+    for item in text.split(','):
+        frequency, _, dwell = item.strip().partition(':')
+        hops.append((float(frequency), float(dwell or 1.0)))
+    return hops
+
+def main():
+    parser = argparse.ArgumentParser(description="Генератор NanoVNA")
+    parser.add_argument('--port', default='COM3')
+    parser.add_argument('--freq', type=float, default=1000000, help="частота, Гц")
+    parser.add_argument('--duration', type=float, help="время удержания частоты, с")
+    parser.add_argument('--hops', help="список частот: 'Гц:сек,Гц:сек,...'")
+    parser.add_argument('--sweep', type=float, nargs=4, metavar=('START', 'STOP', 'STEP', 'DWELL'),
+                        help="пошаговая перестройка, Гц и с")
+    parser.add_argument('--repeat', action='store_true', help="повторять список по кругу")
+    parser.add_argument('--keepalive', type=float, help="период повтора команды, с")
+    parser.add_argument('--unit-hz', type=int, default=1000, help="единица аргумента generator, Гц")
+    parser.add_argument('--simple', action='store_true', help="старый режим: запись каждые 80 мс")
+    args = parser.parse_args()
+
+    if args.simple:
+        ultra_simple_generator(args.port, int(args.freq))
+        return
+
+    ser = serial.Serial(args.port, 115200, timeout=0.1)
+    time.sleep(2)
+    generator = GeneratorController(ser, unit_hz=args.unit_hz, keepalive=args.keepalive)
+    try:
+        if args.hops or args.sweep:
+            hops = parse_hops(args.hops) if args.hops else sweep_hops(*args.sweep)
+            print(f"Список частот: {len(hops)} шагов, {sum(d for _, d in hops):.2f} с за проход")
+            generator.play(hops, repeat=args.repeat)
+        else:
+            actual = generator.actual_frequency(args.freq)
+            print(f"Генерация {actual/1e6:.6f} МГц")
+            if actual != args.freq:
+                print(f"Частота округлена до шага {args.unit_hz} Гц (запрошено {args.freq:.0f} Гц)")
+            generator.hold(args.freq, args.duration)
+    except KeyboardInterrupt:
+        print("\nОстановка")
+    finally:
+        generator.stop()
+        ser.close()
+        print(f"Команд отправлено: {generator.writes}")
+
 if __name__ == "__main__":
-    ultra_simple_generator('COM3', 1000000)
\ No newline at end of file
+    main()
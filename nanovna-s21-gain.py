@@ -1,113 +1,49 @@
-import serial
 import matplotlib.pyplot as plt
 import numpy as np
-import time
 
-def send_command(ser, command, wait_time=0.5):
+from nanovna_analysis import (analyze_two_port, calculate_return_loss, calculate_s21_db,
+                              calculate_vswr, find_notch)
+from nanovna_device import NanoVNA
+
+def send_command(vna, command, timeout=None):
+    """Команда с ожиданием приглашения ch>; ответ без эха, при сбое - исключение"""
     print(f"Отправка команды: {command}")
-    ser.write((command + '\r\n').encode())
-    time.sleep(wait_time)
-    
-    response = b''
-    start_time = time.time()
-    while time.time() - start_time < wait_time:
-        if ser.in_waiting > 0:
-            response += ser.read(ser.in_waiting)
-        time.sleep(0.01)
-    
-    return response.decode('ascii', errors='ignore')
+    return vna.send_command(command, timeout)
+
+# Диапазон измерения фильтра
+START_FREQ, STOP_FREQ, POINTS = 30e6, 250e6, 101
 
-def setup_nanovna(ser, cal_slot=0):
+def setup_nanovna(vna, cal_slot=0):
     print("Настройка NanoVNA...")
+    print(f"Отправка команды: cal load {cal_slot}")
+    vna.load_calibration(cal_slot)
     
-    commands = [
-        f"cal load {cal_slot}",
-        "sweep 30000000 250000000 101",
-        "pause",
-    ]
-    
-    for cmd in commands:
-        response = send_command(ser, cmd, 0.5)
-        if response:
-            response_clean = response.replace('ch>', '').strip()
-            if response_clean:
-                print(f"Ответ на {cmd}: {response_clean}")
-    
-    cal_status = send_command(ser, "cal", 0.5)
+    cal_status = send_command(vna, "cal")
     if cal_status:
         print(f"Статус калибровки: {cal_status}")
-    
-    time.sleep(1)
-
-def get_nanovna_data(ser):
-    print("Получение данных S21...")
-    send_command(ser, "resume", 2)
-    freq_data = send_command(ser, "frequencies", 1)
-    print(f"Получено данных частот: {len(freq_data)} байт")
-    s21_data = send_command(ser, "data 1", 1) 
-    print(f"Получено данных S21: {len(s21_data)} байт")
-    return freq_data, s21_data
 
-def parse_frequency_data(data):
-    frequencies = []
-    lines = data.strip().split('\n')
-    
-    for line in lines:
-        line = line.strip()
-        if line and not line.startswith('ch>'):
-            try:
-                parts = line.split()
-                for part in parts:
-                    freq = float(part)
-                    frequencies.append(freq)
-            except ValueError:
-                continue
-    
-    return frequencies
+def get_nanovna_data(vna):
+    """S11 и S21 одной командой scan - оба канала из одного прохода"""
+    print("Получение данных S11 и S21...")
+    sweep = vna.scan(START_FREQ, STOP_FREQ, POINTS, channels=(0, 1))
+    print(f"Получено точек: {sweep.points}")
+    return sweep
 
-def parse_s21_data(data):
-    """Парсинг данных S21 (комплексные числа)"""
-    s21_points = []
-    lines = data.strip().split('\n')
-    
-    for line in lines:
-        line = line.strip()
-        if line and not line.startswith('ch>'):
-            try:
-                # Данные S21 в формате: real imag
-                parts = line.split()
-                if len(parts) >= 2:
-                    real = float(parts[0])
-                    imag = float(parts[1])
-                    s21_points.append((real, imag))
-            except ValueError:
-                continue
-    
-    return s21_points
-
-def calculate_s21_db(s21_points):
-    s21_db = []
-    for real, imag in s21_points:
-        magnitude = np.sqrt(real**2 + imag**2)
-        if magnitude > 0:
-            db = 20 * np.log10(magnitude)
-        else:
-            db = -120  # Минимальное значение
-        s21_db.append(db)
-    return s21_db
-
-def plot_filter_response(frequencies, s21_db):
-    if not frequencies or not s21_db:
+def plot_filter_response(sweep):
+    if not sweep.points:
         print("Недостаточно данных для построения графика")
         return
     
-    min_len = min(len(frequencies), len(s21_db))
-    frequencies = frequencies[:min_len]
-    s21_db = s21_db[:min_len]
+    frequencies = sweep.frequencies
+    s21_db = calculate_s21_db(sweep.data1)
+    # Согласование по S11 того же прохода: возвратные потери и КСВ
+    return_loss = calculate_return_loss(sweep.data0)
+    vswr_values = calculate_vswr(sweep.data0)
     
     frequencies_mhz = [f / 1e6 for f in frequencies]
     
-    plt.figure(figsize=(12, 8))
+    plt.figure(figsize=(12, 12))
+    plt.subplot(2, 1, 1)
     plt.plot(frequencies_mhz, s21_db, 'b-', linewidth=2, label='S21 (Transmission)')
     
     plt.title('АЧХ режекторного FM фильтра\nNanoVNA-H4 (с калибровкой)', fontsize=14, fontweight='bold')
@@ -120,15 +56,15 @@ def plot_filter_response(frequencies, s21_db):
     plt.axvline(fm_start, color='red', linestyle='--', alpha=0.7)
     plt.axvline(fm_end, color='red', linestyle='--', alpha=0.7)
     
-    min_db_index = np.argmin(s21_db)
-    min_freq = frequencies_mhz[min_db_index]
-    min_db = s21_db[min_db_index]
+    # Провал уточняется между точками сетки
+    min_freq, min_db = find_notch(frequencies, s21_db)
+    min_freq /= 1e6
     
     plt.plot(min_freq, min_db, 'ro', markersize=8, 
              label=f'Подавление: {min_freq:.1f} МГц, {min_db:.1f} дБ')
     
     plt.xlim(min(frequencies_mhz), max(frequencies_mhz))
-    plt.ylim(min(s21_db) - 5, max(s21_db) + 5)
+    plt.ylim(min(min(s21_db), min_db) - 5, max(s21_db) + 5)
     
     plt.xticks(rotation=45)
     
@@ -142,6 +78,19 @@ def plot_filter_response(frequencies, s21_db):
     plt.gca().xaxis.set_major_formatter(FuncFormatter(format_freq))
     
     plt.legend(fontsize=10)
+    
+    ax_rl = plt.subplot(2, 1, 2)
+    ax_rl.plot(frequencies_mhz, return_loss, 'g-', linewidth=2, label='Возвратные потери (S11)')
+    ax_rl.set_xlabel('Частота (МГц)', fontsize=12)
+    ax_rl.set_ylabel('Возвратные потери (дБ)', fontsize=12)
+    ax_rl.set_xlim(min(frequencies_mhz), max(frequencies_mhz))
+    ax_rl.grid(True, alpha=0.3)
+    ax_vswr = ax_rl.twinx()
+    ax_vswr.plot(frequencies_mhz, np.minimum(vswr_values, 10), 'm--', linewidth=1, label='КСВ')
+    ax_vswr.set_ylabel('КСВ', fontsize=12)
+    ax_rl.legend(loc='upper left', fontsize=10)
+    ax_vswr.legend(loc='upper right', fontsize=10)
+    
     plt.tight_layout()
     plt.show()
     
@@ -151,37 +100,27 @@ def plot_filter_response(frequencies, s21_db):
     print(f"Глубина подавления: {min_db:.1f} дБ")
     print(f"FM диапазон: {fm_start} - {fm_end} МГц")
     
-    # Проверяем эффективность подавления в FM диапазоне
-    fm_indices = [i for i, f in enumerate(frequencies_mhz) if fm_start <= f <= fm_end]
-    if fm_indices:
-        fm_attenuation = [s21_db[i] for i in fm_indices]
-        avg_fm_attenuation = np.mean(fm_attenuation)
-        print(f"Среднее подавление в FM диапазоне: {avg_fm_attenuation:.1f} дБ")
+    # Подавление в FM диапазоне и согласование - общим анализом четырехполюсника
+    two_port = analyze_two_port(sweep, band=(fm_start * 1e6, fm_end * 1e6))
+    if two_port['band_avg_db'] is not None:
+        print(f"Среднее подавление в FM диапазоне: {two_port['band_avg_db']:.1f} дБ")
+    print(f"Вносимые потери: {two_port['insertion_loss_db']:.2f} дБ на "
+          f"{two_port['insertion_loss_freq']/1e6:.2f} МГц")
+    print(f"Возвратные потери: мин. {two_port['return_loss_min_db']:.1f} дБ, "
+          f"средн. {two_port['return_loss_avg_db']:.1f} дБ")
+    print(f"КСВ: макс. {two_port['vswr_max']:.2f}, средн. {two_port['vswr_avg']:.2f}")
 
 def main():
-    ser = None
+    vna = None
     try:
         print("Подключение к NanoVNA-H4 на COM3...")
+        vna = NanoVNA('COM3', timeout=2).open()
         
-        ser = serial.Serial(
-            port='COM3',
-            baudrate=115200,
-            timeout=2,
-            write_timeout=2,
-        )
-        time.sleep(2)
-        
-        setup_nanovna(ser, cal_slot=0)
-        freq_data, s21_data = get_nanovna_data(ser)
-        
-        frequencies = parse_frequency_data(freq_data)
-        s21_points = parse_s21_data(s21_data)
-        s21_db = calculate_s21_db(s21_points)
-        
-        print(f"\nОбработано {len(frequencies)} частот и {len(s21_points)} точек S21")
+        setup_nanovna(vna, cal_slot=0)
+        sweep = get_nanovna_data(vna)
         
-        if frequencies and s21_db:
-            plot_filter_response(frequencies, s21_db)
+        if sweep.points:
+            plot_filter_response(sweep)
         else:
             print("Не удалось получить данные для построения графика")
             
@@ -191,8 +130,8 @@ def main():
         traceback.print_exc()
         
     finally:
-        if ser and ser.is_open:
-            ser.close()
+        if vna:
+            vna.close()
             print("\nСоединение закрыто")
 
 if __name__ == "__main__":
@@ -1,25 +1,23 @@
 import serial
 import time
 
+from nanovna_device import NanoVNA, ProtocolError
+
 # Параметры соединения для Windows
 PORT = "COM3"       # Укажите ваш реальный порт NanoVNA
 BAUDRATE = 115200
 
-def send_command(ser, cmd):
-    """Отправка команды NanoVNA и чтение ответа"""
-    ser.write((cmd + '\r\n').encode('utf-8'))
-    time.sleep(0.1)
-    response = ser.read_all().decode('utf-8', errors='ignore')
-    return response.strip()
+def send_command(vna, cmd):
+    """Отправка команды NanoVNA и чтение ответа до приглашения ch> (без эха)"""
+    return vna.send_command(cmd)
 
 def main():
-    with serial.Serial(PORT, BAUDRATE, timeout=0.5) as ser:
+    with NanoVNA(PORT, BAUDRATE, settle_time=1.0) as vna:
         print(f"Подключение к NanoVNA-H4 через {PORT}...")
-        time.sleep(1.0)
 
         # Проверка связи
         print("Ответ на команду 'version':")
-        version_info = send_command(ser, 'version')
+        version_info = send_command(vna, 'version')
         print(version_info or "Нет ответа.")
 
         # Настройка диапазона сканирования
@@ -27,13 +25,13 @@ def main():
         stop_freq = 30000000    # 30 МГц
         points = 101
 
-        send_command(ser, f'sweep {start_freq} {stop_freq} {points}')
+        send_command(vna, f'sweep {start_freq} {stop_freq} {points}')
         print(f'Диапазон установлен: {start_freq/1e6:.1f}–{stop_freq/1e6:.1f} МГц, {points} точек')
 
         # Основной цикл опроса
         while True:
             # Чтение данных S11 (реальная и мнимая части)
-            response = send_command(ser, 'data 0')
+            response = send_command(vna, 'data 0')
             if response:
                 print("Данные S11 (первые 200 символов):")
                 print(response[:200] + '...')
@@ -48,3 +46,5 @@ if __name__ == "__main__":
         print("\nОпрос завершён пользователем.")
     except serial.SerialException as e:
         print(f"Ошибка порта {PORT}: {e}")
+    except ProtocolError as e:
+        print(f"Нет ответа NanoVNA на {PORT}: {e}")
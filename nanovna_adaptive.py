@@ -0,0 +1,157 @@
+"""
+Адаптивное сканирование: грубый проход, затем узкие проходы вокруг особенностей
+
+Грубое сканирование находит минимумы (резонансы КСВ по S11 или провалы S21),
+вокруг каждого выполняется узкое сканирование, и все проходы объединяются в
+один неравномерный результат, отсортированный по частоте. Точность по
+частоте определяется шагом узких проходов, а общее число точек и время
+измерения меньше, чем при равномерном плотном сканировании.
+
+Пример:
+  python nanovna_adaptive.py cable --port /dev/ttyACM0 --range 1e6 500e6
+  python nanovna_adaptive.py filter --port /dev/ttyACM0 --range 30e6 250e6 --cal-slot 0
+"""
+import argparse
+
+import numpy as np
+
+import nanovna_analysis
+from nanovna_device import NanoVNA
+from nanovna_sweep import Sweep
+from nanovna_trace import span
+
+
+def feature_values(sweep, channel):
+    """Величина, минимумы которой ищутся: КСВ для S11, дБ для S21"""
+    if channel == 0:
+        return nanovna_analysis.calculate_vswr(sweep['data0'])
+    return nanovna_analysis.calculate_s21_db(sweep['data1'])
+
+
+def select_features(frequencies, values, max_features=4, select='deepest', prominence=0.1):
+    """Индексы минимумов: 'first' - первые по частоте, 'deepest' - самые глубокие"""
+    n = min(len(frequencies), len(values))
+    values = np.asarray(values[:n], dtype=np.float64)
+    minima = nanovna_analysis.find_minima(values, prominence=prominence,
+                                          min_distance=max(1, n // 50))
+    if len(minima) == 0 and n:
+        minima = np.array([int(np.argmin(values))])
+    if select == 'deepest':
+        minima = minima[np.argsort(values[minima], kind='stable')]
+    return sorted(int(i) for i in minima[:max_features])
+
+
+def zoom_windows(frequencies, indices, width=1.0):
+    """
+    Диапазоны узких проходов: +-width шагов грубой сетки вокруг каждого
+    минимума; перекрывающиеся диапазоны объединяются
+    """
+    if len(frequencies) < 2:
+        return []
+    step = (frequencies[-1] - frequencies[0]) / (len(frequencies) - 1)
+    windows = []
+    for index in indices:
+        start = max(frequencies[0], frequencies[index] - width * step)
+        stop = min(frequencies[-1], frequencies[index] + width * step)
+        if windows and start <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], max(windows[-1][1], stop))
+        else:
+            windows.append((start, stop))
+    return windows
+
+
+def merge_sweeps(sweeps, channels):
+    """
+    Объединение проходов в один неравномерный Sweep по возрастанию частоты;
+    при совпадении частот остается точка более позднего (узкого) прохода.
+    Устройство, слот калибровки, время и план - от первого (грубого) прохода.
+    """
+    keys = ['frequencies'] + [f"data{channel}" for channel in channels]
+    parts = {key: [] for key in keys}
+    for sweep in sweeps:
+        n = min(len(sweep[key]) for key in keys)
+        for key in keys:
+            parts[key].append(sweep[key][:n])
+    merged = {key: np.concatenate(parts[key]) for key in keys}
+
+    # Порядок: по частоте, внутри одной частоты - последний проход первым
+    order = np.lexsort((-np.arange(len(merged['frequencies'])), merged['frequencies']))
+    frequencies = merged['frequencies'][order]
+    keep = np.ones(len(frequencies), dtype=bool)
+    keep[1:] = frequencies[1:] != frequencies[:-1]
+    merged = {key: value[order][keep] for key, value in merged.items()}
+    return Sweep(merged['frequencies'], merged.get('data0'), merged.get('data1'),
+                 **Sweep.from_dict(sweeps[0])._metadata())
+
+
+def adaptive_measure(vna, start, stop, coarse_points=51, zoom_points=21, cal_slot=None,
+                     channels=(0,), feature_channel=None, max_features=4, select='deepest',
+                     width=1.0, prominence=0.1, sweep_time=1.0):
+    """
+    Грубое сканирование coarse_points, затем до max_features узких проходов
+    по zoom_points точек. Результат - (Sweep, segments): объединенный Sweep
+    с метаданными грубого прохода и (start, stop, points) всех проходов.
+    """
+    if feature_channel is None:
+        feature_channel = channels[0] if channels else 0
+    channels = tuple(sorted(set(channels) | {feature_channel}))
+
+    with span('adaptive_coarse', points=coarse_points):
+        coarse = vna.measure(start, stop, coarse_points, cal_slot, channels, sweep_time)
+    segments = [(int(start), int(stop), int(coarse_points))]
+
+    frequencies = coarse['frequencies']
+    values = feature_values(coarse, feature_channel)
+    indices = select_features(frequencies, values, max_features, select, prominence)
+
+    sweeps = [coarse]
+    # Время прохода примерно пропорционально числу точек
+    zoom_time = sweep_time * zoom_points / coarse_points
+    for zoom_start, zoom_stop in zoom_windows(frequencies, indices, width):
+        with span('adaptive_zoom', start=zoom_start, stop=zoom_stop):
+            sweeps.append(vna.measure(zoom_start, zoom_stop, zoom_points, cal_slot,
+                                      channels, zoom_time))
+        segments.append((int(zoom_start), int(zoom_stop), int(zoom_points)))
+
+    return merge_sweeps(sweeps, channels), np.array(segments, dtype=np.int64)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Адаптивное сканирование NanoVNA")
+    parser.add_argument('analysis', choices=['cable', 'filter'])
+    parser.add_argument('--port', default='/dev/ttyACM0')
+    parser.add_argument('--range', type=float, nargs=2, metavar=('START', 'STOP'))
+    parser.add_argument('--coarse-points', type=int, default=51)
+    parser.add_argument('--zoom-points', type=int, default=21)
+    parser.add_argument('--max-features', type=int)
+    parser.add_argument('--cal-slot', type=int)
+    parser.add_argument('--vf', type=float, default=0.66)
+    parser.add_argument('--sweep-time', type=float, default=1.0)
+    args = parser.parse_args()
+
+    if args.analysis == 'cable':
+        # Для длины кабеля нужны первые резонансы по частоте
+        start, stop = args.range or (1e6, 500e6)
+        options = {'channels': (0,), 'select': 'first', 'max_features': args.max_features or 2}
+    else:
+        start, stop = args.range or (30e6, 250e6)
+        options = {'channels': (1,), 'select': 'deepest', 'max_features': args.max_features or 1}
+
+    with NanoVNA(args.port) as vna:
+        sweep, segments = adaptive_measure(vna, start, stop, args.coarse_points, args.zoom_points,
+                                 args.cal_slot, sweep_time=args.sweep_time, **options)
+
+    print(f"Проходов: {len(segments)}, точек всего: {sweep.points}")
+    for segment_start, segment_stop, points in segments:
+        print(f"  {segment_start/1e6:.3f} - {segment_stop/1e6:.3f} МГц, {points} точек")
+
+    if args.analysis == 'cable':
+        result = nanovna_analysis.analyze_cable(sweep['frequencies'], sweep['data0'], args.vf)
+    else:
+        result = nanovna_analysis.analyze_filter(sweep['frequencies'], sweep['data1'])
+    for key, value in result.items():
+        print(f"{key}: {value:.6g}" if isinstance(value, float) else f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+import numpy as np
+
+from nanovna_sweep import Sweep
+
+try:
+    from scipy.signal import find_peaks
+    SCIPY_AVAILABLE = True
+except ImportError:
+    # На Raspberry Pi scipy часто не установлен - используем поиск на numpy
+    SCIPY_AVAILABLE = False
+
+C = 3e8  # Скорость света м/с
+
+FM_BAND = (87.5e6, 108e6)
+
+
+def sweep_arrays(frequencies, s11=None, s21=None):
+    """
+    Аргументы функций анализа: массивы или Sweep вместо frequencies -
+    тогда незаданные S11 и S21 берутся из его data0 и data1
+    """
+    if not isinstance(frequencies, Sweep):
+        return frequencies, s11, s21
+    sweep = frequencies
+    return (sweep.frequencies, sweep.data0 if s11 is None else s11,
+            sweep.data1 if s21 is None else s21)
+
+
+def calculate_vswr(s11):
+    magnitude = np.abs(np.asarray(s11))
+    vswr = np.full(magnitude.shape, 100.0)  # Большое значение для плохого КСВ
+    ok = magnitude < 1
+    vswr[ok] = (1 + magnitude[ok]) / (1 - magnitude[ok])
+    return vswr
+
+
+def calculate_phase(s11):
+    return np.angle(np.asarray(s11))  # Фаза в радианах
+
+
+def calculate_s21_db(s21):
+    magnitude = np.abs(np.asarray(s21))
+    db = np.full(magnitude.shape, -120.0)  # Минимальное значение
+    ok = magnitude > 0
+    db[ok] = 20 * np.log10(magnitude[ok])
+    return db
+
+
+def calculate_return_loss(s11):
+    """Возвратные потери, дБ (положительные)"""
+    return -calculate_s21_db(s11)
+
+
+def find_peaks_simple(data, min_distance=5):
+    """Индексы точек, максимальных в окне +-min_distance (аналог версии для RPi)"""
+    data = np.asarray(data, dtype=np.float64)
+    if len(data) < 2 * min_distance + 1:
+        return np.array([], dtype=int)
+    windows = np.lib.stride_tricks.sliding_window_view(data, 2 * min_distance + 1)
+    centre = data[min_distance:len(data) - min_distance]
+    return np.nonzero(centre == windows.max(axis=1))[0] + min_distance
+
+
+def find_minima(values, prominence=0.1, min_distance=10):
+    """Поиск минимумов (резонансов/провалов); scipy при наличии, иначе numpy"""
+    inverse = -np.asarray(values, dtype=np.float64)
+    if SCIPY_AVAILABLE:
+        peaks, _ = find_peaks(inverse, prominence=prominence)
+        return peaks
+    return find_peaks_simple(inverse, min_distance=min_distance)
+
+
+def phase_slope(frequencies, phases):
+    """Наклон развернутой фазы S11, рад/Гц"""
+    return np.polyfit(frequencies, np.unwrap(phases), 1)[0]
+
+
+def electrical_length_from_slope(slope, vf=0.66):
+    return -slope * C / (4 * np.pi * vf)
+
+
+def refine_minimum(frequencies, values, index):
+    """
+    Уточнение минимума между точками сетки: вершина параболы через точку
+    index и двух соседей (сетка может быть неравномерной). values должны
+    быть гладкими около минимума - мощность |S|^2, а не КСВ или дБ.
+    Возвращает (частота, значение); на краю или без минимума - точку сетки.
+    """
+    index = int(index)
+    if index <= 0 or index >= len(values) - 1:
+        return float(frequencies[index]), float(values[index])
+    x0, x1, x2 = (float(f) for f in frequencies[index - 1:index + 2])
+    y0, y1, y2 = (float(v) for v in values[index - 1:index + 2])
+    # Отсчет от центральной точки - без потери точности на частотах ~1e8
+    a, b = x0 - x1, x2 - x1
+    denom = a * b * (a - b)
+    if denom == 0:
+        return x1, y1
+    curvature = (b * (y0 - y1) - a * (y2 - y1)) / denom
+    slope = (a * a * (y2 - y1) - b * b * (y0 - y1)) / denom
+    if curvature <= 0:
+        return x1, y1
+    offset = min(max(-slope / (2 * curvature), a), b)
+    return x1 + offset, y1 + slope * offset + curvature * offset * offset
+
+
+def vswr_to_power(vswr_values):
+    """|Г|^2 по КСВ - гладкая величина для уточнения резонансов"""
+    vswr_values = np.asarray(vswr_values, dtype=np.float64)
+    return ((vswr_values - 1) / (vswr_values + 1)) ** 2
+
+
+def resonance_spacing(frequencies, peaks, power=None):
+    """
+    Разность частот первых двух резонансов: (delta_f, freq1, freq2) или None.
+    С power (|Г|^2) частоты резонансов уточняются между точками сетки.
+    """
+    if len(peaks) < 2:
+        return None
+    if power is None:
+        freq1 = frequencies[peaks[0]]
+        freq2 = frequencies[peaks[1]]
+    else:
+        freq1 = refine_minimum(frequencies, power, peaks[0])[0]
+        freq2 = refine_minimum(frequencies, power, peaks[1])[0]
+    delta_f = abs(freq2 - freq1)
+    if delta_f == 0:
+        return None
+    return delta_f, freq1, freq2
+
+
+def find_cable_length(frequencies, phases, vswr_values, vf=0.66, prominence=0.1):
+    """
+    Определение длины кабеля по расстоянию между резонансами КСВ
+    Возвращает (длина, электрическая длина, delta_f, freq1, freq2)
+    """
+    frequencies = np.asarray(frequencies, dtype=np.float64)
+    phases = np.asarray(phases, dtype=np.float64)
+    if len(frequencies) < 10:
+        return None, None, None, None, None
+
+    # Фазовый метод: по наклону фазы
+    electrical_length = electrical_length_from_slope(phase_slope(frequencies, phases), vf)
+
+    spacing = resonance_spacing(frequencies, find_minima(vswr_values, prominence=prominence),
+                                vswr_to_power(vswr_values))
+    if spacing is None:
+        return None, electrical_length, None, None, None
+
+    delta_f, freq1, freq2 = spacing
+    cable_length = C / (2 * delta_f * vf)
+    return cable_length, electrical_length, delta_f, freq1, freq2
+
+
+def analyze_cable(frequencies, s11=None, vf=0.66, prominence=0.1):
+    """Длина кабеля и статистика КСВ по данным S11 (или по Sweep)"""
+    frequencies, s11, _ = sweep_arrays(frequencies, s11)
+    min_len = min(len(frequencies), len(s11))
+    frequencies, s11 = frequencies[:min_len], s11[:min_len]
+    vswr_values = calculate_vswr(s11)
+    phases = calculate_phase(s11)
+    cable_length, electrical_length, delta_f, freq1, freq2 = find_cable_length(
+        frequencies, phases, vswr_values, vf, prominence)
+    as_float = lambda v: None if v is None else float(v)
+    return {
+        'vf': vf,
+        'cable_length': as_float(cable_length),
+        'electrical_length': as_float(electrical_length),
+        'delta_f': as_float(delta_f),
+        'freq1': as_float(freq1),
+        'freq2': as_float(freq2),
+        'vswr_avg': float(np.mean(vswr_values)) if len(vswr_values) else None,
+        'vswr_min': float(np.min(vswr_values)) if len(vswr_values) else None,
+        'vswr_max': float(np.max(vswr_values)) if len(vswr_values) else None,
+    }
+
+
+def tdr(frequencies, s11=None, vf=0.66, nfft=None):
+    """
+    Рефлектометрия по S11 (полосовой режим): модуль обратного БПФ с окном
+    Кайзера. Возвращает расстояние (м) и отражение на этом расстоянии;
+    неравномерная сетка (адаптивное сканирование) интерполируется.
+    """
+    frequencies, s11, _ = sweep_arrays(frequencies, s11)
+    frequencies = np.asarray(frequencies, dtype=np.float64)
+    n = min(len(frequencies), len(s11))
+    if n < 2:
+        return np.zeros(0), np.zeros(0)
+    frequencies, s11 = frequencies[:n], np.asarray(s11[:n], dtype=np.complex128)
+    df = (frequencies[-1] - frequencies[0]) / (n - 1)
+    if not np.allclose(np.diff(frequencies), df, rtol=1e-3):
+        uniform = frequencies[0] + df * np.arange(n)
+        s11 = np.interp(uniform, frequencies, s11.real) + 1j * np.interp(uniform, frequencies, s11.imag)
+    if nfft is None:
+        # Дополнение нулями - более гладкая кривая по расстоянию
+        nfft = 4 * 2 ** int(np.ceil(np.log2(n)))
+    window = np.kaiser(n, 6)
+    response = np.abs(np.fft.ifft(s11 * window, nfft)) * nfft / np.sum(window)
+    distance = np.arange(nfft) / (nfft * df) * C * vf / 2
+    return distance[:nfft // 2], response[:nfft // 2]
+
+
+def find_notch(frequencies, s21_db):
+    """Частота и глубина провала S21 с уточнением между точками сетки"""
+    s21_db = np.asarray(s21_db, dtype=np.float64)
+    index = int(np.argmin(s21_db))
+    power = 10 ** (s21_db / 10)
+    freq, value = refine_minimum(frequencies, power, index)
+    return freq, float(10 * np.log10(max(value, 1e-12)))
+
+
+def analyze_filter(frequencies, s21=None, band=FM_BAND):
+    """Точка и глубина подавления, среднее подавление в полосе (по умолчанию FM)"""
+    frequencies, _, s21 = sweep_arrays(frequencies, s21=s21)
+    frequencies = np.asarray(frequencies, dtype=np.float64)
+    s21_db = calculate_s21_db(s21)
+    min_len = min(len(frequencies), len(s21_db))
+    if min_len == 0:
+        return {'notch_freq': None, 'notch_db': None, 'band_avg_db': None}
+    frequencies = frequencies[:min_len]
+    s21_db = s21_db[:min_len]
+
+    notch_freq, notch_db = find_notch(frequencies, s21_db)
+    in_band = (frequencies >= band[0]) & (frequencies <= band[1])
+    return {
+        'notch_freq': notch_freq,
+        'notch_db': notch_db,
+        'band_avg_db': float(np.mean(s21_db[in_band])) if in_band.any() else None,
+    }
+
+
+def analyze_two_port(frequencies, s11=None, s21=None, band=FM_BAND):
+    """
+    Согласование и передача четырехполюсника по S11 и S21 одного прохода
+    (или по Sweep): провал и подавление в полосе, вносимые потери,
+    возвратные потери и КСВ
+    """
+    frequencies, s11, s21 = sweep_arrays(frequencies, s11, s21)
+    frequencies = np.asarray(frequencies, dtype=np.float64)
+    min_len = min(len(frequencies), len(s11), len(s21))
+    result = analyze_filter(frequencies[:min_len], s21[:min_len], band)
+    if min_len == 0:
+        result.update({'insertion_loss_db': None, 'insertion_loss_freq': None,
+                       'return_loss_min_db': None, 'return_loss_avg_db': None,
+                       'vswr_max': None, 'vswr_avg': None})
+        return result
+
+    s21_db = calculate_s21_db(s21[:min_len])
+    return_loss = calculate_return_loss(s11[:min_len])
+    vswr_values = calculate_vswr(s11[:min_len])
+    best = int(np.argmax(s21_db))
+    result.update({
+        'insertion_loss_db': float(-s21_db[best]),
+        'insertion_loss_freq': float(frequencies[best]),
+        'return_loss_min_db': float(np.min(return_loss)),
+        'return_loss_avg_db': float(np.mean(return_loss)),
+        'vswr_max': float(np.max(vswr_values)),
+        'vswr_avg': float(np.mean(vswr_values)),
+    })
+    return result
@@ -0,0 +1,195 @@
+"""
+Пакетный пересчет архива файлов результатов
+
+Читает cable_results_*.txt (CableAnalyzer.save_results), filter_response_*.txt
+(save_filter_response) и текстовые результаты заданий nanovna_jobs, пересчитывает
+метрики текущим кодом nanovna_analysis и сводит их в одну таблицу: строка на
+файл, столбец на метрику. Файлы раздаются пулу процессов, таблица данных
+каждого файла разбирается одним вызовом np.loadtxt.
+
+Пример:
+  python nanovna_batch.py /home/frolov archive/2023 --output summary.tsv
+  python nanovna_batch.py "results/cable_results_*.txt" --vf 0.85 --output cable.npz
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+import nanovna_analysis
+
+FILE_PATTERNS = ('cable_results_*.txt', 'filter_response_*.txt', '*_results_*.txt')
+
+# Заголовки таблиц данных в разных форматах
+DATA_MARKERS = ('Частота(МГц)', 'Частота (МГц)')
+
+
+def find_files(paths, patterns=FILE_PATTERNS):
+    """Файлы по путям: каталоги просматриваются рекурсивно, маски раскрываются"""
+    files = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for pattern in patterns:
+                files.update(glob.glob(os.path.join(path, '**', pattern), recursive=True))
+        else:
+            files.update(glob.glob(path) or [path])
+    return sorted(files)
+
+
+def file_time(path, header_lines):
+    """Время измерения: из строки "Время:" или из метки в имени файла"""
+    for line in header_lines:
+        if line.startswith('Время:'):
+            try:
+                return datetime.strptime(line.split(':', 1)[1].strip(), '%Y-%m-%d %H:%M:%S')
+            except ValueError:
+                break
+    match = re.search(r'(\d{8}_\d{6})', os.path.basename(path))
+    if match:
+        try:
+            return datetime.strptime(match.group(1), '%Y%m%d_%H%M%S')
+        except ValueError:
+            pass
+    return datetime.fromtimestamp(os.path.getmtime(path))
+
+
+def parse_result_file(path):
+    """
+    Разбор файла результатов в словарь сканирования (frequencies, data0, data1).
+    S21 и возвратные потери в дБ восстанавливаются как модуль без фазы.
+    """
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        lines = f.read().splitlines()
+    start = next((i for i, line in enumerate(lines) if line.startswith(DATA_MARKERS)), None)
+    if start is None:
+        raise ValueError("Нет таблицы данных")
+
+    columns = [name.strip() for name in lines[start].split('\t')]
+    body = '\n'.join(line for line in lines[start + 1:] if line.strip())
+    table = np.loadtxt(io.StringIO(body), delimiter='\t', ndmin=2)
+    if table.shape[0] == 0 or table.shape[1] != len(columns):
+        raise ValueError("Пустая или неполная таблица данных")
+    column = {name: table[:, i] for i, name in enumerate(columns)}
+
+    sweep = {'frequencies': table[:, 0] * 1e6, 'time': file_time(path, lines[:start])}
+    if 'Real' in column:
+        sweep['data0'] = column['Real'] + 1j * column['Imag']
+    for channel in (0, 1):
+        if f"Real{channel}" in column:
+            sweep[f"data{channel}"] = column[f"Real{channel}"] + 1j * column[f"Imag{channel}"]
+    if 'S21 (дБ)' in column:
+        sweep['data1'] = 10 ** (column['S21 (дБ)'] / 20)
+    if 'RL (дБ)' in column and 'data0' not in sweep:
+        sweep['data0'] = 10 ** (-column['RL (дБ)'] / 20)
+    return sweep
+
+
+def process_file(path, vf=0.66, band=nanovna_analysis.FM_BAND):
+    """Пересчет метрик одного файла; ошибки возвращаются в строке результата"""
+    row = {'path': path}
+    try:
+        sweep = parse_result_file(path)
+    except (OSError, ValueError) as e:
+        row['error'] = str(e)
+        return row
+
+    # Сбой анализа одного файла (вырожденные данные) не должен останавливать пакет
+    try:
+        frequencies = sweep['frequencies']
+        row.update({'time': sweep['time'].isoformat(), 'points': len(frequencies),
+                    'start_hz': float(frequencies[0]), 'stop_hz': float(frequencies[-1])})
+        data0, data1 = sweep.get('data0'), sweep.get('data1')
+        # Длина кабеля - только по комплексному S11 (нужна фаза)
+        if data0 is not None and np.iscomplexobj(data0):
+            cable = nanovna_analysis.analyze_cable(frequencies, data0, vf)
+            row.update({key: value for key, value in cable.items()})
+        if data1 is not None:
+            if data0 is not None:
+                row.update(nanovna_analysis.analyze_two_port(frequencies, data0, data1, band))
+            else:
+                row.update(nanovna_analysis.analyze_filter(frequencies, data1, band))
+    except Exception as e:
+        row['error'] = f"ошибка анализа: {type(e).__name__}: {e}"
+    return row
+
+
+def _process_chunk(paths, vf, band):
+    return [process_file(path, vf, band) for path in paths]
+
+
+def reprocess(files, vf=0.66, band=nanovna_analysis.FM_BAND, workers=None, chunk_size=32):
+    """Пересчет списка файлов в пуле процессов; строки в порядке files"""
+    chunks = [files[i:i + chunk_size] for i in range(0, len(files), chunk_size)]
+    if len(chunks) <= 1 or workers == 1:
+        return [row for chunk in chunks for row in _process_chunk(chunk, vf, band)]
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk_rows in pool.map(_process_chunk, chunks, [vf] * len(chunks), [band] * len(chunks)):
+            rows.extend(chunk_rows)
+    return rows
+
+
+def to_columns(rows):
+    """Строки -> столбцы: {метрика: список значений}, отсутствующие - None"""
+    names = []
+    for row in rows:
+        names.extend(name for name in row if name not in names)
+    return {name: [row.get(name) for row in rows] for name in names}
+
+
+def write_columns(path, columns):
+    if path.endswith('.npz'):
+        arrays = {}
+        for name, values in columns.items():
+            if all(v is None or isinstance(v, (int, float)) for v in values):
+                arrays[name] = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+            else:
+                arrays[name] = np.array(['' if v is None else str(v) for v in values])
+        np.savez(path, **arrays)
+    elif path.endswith('.json'):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(columns, f, ensure_ascii=False, indent=2)
+    else:
+        names = list(columns)
+        count = len(next(iter(columns.values()), []))
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\t'.join(names) + '\n')
+            for i in range(count):
+                values = (columns[name][i] for name in names)
+                f.write('\t'.join('' if v is None else f"{v:.6g}" if isinstance(v, float) else str(v)
+                                  for v in values) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пересчет архива результатов NanoVNA")
+    parser.add_argument('paths', nargs='+', help="файлы, маски или каталоги")
+    parser.add_argument('--output', default='batch_summary.tsv', help=".tsv, .json или .npz")
+    parser.add_argument('--vf', type=float, default=0.66)
+    parser.add_argument('--band', type=float, nargs=2, default=nanovna_analysis.FM_BAND)
+    parser.add_argument('--workers', type=int, help="число процессов (по умолчанию - по числу ядер)")
+    args = parser.parse_args()
+
+    files = find_files(args.paths)
+    if not files:
+        print("Файлы результатов не найдены")
+        return
+    print(f"Файлов: {len(files)}")
+    started = time.monotonic()
+    rows = reprocess(files, args.vf, tuple(args.band), args.workers)
+    errors = [row for row in rows if 'error' in row]
+    write_columns(args.output, to_columns(rows))
+    print(f"Обработано за {time.monotonic() - started:.1f} с, ошибок: {len(errors)}")
+    for row in errors[:10]:
+        print(f"  {row['path']}: {row['error']}")
+    print(f"Сводная таблица: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+Кэш сырых сканирований и повторный анализ без обращения к прибору
+
+Сканирования хранятся в .npz по ключу устройство/диапазон_слот/время.
+Reanalyzer пересчитывает длину кабеля, статистику КСВ и параметры фильтра
+с другими параметрами (VF, prominence, полоса), запоминая промежуточные
+результаты: массивы, КСВ, развернутую фазу, найденные резонансы.
+
+Пример:
+  python nanovna_cache.py list
+  python nanovna_cache.py cable --vf 0.66 0.70 0.85
+  python nanovna_cache.py filter --band 87.5e6 108e6
+"""
+import argparse
+import glob
+import json
+import os
+import re
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+
+import nanovna_analysis
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'nanovna', 'sweeps')
+
+ANY = object()  # Фильтр "любое значение" для entries()
+
+
+def _safe(name):
+    return re.sub(r'[^A-Za-z0-9._-]', '_', str(name)).strip('_') or 'device'
+
+
+class _LRU(OrderedDict):
+    def __init__(self, size):
+        super().__init__()
+        self.size = size
+
+    def get_or_compute(self, key, compute):
+        if key in self:
+            self.move_to_end(key)
+            return self[key]
+        value = self[key] = compute()
+        if len(self) > self.size:
+            self.popitem(last=False)
+        return value
+
+
+class SweepCache:
+    """Хранилище сырых сканирований на диске"""
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, memo_size=64):
+        self.root = root
+        self._loaded = _LRU(memo_size)
+
+    def store(self, device, sweep, cal_slot, data, timestamp=None):
+        """Сохранение сканирования; data - словарь массивов (frequencies, data0, data1)"""
+        start, stop, points = (int(v) for v in sweep)
+        timestamp = timestamp or datetime.now()
+        slot = 'none' if cal_slot is None else cal_slot
+        key = "/".join([_safe(device), f"{start}_{stop}_{points}_cal{slot}",
+                        timestamp.strftime("%Y%m%d_%H%M%S_%f") + ".npz"])
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        meta = {'device': str(device), 'sweep': [start, stop, points], 'cal_slot': cal_slot,
+                'timestamp': timestamp.isoformat()}
+        arrays = {name: np.asarray(value) for name, value in data.items()
+                  if isinstance(value, np.ndarray)}
+        np.savez(path, meta=np.array(json.dumps(meta)), **arrays)
+        return key
+
+    def entries(self, device=None, sweep=None, cal_slot=ANY, since=None):
+        """Список сохраненных сканирований (без чтения массивов), по времени"""
+        pattern = os.path.join(self.root, _safe(device) if device else '*', '*', '*.npz')
+        result = []
+        for path in glob.glob(pattern):
+            key = os.path.relpath(path, self.root).replace(os.sep, '/')
+            device_name, plan, name = key.split('/')
+            match = re.match(r'(\d+)_(\d+)_(\d+)_cal(\w+)$', plan)
+            if not match:
+                continue
+            entry_sweep = tuple(int(v) for v in match.groups()[:3])
+            slot = match.group(4)
+            entry_slot = None if slot == 'none' else int(slot)
+            timestamp = datetime.strptime(name[:-4], "%Y%m%d_%H%M%S_%f")
+
+            if sweep is not None and entry_sweep != tuple(int(v) for v in sweep):
+                continue
+            if cal_slot is not ANY and entry_slot != cal_slot:
+                continue
+            if since is not None and timestamp < since:
+                continue
+            result.append({'key': key, 'device': device_name, 'sweep': entry_sweep,
+                           'cal_slot': entry_slot, 'timestamp': timestamp})
+        result.sort(key=lambda e: e['timestamp'])
+        return result
+
+    def latest(self, **filters):
+        entries = self.entries(**filters)
+        return entries[-1]['key'] if entries else None
+
+    def load(self, key):
+        """Массивы сканирования; недавно прочитанные берутся из памяти"""
+        def read():
+            with np.load(os.path.join(self.root, key)) as f:
+                data = {name: f[name] for name in f.files if name != 'meta'}
+                data['meta'] = json.loads(str(f['meta']))
+            return data
+        return self._loaded.get_or_compute(key, read)
+
+
+class Reanalyzer:
+    """Анализ сканирований из кэша с запоминанием промежуточных результатов"""
+
+    def __init__(self, cache, memo_size=256):
+        self.cache = cache
+        self._memo = _LRU(memo_size)
+
+    def _get(self, name, key, compute, *params):
+        return self._memo.get_or_compute((name, key) + params, compute)
+
+    def sweep(self, key):
+        return self.cache.load(key)
+
+    def frequencies(self, key):
+        return self.sweep(key)['frequencies']
+
+    def channel(self, key, channel):
+        """Данные канала, обрезанные до длины массива частот"""
+        def compute():
+            sweep = self.sweep(key)
+            if f"data{channel}" not in sweep:
+                raise ValueError(f"В сканировании {key} нет данных канала {channel}")
+            data = sweep[f"data{channel}"]
+            return data[:min(len(data), len(self.frequencies(key)))]
+        return self._get('channel', key, compute, channel)
+
+    def vswr(self, key):
+        return self._get('vswr', key, lambda: nanovna_analysis.calculate_vswr(self.channel(key, 0)))
+
+    def unwrapped_phase(self, key):
+        return self._get('phase', key,
+                         lambda: np.unwrap(nanovna_analysis.calculate_phase(self.channel(key, 0))))
+
+    def phase_slope(self, key):
+        def compute():
+            n = len(self.channel(key, 0))
+            return np.polyfit(self.frequencies(key)[:n], self.unwrapped_phase(key), 1)[0]
+        return self._get('phase_slope', key, compute)
+
+    def resonances(self, key, prominence=0.1):
+        return self._get('resonances', key,
+                         lambda: nanovna_analysis.find_minima(self.vswr(key), prominence=prominence),
+                         prominence)
+
+    def s21_db(self, key):
+        return self._get('s21_db', key, lambda: nanovna_analysis.calculate_s21_db(self.channel(key, 1)))
+
+    def cable(self, key, vf=0.66, prominence=0.1):
+        """Длина кабеля для заданного VF; резонансы и фаза считаются один раз"""
+        vswr = self.vswr(key)
+        frequencies = self.frequencies(key)[:len(vswr)]
+        electrical_length = nanovna_analysis.electrical_length_from_slope(self.phase_slope(key), vf)
+        # Резонансы уточняются по мощности отражения - так же, как в analyze_cable
+        spacing = nanovna_analysis.resonance_spacing(frequencies, self.resonances(key, prominence),
+                                                     nanovna_analysis.vswr_to_power(vswr))
+        result = {'vf': vf, 'cable_length': None, 'electrical_length': float(electrical_length),
+                  'delta_f': None, 'freq1': None, 'freq2': None}
+        if spacing is not None:
+            delta_f, freq1, freq2 = spacing
+            result.update(cable_length=float(nanovna_analysis.C / (2 * delta_f * vf)),
+                          delta_f=float(delta_f), freq1=float(freq1), freq2=float(freq2))
+        result.update(self.vswr_stats(key))
+        return result
+
+    def vswr_stats(self, key, band=None):
+        vswr = self.vswr(key)
+        if band is not None:
+            frequencies = self.frequencies(key)[:len(vswr)]
+            vswr = vswr[(frequencies >= band[0]) & (frequencies <= band[1])]
+        if not len(vswr):
+            return {'vswr_avg': None, 'vswr_min': None, 'vswr_max': None}
+        return {'vswr_avg': float(np.mean(vswr)), 'vswr_min': float(np.min(vswr)),
+                'vswr_max': float(np.max(vswr))}
+
+    def filter(self, key, band=nanovna_analysis.FM_BAND):
+        """Как analyze_filter, но по уже посчитанному S21 (дБ)"""
+        s21_db = self.s21_db(key)
+        frequencies = self.frequencies(key)[:len(s21_db)]
+        if not len(s21_db):
+            return {'notch_freq': None, 'notch_db': None, 'band_avg_db': None}
+        notch_freq, notch_db = nanovna_analysis.find_notch(frequencies, s21_db)
+        in_band = (frequencies >= band[0]) & (frequencies <= band[1])
+        return {
+            'notch_freq': float(notch_freq),
+            'notch_db': notch_db,
+            'band_avg_db': float(np.mean(s21_db[in_band])) if in_band.any() else None,
+        }
+
+
+def report(analyzer, key, args):
+    if args.command == 'cable':
+        for vf in args.vf:
+            result = analyzer.cable(key, vf, args.prominence)
+            length = result['cable_length']
+            print(f"  VF={vf}: " + (f"{length:.3f} м" if length else "резонансы не найдены"))
+    elif args.command == 'filter':
+        result = analyzer.filter(key, tuple(args.band or nanovna_analysis.FM_BAND))
+        if result['notch_freq'] is None:
+            print("  нет данных S21")
+            return
+        print(f"  Точка подавления: {result['notch_freq']/1e6:.2f} МГц, {result['notch_db']:.1f} дБ")
+        if result['band_avg_db'] is not None:
+            print(f"  Среднее подавление в полосе: {result['band_avg_db']:.1f} дБ")
+    else:
+        result = analyzer.vswr_stats(key, tuple(args.band) if args.band else None)
+        print(f"  КСВ: средний {result['vswr_avg']}, мин {result['vswr_min']}, макс {result['vswr_max']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Повторный анализ сканирований из кэша")
+    parser.add_argument('command', choices=['list', 'cable', 'filter', 'vswr'])
+    parser.add_argument('--cache', default=DEFAULT_CACHE_DIR, help="каталог кэша")
+    parser.add_argument('--device', help="устройство (порт)")
+    parser.add_argument('--key', action='append', help="ключ сканирования (по умолчанию последнее)")
+    parser.add_argument('--all', action='store_true', help="все подходящие сканирования")
+    parser.add_argument('--vf', type=float, nargs='+', default=[0.66])
+    parser.add_argument('--prominence', type=float, default=0.1)
+    parser.add_argument('--band', type=float, nargs=2, help="полоса, Гц (для filter по умолчанию FM)")
+    args = parser.parse_args()
+
+    cache = SweepCache(args.cache)
+    entries = cache.entries(device=args.device)
+    if args.command == 'list':
+        for entry in entries:
+            print(f"{entry['key']}  {entry['sweep'][0]/1e6:.1f}-{entry['sweep'][1]/1e6:.1f} МГц, "
+                  f"{entry['sweep'][2]} точек, слот {entry['cal_slot']}")
+        print(f"Всего сканирований: {len(entries)}")
+        return
+
+    keys = args.key or ([e['key'] for e in entries] if args.all else [e['key'] for e in entries[-1:]])
+    if not keys:
+        print("Нет сохраненных сканирований")
+        return
+
+    analyzer = Reanalyzer(cache)
+    for key in keys:
+        print(f"\n{key}")
+        try:
+            report(analyzer, key, args)
+        except ValueError as e:
+            print(f"  {e}")
+
+
+if __name__ == "__main__":
+    main()
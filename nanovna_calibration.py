@@ -0,0 +1,251 @@
+"""
+Калибровка NanoVNA с проверкой стандартов и оценкой качества
+
+Каждый шаг ждет приглашения ch> (а не фиксированную паузу), после
+подключения стандарта выполняется быстрое сканирование и сравнение с
+ожидаемым отражением (OPEN ~ +1, SHORT ~ -1, LOAD ~ 0, THRU |S21| ~ 1).
+Метрики качества (направленность, согласование источника, отслеживание
+отражения, остаточная ошибка THRU) сохраняются вместе со слотом.
+
+Несколько частотных планов калибруются за одно подключение стандарта:
+первый план - калибровка прибора с сохранением в слот, для остальных
+сырые измерения стандартов сохраняются как калибровка на стороне ПК
+(трехчленная модель ошибок порта 1 и нормировка THRU).
+"""
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+
+STANDARDS = ('open', 'short', 'load', 'thru')
+
+PROMPTS = {
+    'open': "Подключите OPEN (открытый порт PORT1) и нажмите Enter...",
+    'short': "Подключите SHORT (замыкание на PORT1) и нажмите Enter...",
+    'load': "Подключите LOAD (50Ω) к PORT1 и нажмите Enter...",
+    'thru': "Соедините PORT1 и PORT2 (THRU) и нажмите Enter...",
+}
+
+DEFAULT_STORE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'nanovna', 'calibration')
+
+
+def db(value):
+    return 20 * np.log10(np.maximum(np.abs(value), 1e-12))
+
+
+def verify_standard(standard, sweep, measured=None):
+    """
+    Сравнение сырого измерения стандарта с ожидаемым отражением.
+    measured - уже измеренные стандарты (для сравнения фазы OPEN и SHORT).
+    """
+    s11 = sweep['data0']
+    if standard == 'thru':
+        magnitude = float(np.mean(np.abs(sweep['data1'])))
+        ok = magnitude > 0.5
+        return {'ok': ok, 'metric': 's21_mag', 'value': magnitude,
+                'message': "" if ok else f"|S21| = {magnitude:.2f}, ожидалось около 1 - THRU не подключен?"}
+
+    magnitude = float(np.mean(np.abs(s11)))
+    if standard == 'load':
+        ok = magnitude < 0.35
+        return {'ok': ok, 'metric': 's11_mag', 'value': magnitude,
+                'message': "" if ok else f"|S11| = {magnitude:.2f}, ожидалось около 0 - LOAD не подключен?"}
+
+    ok = magnitude > 0.6
+    message = "" if ok else f"|S11| = {magnitude:.2f}, ожидалось около 1"
+    if ok and standard == 'short' and measured and 'open' in measured:
+        # SHORT должен отличаться от OPEN по фазе примерно на 180°
+        n = min(len(s11), len(measured['open']['data0']))
+        difference = np.abs(np.angle(s11[:n] / measured['open']['data0'][:n], deg=True))
+        median = float(np.median(difference))
+        if median < 120:
+            ok = False
+            message = f"Разность фаз с OPEN {median:.0f}°, ожидалось около 180° - подключен OPEN?"
+    return {'ok': ok, 'metric': 's11_mag', 'value': magnitude, 'message': message}
+
+
+def solve_error_terms(measured):
+    """
+    Трехчленная модель ошибок порта 1 по идеальным OPEN/SHORT/LOAD
+    и нормировка передачи по THRU
+    """
+    mo = measured['open']['data0']
+    ms = measured['short']['data0']
+    ml = measured['load']['data0']
+    n = min(len(mo), len(ms), len(ml))
+    mo, ms, ml = mo[:n], ms[:n], ml[:n]
+
+    a = mo - ml
+    b = ms - ml
+    terms = {
+        'frequencies': measured['open']['frequencies'][:n],
+        'e00': ml,                        # направленность
+        'e11': (a + b) / (a - b),         # согласование источника
+        'e10e01': -2 * a * b / (a - b),   # отслеживание отражения
+    }
+    if 'thru' in measured:
+        terms['et'] = measured['thru']['data1'][:n]  # отслеживание передачи
+    return terms
+
+
+def apply_error_terms(terms, s11=None, s21=None):
+    """Коррекция сырых S11/S21 калибровкой на стороне ПК"""
+    result = {}
+    if s11 is not None:
+        m = s11[:len(terms['e00'])] - terms['e00'][:len(s11)]
+        result['s11'] = m / (terms['e10e01'][:len(m)] + terms['e11'][:len(m)] * m)
+    if s21 is not None and 'et' in terms:
+        n = min(len(s21), len(terms['et']))
+        result['s21'] = s21[:n] / terms['et'][:n]
+    return result
+
+
+def quality_metrics(terms):
+    """Метрики качества по членам ошибок, дБ (худшее значение по диапазону)"""
+    metrics = {
+        'directivity_db': float(np.max(db(terms['e00']))),
+        'source_match_db': float(np.max(db(terms['e11']))),
+        'reflection_tracking_db': [float(np.min(db(terms['e10e01']))),
+                                   float(np.max(db(terms['e10e01'])))],
+    }
+    if 'et' in terms:
+        metrics['transmission_tracking_db'] = [float(np.min(db(terms['et']))),
+                                               float(np.max(db(terms['et'])))]
+    return metrics
+
+
+def load_error_terms(path):
+    with np.load(path) as f:
+        return {name: f[name] for name in f.files}
+
+
+class CalibrationEngine:
+    """
+    plans - список (start, stop, points); первый калибруется в приборе и
+    сохраняется в слот, остальные - на стороне ПК. None - текущий диапазон прибора.
+    """
+
+    def __init__(self, vna, plans=None, slot=0, prompt=input, step_timeout=15,
+                 sweep_time=1.0, store_dir=DEFAULT_STORE_DIR, max_retries=2):
+        self.vna = vna
+        self.plans = [tuple(int(v) for v in plan) for plan in plans] if plans else [None]
+        self.slot = slot
+        self.prompt = prompt
+        self.step_timeout = step_timeout
+        self.sweep_time = sweep_time
+        self.store_dir = store_dir
+        self.max_retries = max_retries
+        self.measured = [{} for _ in self.plans]
+        self.checks = {}
+
+    def command(self, command):
+        """Команда калибровки с ожиданием приглашения ch> (до step_timeout, без повторов)"""
+        return self.vna.send_command(command, self.step_timeout, retries=0)
+
+    def _capture(self, plan):
+        if plan is not None:
+            self.vna.set_sweep(*plan)
+        return self.vna.capture((0, 1), self.sweep_time)
+
+    def measure_standard(self, standard):
+        """Сырые измерения стандарта на всех планах за одно подключение"""
+        for attempt in range(self.max_retries + 1):
+            sweeps = [self._capture(plan) for plan in self.plans]
+            check = verify_standard(standard, sweeps[0], self.measured[0])
+            if check['ok'] or attempt == self.max_retries:
+                break
+            print(f"Проверка {standard.upper()}: {check['message']}")
+            self.prompt(f"Проверьте подключение {standard.upper()} и нажмите Enter...")
+
+        if not check['ok']:
+            print(f"Внимание: {standard.upper()} не прошел проверку: {check['message']}")
+        self.checks[standard] = check
+        for measured, sweep in zip(self.measured, sweeps):
+            measured[standard] = sweep
+
+    def run(self):
+        print("\nНачало процедуры калибровки NanoVNA-H4")
+        primary = self.plans[0]
+        if primary is not None:
+            self.vna.set_sweep(*primary)
+            print(f"Диапазон: {primary[0]/1e6:.3f} – {primary[1]/1e6:.1f} МГц, {primary[2]} точек")
+        if len(self.plans) > 1:
+            print(f"Дополнительных планов (калибровка на ПК): {len(self.plans) - 1}")
+
+        print("Сброс текущей калибровки")
+        self.command("cal reset")
+        self.vna.cal_slot = None
+
+        for standard in STANDARDS:
+            self.prompt(PROMPTS[standard])
+            self.measure_standard(standard)
+            if primary is not None:
+                self.vna.set_sweep(*primary)
+            self.command(f"cal {standard}")
+            print(f"{standard.upper()}: принят")
+
+        print("\nЗавершение и расчёт калибровки")
+        self.command("cal done")
+        print(f"Сохранение в слот {self.slot}")
+        self.command(f"save {self.slot}")
+        self.vna.cal_slot = self.slot
+
+        residual = self.verify_thru()
+        report = self.save(residual)
+        print(f"\nКалибровка выполнена и сохранена (слот {self.slot})")
+        self.print_report(report)
+        return report
+
+    def verify_thru(self):
+        """Остаточная ошибка после калибровки: THRU еще подключен"""
+        sweep = self._capture(self.plans[0])
+        s21_db = db(sweep['data1'])
+        s11_db = db(sweep['data0'])
+        return {
+            's21_max_error_db': float(np.max(np.abs(s21_db))) if len(s21_db) else None,
+            's11_thru_max_db': float(np.max(s11_db)) if len(s11_db) else None,
+        }
+
+    def save(self, residual):
+        os.makedirs(self.store_dir, exist_ok=True)
+        report = {
+            'slot': self.slot,
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'checks': self.checks,
+            'residual': residual,
+            'plans': [],
+        }
+        for i, (plan, measured) in enumerate(zip(self.plans, self.measured)):
+            terms = solve_error_terms(measured)
+            entry = {'plan': list(plan) if plan else None, 'device': i == 0,
+                     'quality': quality_metrics(terms)}
+            if i > 0:
+                name = f"slot{self.slot}_{plan[0]}_{plan[1]}_{plan[2]}.npz"
+                np.savez(os.path.join(self.store_dir, name), **terms)
+                entry['terms_file'] = name
+            report['plans'].append(entry)
+
+        path = os.path.join(self.store_dir, f"slot{self.slot}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        report['path'] = path
+        return report
+
+    @staticmethod
+    def print_report(report):
+        print("\nКАЧЕСТВО КАЛИБРОВКИ:")
+        for standard, check in report['checks'].items():
+            status = "OK" if check['ok'] else "ОШИБКА"
+            print(f"  {standard.upper():6} {check['metric']} = {check['value']:.3f}  {status}")
+        for entry in report['plans']:
+            plan = entry['plan']
+            name = f"{plan[0]/1e6:.3f}-{plan[1]/1e6:.1f} МГц/{plan[2]}" if plan else "текущий диапазон"
+            quality = entry['quality']
+            print(f"  {name}: направленность {quality['directivity_db']:.1f} дБ, "
+                  f"согласование источника {quality['source_match_db']:.1f} дБ")
+        residual = report['residual']
+        if residual['s21_max_error_db'] is not None:
+            print(f"  THRU после калибровки: |S21| отклонение до {residual['s21_max_error_db']:.2f} дБ, "
+                  f"S11 до {residual['s11_thru_max_db']:.1f} дБ")
+        print(f"Метрики сохранены в: {report['path']}")
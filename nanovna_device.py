@@ -0,0 +1,424 @@
+import serial
+import time
+import numpy as np
+
+from nanovna_metrics import METRICS, command_name
+from nanovna_sweep import Sweep
+from nanovna_trace import span
+
+PROMPT = b'ch>'
+
+# Команды, повтор которых после сбоя не меняет результат измерения
+IDEMPOTENT_COMMANDS = frozenset({
+    'frequencies', 'data', 'scan', 'sweep', 'pause', 'resume', 'info', 'version', 'help',
+})
+# Пауза перед повтором: 10, 20, 40... мс, не больше RETRY_BACKOFF_MAX
+RETRY_BACKOFF = 0.01
+RETRY_BACKOFF_MAX = 0.2
+# После переоткрытия порта прибор не перезагружается - долгая пауза не нужна
+REOPEN_SETTLE = 0.1
+
+
+class ProtocolError(RuntimeError):
+    """Ответ NanoVNA не удалось выделить (нет эха команды или приглашения ch>)"""
+
+
+class CommandTimeout(ProtocolError):
+    """Приглашение ch> не пришло за отведенное время"""
+
+
+def frame_response(command, raw):
+    """
+    Выделение ответа на команду из принятых байт: текст между эхом команды
+    и завершающим приглашением ch>. Все до эха (хвост предыдущего ответа)
+    отбрасывается. None, если эха или приглашения нет.
+    """
+    text = bytes(raw).decode('ascii', errors='ignore').replace('\r', '').rstrip()
+    if not text.endswith('ch>'):
+        return None
+    lines = text[:-3].split('\n')
+    echo = command.strip()
+    for i, line in enumerate(lines):
+        if _is_echo(line, echo):
+            return '\n'.join(lines[i + 1:]).strip()
+    return None
+
+
+def _is_echo(line, echo):
+    # Эхо может идти сразу за приглашением предыдущего ответа: "ch> data 0"
+    line = line.strip()
+    if line.startswith('ch>'):
+        line = line[3:].strip()
+    return line == echo
+
+
+def _numeric(parts):
+    try:
+        for part in parts:
+            float(part)
+    except ValueError:
+        return False
+    return True
+
+
+class LineDecoder:
+    """
+    Потоковый разбор числового ответа по мере прихода кусков из порта.
+    Полные строки из width чисел сразу пишутся в заранее выделенную
+    таблицу float64 (при нехватке места она удваивается), так что к
+    приходу приглашения ch> данные уже разобраны. Строки до эха команды
+    (хвост предыдущего ответа) и нечисловые строки пропускаются.
+    """
+
+    def __init__(self, command, width, points=101):
+        self.echo = command.strip()
+        self.width = width
+        self.table = np.empty((max(int(points), 1), width), dtype=np.float64)
+        self.reset()
+
+    def reset(self):
+        self.buffer = bytearray()
+        self.count = 0
+        self.started = False
+        self.parse_seconds = 0.0
+
+    @property
+    def complete(self):
+        """Эхо получено и ответ закончился приглашением"""
+        return self.started and self.buffer.rstrip().endswith(PROMPT)
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        end = self.buffer.rfind(b'\n')
+        if end < 0:
+            return
+        started = time.perf_counter()
+        lines = bytes(self.buffer[:end]).split(b'\n')
+        del self.buffer[:end + 1]
+        if not self.started:
+            for i, line in enumerate(lines):
+                if _is_echo(line.decode('ascii', errors='ignore'), self.echo):
+                    self.started = True
+                    lines = lines[i + 1:]
+                    break
+            else:
+                return
+        rows = [parts for parts in (line.split() for line in lines) if len(parts) == self.width]
+        if rows:
+            try:
+                values = np.array(rows, dtype=np.float64)
+            except ValueError:
+                values = np.array([row for row in rows if _numeric(row)],
+                                  dtype=np.float64).reshape(-1, self.width)
+            self._append(values)
+        self.parse_seconds += time.perf_counter() - started
+
+    def _append(self, values):
+        end = self.count + len(values)
+        if end > len(self.table):
+            table = np.empty((max(end, 2 * len(self.table)), self.width), dtype=np.float64)
+            table[:self.count] = self.table[:self.count]
+            self.table = table
+        self.table[self.count:end] = values
+        self.count = end
+
+    def result(self):
+        """Разобранные строки: представление таблицы (count, width) без копирования"""
+        return self.table[:self.count]
+
+
+def complex_column(table, column=0):
+    """Пара столбцов real imag таблицы как комплексный массив (без копирования, если можно)"""
+    pair = table[:, column:column + 2]
+    try:
+        return pair.view(np.complex128)[:, 0]
+    except ValueError:
+        return pair[:, 0] + 1j * pair[:, 1]
+
+
+def parse_frequency_data(data):
+    """Парсинг ответа на команду frequencies в массив частот (Гц)"""
+    frequencies = []
+    for line in data.strip().split('\n'):
+        line = line.strip()
+        if line and not line.startswith('ch>'):
+            try:
+                frequencies.extend(float(part) for part in line.split())
+            except ValueError:
+                continue
+    return np.array(frequencies, dtype=np.float64)
+
+
+def parse_complex_data(data):
+    """Парсинг ответа на команду data N (строки "real imag") в комплексный массив"""
+    points = []
+    for line in data.strip().split('\n'):
+        parts = line.strip().split()
+        if len(parts) >= 2 and not parts[0].startswith('ch>'):
+            try:
+                points.append(complex(float(parts[0]), float(parts[1])))
+            except ValueError:
+                continue
+    return np.array(points, dtype=np.complex128)
+
+
+def parse_scan_data(data, outmask=7):
+    """
+    Парсинг ответа scan: в каждой строке частота (бит 0 outmask),
+    S11 (бит 1) и S21 (бит 2) - real imag
+    """
+    width = scan_width(outmask)
+    rows = []
+    for line in data.strip().split('\n'):
+        parts = line.strip().split()
+        if len(parts) != width:
+            continue
+        try:
+            rows.append([float(part) for part in parts])
+        except ValueError:
+            continue
+    return scan_columns(np.array(rows, dtype=np.float64).reshape(-1, width), outmask)
+
+
+def scan_width(outmask):
+    """Число значений в строке ответа scan"""
+    return (outmask & 1) + 2 * bool(outmask & 2) + 2 * bool(outmask & 4)
+
+
+def scan_columns(table, outmask=7):
+    """Таблица ответа scan (строка на точку) -> словарь frequencies, data0, data1"""
+    result = {}
+    column = 0
+    if outmask & 1:
+        result['frequencies'] = table[:, 0]
+        column += 1
+    for bit, name in ((2, 'data0'), (4, 'data1')):
+        if outmask & bit:
+            result[name] = complex_column(table, column)
+            column += 2
+    return result
+
+
+class NanoVNA:
+    """Подключение к NanoVNA с учетом текущего состояния сканирования и калибровки"""
+
+    def __init__(self, port, baudrate=115200, timeout=2, settle_time=2, retries=3):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.settle_time = settle_time
+        self.retries = retries
+        self.ser = None
+        # Последние отправленные параметры - чтобы не повторять sweep/cal load
+        self.sweep_state = None
+        self.cal_slot = None
+
+    def open(self):
+        with span('connect', port=self.port):
+            self.ser = serial.Serial(self.port, self.baudrate, timeout=1, write_timeout=self.timeout)
+            time.sleep(self.settle_time)
+            self.ser.reset_input_buffer()
+            self.ser.reset_output_buffer()
+        self.sweep_state = None
+        self.cal_slot = None
+        return self
+
+    def close(self):
+        if self.ser and self.ser.is_open:
+            self.ser.close()
+        self.ser = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def send_command(self, command, timeout=None, retries=None, decoder=None):
+        """
+        Отправка команды и чтение ответа до приглашения ch>; возвращается
+        ответ без эха команды и приглашения (с decoder - его таблица).
+        Идемпотентные команды после таймаута или сбоя порта повторяются
+        (с паузой и ресинхронизацией), остальные сразу поднимают
+        ProtocolError/SerialException.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        name = command_name(command)
+        if retries is None:
+            retries = self.retries if name in IDEMPOTENT_COMMANDS else 0
+
+        for attempt in range(retries + 1):
+            if attempt:
+                METRICS.inc('nanovna_command_retries_total', command=name)
+                time.sleep(min(RETRY_BACKOFF * 2 ** (attempt - 1), RETRY_BACKOFF_MAX))
+            try:
+                if attempt:
+                    self.resync()
+                return self._transact(command, name, timeout, decoder)
+            except (ProtocolError, OSError) as e:
+                error = e
+                print(f"Сбой команды '{command}' (попытка {attempt + 1}/{retries + 1}): {e}")
+        raise error
+
+    def _transact(self, command, name, timeout, decoder=None):
+        """Одна попытка: запись команды и чтение кадра эхо ... ch>"""
+        started = time.perf_counter()
+        with span('command', command=command):
+            self._discard_pending()
+            data = (command + '\r\n').encode()
+            self.ser.write(data)
+
+            response = bytearray()
+            received = 0
+            body = None
+            if decoder is not None:
+                decoder.reset()
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                waiting = self.ser.in_waiting
+                if waiting:
+                    chunk = self.ser.read(waiting)
+                    received += len(chunk)
+                    if decoder is not None:
+                        # Разбор идет, пока прибор передает остаток ответа
+                        decoder.feed(chunk)
+                        if decoder.complete:
+                            body = decoder.result()
+                            break
+                        continue
+                    response += chunk
+                    # Приглашение без своего эха - хвост предыдущего ответа, читаем дальше
+                    if response.rstrip().endswith(PROMPT):
+                        body = frame_response(command, response)
+                        if body is not None:
+                            break
+                else:
+                    time.sleep(0.005)
+
+        METRICS.observe('nanovna_command_seconds', time.perf_counter() - started, command=name)
+        METRICS.inc('nanovna_bytes_sent_total', len(data), port=self.port)
+        METRICS.inc('nanovna_bytes_received_total', received, port=self.port)
+        if body is None:
+            METRICS.inc('nanovna_command_timeouts_total', command=name)
+            raise CommandTimeout(f"Нет ответа на команду '{command}' за {timeout} с "
+                                 f"(получено {received} байт)")
+        return body
+
+    def query_table(self, command, width, points=None, timeout=None, kind='data'):
+        """
+        Команда с числовым ответом (строки по width значений), разобранным
+        потоково в таблицу (points, width) float64
+        """
+        if points is None:
+            points = self.sweep_state[2] if self.sweep_state else 101
+        decoder = LineDecoder(command, width, points)
+        table = self.send_command(command, timeout, decoder=decoder)
+        METRICS.observe('nanovna_parse_seconds', decoder.parse_seconds, kind=kind)
+        return table
+
+    def _discard_pending(self):
+        """Сброс непрочитанного остатка (поздний хвост ответа после таймаута)"""
+        waiting = self.ser.in_waiting
+        if waiting:
+            self.ser.read(waiting)
+            METRICS.inc('nanovna_resyncs_total', port=self.port)
+
+    def resync(self, timeout=None):
+        """
+        Восстановление синхронизации: пустая строка и чтение до приглашения,
+        пока прибор не замолчит. При ошибке порта - переоткрытие порта.
+        """
+        METRICS.inc('nanovna_resyncs_total', port=self.port)
+        if timeout is None:
+            timeout = self.timeout
+        try:
+            self._discard_pending()
+            self.ser.write(b'\r\n')
+        except OSError:
+            self.reopen()
+            self.ser.write(b'\r\n')
+
+        response = bytearray()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            waiting = self.ser.in_waiting
+            if waiting:
+                response += self.ser.read(waiting)
+            elif response.rstrip().endswith(PROMPT):
+                # Пауза без новых данных - хвостов больше нет
+                time.sleep(0.02)
+                if not self.ser.in_waiting:
+                    return
+            else:
+                time.sleep(0.005)
+        raise CommandTimeout(f"Нет приглашения ch> при ресинхронизации за {timeout} с")
+
+    def reopen(self):
+        """Переоткрытие порта после сбоя USB; прибор не перезагружается, состояние сохраняется"""
+        if self.ser:
+            try:
+                self.ser.close()
+            except OSError:
+                pass
+        with span('reconnect', port=self.port):
+            self.ser = serial.Serial(self.port, self.baudrate, timeout=1, write_timeout=self.timeout)
+            time.sleep(REOPEN_SETTLE)
+            self.ser.reset_input_buffer()
+
+    def set_sweep(self, start, stop, points):
+        """Установка диапазона; команда не отправляется, если он уже установлен"""
+        state = (int(start), int(stop), int(points))
+        if state == self.sweep_state:
+            return False
+        self.send_command(f"sweep {state[0]} {state[1]} {state[2]}")
+        self.sweep_state = state
+        return True
+
+    def load_calibration(self, slot):
+        """Загрузка калибровки из слота; повторная загрузка того же слота пропускается"""
+        if slot is None or slot == self.cal_slot:
+            return False
+        self.send_command(f"cal load {slot}")
+        self.cal_slot = slot
+        # Загрузка слота восстанавливает и сохраненный в нем диапазон
+        self.sweep_state = None
+        return True
+
+    def capture(self, channels=(0,), sweep_time=1.0):
+        """Один проход сканирования и чтение частот и данных каналов (0 - S11, 1 - S21)"""
+        with METRICS.timer('nanovna_sweep_seconds', port=self.port), span('sweep', port=self.port):
+            self.send_command("resume")
+            time.sleep(sweep_time)
+            self.send_command("pause")
+            table = self.query_table("frequencies", 1, kind='frequencies')
+            data = {f"data{channel}": complex_column(self.query_table(f"data {channel}", 2))
+                    for channel in channels}
+        return self._sweep(table[:, 0], **data)
+
+    def _sweep(self, frequencies, data0=None, data1=None):
+        return Sweep(frequencies, data0, data1, device=self.port, cal_slot=self.cal_slot,
+                     timestamp=time.time(), plan=self.sweep_state)
+
+    def scan(self, start, stop, points, channels=(0, 1), timeout=None):
+        """
+        Одно сканирование командой scan: частоты и каналы приходят одним
+        ответом, S11 и S21 гарантированно из одного прохода
+        """
+        outmask = 1 | (2 if 0 in channels else 0) | (4 if 1 in channels else 0)
+        if timeout is None:
+            # Команда отвечает только после окончания прохода
+            timeout = self.timeout + points * 0.02
+        state = (int(start), int(stop), int(points))
+        with METRICS.timer('nanovna_sweep_seconds', port=self.port), span('scan', port=self.port):
+            table = self.query_table(f"scan {state[0]} {state[1]} {state[2]} {outmask}",
+                                     scan_width(outmask), state[2], timeout, kind='scan')
+            result = scan_columns(table, outmask)
+        # После scan прибор остается на этом диапазоне
+        self.sweep_state = state
+        return self._sweep(**result)
+
+    def measure(self, start, stop, points, cal_slot=None, channels=(0,), sweep_time=1.0):
+        self.load_calibration(cal_slot)
+        self.set_sweep(start, stop, points)
+        return self.capture(channels, sweep_time)
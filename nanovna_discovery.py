@@ -0,0 +1,251 @@
+"""
+Быстрый поиск NanoVNA по кэшу обнаружения
+
+После первого успешного поиска порт запоминается на диске по VID/PID и
+серийному номеру USB (если номер не уникален - как "400" у всех H4 со
+штатной прошивкой - еще и по расположению на шине). При следующем запуске порт с тем же USB-устройством
+(даже если /dev/ttyACM* поменял номер) проверяется одной короткой командой,
+и полный перебор портов нужен только при промахе.
+
+Перед перебором порты ранжируются по USB-описанию (VID/PID из list_ports),
+чтобы не открывать модемы, GPS-приемники и системные UART. Таблицу ID можно
+дополнить переменной NANOVNA_USB_IDS="0483:5740=10,1a86:7523".
+"""
+import json
+import os
+import re
+import time
+from datetime import datetime
+
+import serial
+import serial.tools.list_ports
+
+DEFAULT_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.cache', 'nanovna', 'ports.json')
+
+# (VID, PID) -> вес кандидата; чем больше, тем раньше проверяется порт
+NANOVNA_USB_IDS = {
+    (0x0483, 0x5740): 10,  # STM32 Virtual COM Port - NanoVNA-H / H4 (USB CDC)
+    (0x1a86, 0x7523): 3,   # CH340 - USB-UART в клонах
+    (0x0403, 0x6001): 2,   # FT232
+    (0x10c4, 0xea60): 1,   # CP210x
+}
+
+# Порты, которые не проверяются даже без USB-описания
+SYSTEM_PORT_PREFIXES = ('/dev/ttyS', '/dev/ttyAMA')
+
+
+def load_usb_ids(spec=None, base=None):
+    """Таблица ID с добавлениями из строки "VID:PID[=вес],..." (по умолчанию NANOVNA_USB_IDS из окружения)"""
+    usb_ids = dict(NANOVNA_USB_IDS if base is None else base)
+    if spec is None:
+        spec = os.environ.get('NANOVNA_USB_IDS', '')
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        try:
+            ids, _, weight = item.partition('=')
+            vid, pid = (int(v, 16) for v in ids.split(':'))
+            usb_ids[(vid, pid)] = int(weight) if weight else 5
+        except ValueError:
+            print(f"Неверный USB ID в NANOVNA_USB_IDS: {item}")
+    return usb_ids
+
+
+def usb_score(vid, pid, usb_ids=None):
+    """Вес порта по таблице ID: 0 - не кандидат"""
+    if vid is None or pid is None:
+        return 0
+    if usb_ids is None:
+        usb_ids = load_usb_ids()
+    return usb_ids.get((vid, pid), 0)
+
+
+def rank_ports(ports, usb_ids=None):
+    """
+    Разделение портов list_ports на кандидатов (по убыванию веса) и остальные.
+    Системные UART в остальные не попадают - их проверять бессмысленно.
+    """
+    if usb_ids is None:
+        usb_ids = load_usb_ids()
+    scored = []
+    others = []
+    for port in ports:
+        score = usb_score(getattr(port, 'vid', None), getattr(port, 'pid', None), usb_ids)
+        if score > 0:
+            scored.append((score, port))
+        elif not port.device.startswith(SYSTEM_PORT_PREFIXES):
+            others.append(port)
+    scored.sort(key=lambda item: -item[0])
+    return [port for _, port in scored], others
+
+
+def port_identity(port, ports=()):
+    """
+    Ключ USB-устройства "vid:pid:serial" или None для портов без USB-описания.
+    Если тот же vid:pid:serial есть у другого порта из ports (одинаковые H4),
+    добавляется расположение на шине: "vid:pid:serial@location".
+    """
+    if getattr(port, 'vid', None) is None or getattr(port, 'pid', None) is None:
+        return None
+    location = getattr(port, 'location', None)
+    serial_number = getattr(port, 'serial_number', None)
+    if not serial_number:
+        return f"{port.vid:04x}:{port.pid:04x}:{location or ''}"
+    key = (port.vid, port.pid, serial_number)
+    shared = any(other.device != port.device and
+                 (getattr(other, 'vid', None), getattr(other, 'pid', None),
+                  getattr(other, 'serial_number', None)) == key
+                 for other in ports)
+    identity = f"{port.vid:04x}:{port.pid:04x}:{serial_number}"
+    return f"{identity}@{location or port.device}" if shared else identity
+
+
+def is_cdc_port(device, vid=None, pid=None):
+    """USB CDC (виртуальный COM) - скорость порта не имеет значения"""
+    if vid is not None and pid is not None and (vid, pid) == (0x0483, 0x5740):
+        return True
+    return os.path.basename(device).startswith('ttyACM')
+
+
+def read_until_prompt(ser, timeout):
+    """Чтение до приглашения ch> или до истечения timeout: (ответ, пришло ли приглашение)"""
+    response = bytearray()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response += ser.read(ser.in_waiting or 1)
+        if response.rstrip().endswith(b'ch>'):
+            return bytes(response), True
+    return bytes(response), False
+
+
+def parse_identity(text):
+    """Плата и версия прошивки из ответа на info / version"""
+    identity = {'board': None, 'version': None, 'platform': None}
+    for line in text.replace('\r', '').split('\n'):
+        line = line.strip()
+        key, sep, value = line.partition(':')
+        key = key.strip().lower()
+        if sep and key == 'board':
+            identity['board'] = value.strip()
+        elif sep and key == 'version':
+            identity['version'] = value.strip()
+        elif sep and 'platform' in line.lower():
+            identity['platform'] = line.lower().split('platform:')[-1].strip().upper()
+        elif identity['version'] is None and re.match(r'^v?\d+\.\d+(\.\d+)?', line):
+            # Ответ на version - одна строка с номером
+            identity['version'] = line
+    return identity
+
+
+def identify_port(device, baudrate=115200, command='info', timeout=0.3):
+    """
+    Идентификация одной командой без паузы на инициализацию:
+    чтение до приглашения ch> или короткого таймаута.
+    """
+    started = time.monotonic()
+    result = {'port': device, 'is_nanovna': False, 'prompt': False, 'board': None,
+              'version': None, 'platform': None, 'response': ''}
+    try:
+        with serial.Serial(device, baudrate, timeout=0.01, write_timeout=timeout) as ser:
+            ser.reset_input_buffer()
+            ser.write((command + '\r\n').encode())
+            response, prompt = read_until_prompt(ser, timeout)
+    except (serial.SerialException, OSError) as e:
+        result['error'] = str(e)
+        result['elapsed'] = time.monotonic() - started
+        return result
+
+    text = response.decode('ascii', errors='ignore')
+    result.update(parse_identity(text))
+    result['prompt'] = prompt
+    result['response'] = text
+    result['is_nanovna'] = prompt or 'nanovna' in text.lower()
+    result['elapsed'] = time.monotonic() - started
+    return result
+
+
+def quick_probe(device, baudrate=115200, timeout=0.5):
+    """Одна пустая команда без паузы на инициализацию: True, если пришло приглашение ch>"""
+    return identify_port(device, baudrate, command='', timeout=timeout)['prompt']
+
+
+class DiscoveryCache:
+    """Последние найденные порты NanoVNA, по ключу USB-устройства"""
+
+    def __init__(self, path=DEFAULT_CACHE_FILE):
+        self.path = path
+        self.entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Не удалось сохранить кэш портов: {e}")
+
+    def remember(self, device, baudrate=115200, ports=None):
+        """Запомнить порт, на котором найден NanoVNA"""
+        if ports is None:
+            ports = serial.tools.list_ports.comports()
+        port = next((p for p in ports if p.device == device), None)
+        identity = port_identity(port, ports) if port else None
+        self.entries[identity or f"device:{device}"] = {
+            'device': device,
+            'baudrate': baudrate,
+            'last_seen': datetime.now().isoformat(timespec='seconds'),
+        }
+        self.save()
+
+    def entry_for(self, device):
+        return next((e for e in self.entries.values() if e['device'] == device), None)
+
+    def forget(self, identity):
+        if self.entries.pop(identity, None) is not None:
+            self.save()
+
+    def candidates(self, ports=None):
+        """Порты из кэша, присутствующие сейчас: (identity, device, baudrate), свежие первыми"""
+        if ports is None:
+            ports = serial.tools.list_ports.comports()
+        by_identity = {port_identity(p, ports): p.device for p in ports}
+        present = {p.device for p in ports}
+
+        result = []
+        ordered = sorted(self.entries.items(), key=lambda e: e[1].get('last_seen', ''), reverse=True)
+        for identity, entry in ordered:
+            if identity in by_identity:
+                # То же USB-устройство, путь мог измениться
+                result.append((identity, by_identity[identity], entry.get('baudrate', 115200)))
+            elif identity.startswith('device:') and entry['device'] in present:
+                result.append((identity, entry['device'], entry.get('baudrate', 115200)))
+        return result
+
+    def find(self, ports=None, probe=quick_probe):
+        """Проверка закэшированных портов одной быстрой командой; None при промахе"""
+        for identity, device, baudrate in self.candidates(ports):
+            if probe(device, baudrate):
+                entry = self.entries[identity]
+                if entry['device'] != device:
+                    print(f"NanoVNA переместился: {entry['device']} -> {device}")
+                entry['device'] = device
+                entry['last_seen'] = datetime.now().isoformat(timespec='seconds')
+                self.save()
+                return device
+        return None
+
+
+def find_cached_port(cache_file=DEFAULT_CACHE_FILE):
+    """Порт NanoVNA из кэша обнаружения или None"""
+    return DiscoveryCache(cache_file).find()
+
+
+def remember_port(device, baudrate=115200, cache_file=DEFAULT_CACHE_FILE):
+    DiscoveryCache(cache_file).remember(device, baudrate)
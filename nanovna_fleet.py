@@ -0,0 +1,193 @@
+"""
+Работа с несколькими NanoVNA одновременно
+
+Приборы находятся по USB-описанию и идентифицируются одной командой
+(nanovna_discovery), ключ - серийный номер USB. Штатная прошивка H4 у всех
+экземпляров сообщает один и тот же номер ("400"), поэтому повторяющийся
+номер дополняется расположением на шине USB (или путем порта): "400@1-1.2".
+Каждый прибор обслуживает отдельный процесс, в котором задания плана
+выполняются так же, как в nanovna_jobs; результаты собираются в один
+словарь по ключам приборов.
+
+Пример:
+  python nanovna_fleet.py list
+  python nanovna_fleet.py run plan.json
+  python nanovna_fleet.py run plan.json --device-plan 400@1-1.2=filter_plan.json
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import serial.tools.list_ports
+
+from nanovna_discovery import identify_port, rank_ports
+from nanovna_jobs import JobRunner, normalize_job
+
+
+def discover_devices(ports=None):
+    """Подключенные NanoVNA: {ключ прибора: описание порта и прибора}"""
+    if ports is None:
+        ports = serial.tools.list_ports.comports()
+    candidates, _ = rank_ports(ports)
+
+    found = []
+    for port in candidates:
+        identity = identify_port(port.device)
+        if not identity['is_nanovna']:
+            continue
+        found.append({
+            'serial_number': getattr(port, 'serial_number', None) or port.device,
+            'location': getattr(port, 'location', None),
+            'device': port.device,
+            'board': identity['board'],
+            'version': identity['version'],
+        })
+
+    counts = {}
+    for info in found:
+        counts[info['serial_number']] = counts.get(info['serial_number'], 0) + 1
+    devices = {}
+    for info in found:
+        key = info['serial_number']
+        if counts[key] > 1:
+            # Одинаковый номер у нескольких приборов - различаем по месту подключения
+            key = f"{key}@{info['location'] or info['device']}"
+        info['key'] = key
+        devices[key] = info
+    return devices
+
+
+def resolve_device(devices, name):
+    """
+    Ключ прибора по имени из командной строки: ключ, серийный номер или
+    путь порта. Неизвестное или неоднозначное имя - ValueError.
+    """
+    if name in devices:
+        return name
+    matches = [key for key, info in devices.items() if name in (info['serial_number'], info['device'])]
+    if not matches:
+        raise ValueError(f"Прибор {name} не найден")
+    if len(matches) > 1:
+        raise ValueError(f"Серийный номер {name} у нескольких приборов, укажите ключ: "
+                         + ', '.join(sorted(matches)))
+    return matches[0]
+
+
+def load_jobs(path):
+    """Задания из файла плана (формат nanovna_jobs, поле devices не обязательно)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        plan = json.load(f)
+    jobs = plan['jobs'] if isinstance(plan, dict) else plan
+    return [normalize_job(job, i) for i, job in enumerate(jobs)]
+
+
+def run_device_plan(key, device, jobs, sweep_time=1.0):
+    """Выполнение плана на одном приборе (в отдельном процессе)"""
+    started = time.monotonic()
+    runner = JobRunner([device], sweep_time=sweep_time)
+    try:
+        results = runner.run_batch(jobs)
+    finally:
+        runner.close()
+    for result in results:
+        result['device_key'] = key
+    return {'key': key, 'device': device, 'results': results,
+            'elapsed': time.monotonic() - started}
+
+
+class Fleet:
+    """Набор приборов, у каждого свой рабочий процесс"""
+
+    def __init__(self, devices=None, sweep_time=1.0):
+        self.devices = discover_devices() if devices is None else devices
+        self.sweep_time = sweep_time
+
+    def run(self, jobs=None, plans=None):
+        """
+        Запуск плана jobs на всех приборах или отдельных планов plans
+        {ключ прибора: задания}; результат - {ключ прибора: отчет}
+        """
+        assignments = {}
+        for key, info in self.devices.items():
+            device_jobs = (plans or {}).get(key, jobs)
+            if device_jobs:
+                assignments[key] = (info['device'], device_jobs)
+        if not assignments:
+            print("Нет приборов с заданиями")
+            return {}
+
+        print(f"Приборов: {len(assignments)}")
+        report = {}
+        with ProcessPoolExecutor(max_workers=len(assignments)) as pool:
+            futures = {pool.submit(run_device_plan, key, device, device_jobs, self.sweep_time): key
+                       for key, (device, device_jobs) in assignments.items()}
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    report[key] = future.result()
+                except Exception as e:
+                    print(f"Ошибка прибора {key}: {e}")
+                    report[key] = {'key': key, 'device': assignments[key][0],
+                                   'results': [], 'error': str(e)}
+        return report
+
+
+def print_report(report):
+    print("\n" + "=" * 60)
+    print("РЕЗУЛЬТАТЫ ПО ПРИБОРАМ")
+    print("=" * 60)
+    for key, entry in sorted(report.items()):
+        elapsed = entry.get('elapsed')
+        print(f"\n{key} ({entry['device']})" +
+              (f", {elapsed:.1f} с" if elapsed is not None else ""))
+        if 'error' in entry:
+            print(f"  Ошибка: {entry['error']}")
+        for result in entry['results']:
+            if 'error' in result:
+                print(f"  {result['job']}: ошибка {result['error']}")
+            else:
+                values = ', '.join(f"{k}={v:.4g}" if isinstance(v, float) else f"{k}={v}"
+                                   for k, v in result['result'].items())
+                print(f"  {result['job']}: {values}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Параллельные измерения на нескольких NanoVNA")
+    parser.add_argument('command', choices=['list', 'run'])
+    parser.add_argument('plan', nargs='?', help="план для всех приборов (формат nanovna_jobs)")
+    parser.add_argument('--device-plan', action='append', default=[],
+                        help="отдельный план прибора: KEY=plan.json (ключ из list, серийный номер или порт)")
+    parser.add_argument('--sweep-time', type=float, default=1.0)
+    parser.add_argument('--json', help="сохранить сводные результаты в JSON")
+    args = parser.parse_args()
+
+    devices = discover_devices()
+    if not devices:
+        print("NanoVNA не найдены")
+        return
+    if args.command == 'list':
+        for key, info in devices.items():
+            print(f"{key}: {info['device']} - {info['board']} {info['version']}")
+        return
+
+    jobs = load_jobs(args.plan) if args.plan else None
+    plans = {}
+    for item in args.device_plan:
+        name, _, path = item.partition('=')
+        try:
+            plans[resolve_device(devices, name)] = load_jobs(path)
+        except ValueError as e:
+            print(f"Ошибка --device-plan: {e}")
+            return
+
+    report = Fleet(devices, args.sweep_time).run(jobs, plans)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=float)
+        print(f"\nСводные результаты сохранены в: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
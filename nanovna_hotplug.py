@@ -0,0 +1,204 @@
+"""
+Отслеживание подключения и отключения последовательных портов
+
+На Linux используется inotify на /dev (через ctypes, без зависимостей):
+новый /dev/ttyACM* замечается сразу после создания узла udev. На других
+системах, или если inotify недоступен, - опрос list_ports с коротким
+интервалом. Новые порты проверяются в пуле потоков, не останавливая цикл,
+а события рассылаются подписчикам:
+  {'event': 'attach' | 'detach' | 'probe', 'device': ..., 'result': ..., 'time': ...}
+"""
+import ctypes
+import ctypes.util
+import os
+import re
+import select
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import serial.tools.list_ports
+
+from nanovna_discovery import identify_port
+
+IN_ATTRIB = 0x00000004
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct('iIII')
+
+# Узлы /dev, похожие на USB-последовательные порты (только для inotify:
+# при опросе list_ports сам перечисляет порты, в т.ч. COMx и cu.usbmodem*)
+DEFAULT_PATTERN = r'^tty(ACM|USB)\d+$'
+
+
+def _inotify_fd(path):
+    """Дескриптор inotify на каталог или None, если inotify недоступен"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return None
+        if libc.inotify_add_watch(fd, path.encode(), IN_CREATE | IN_DELETE | IN_ATTRIB) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+
+def _default_probe(device):
+    return identify_port(device)
+
+
+class HotplugMonitor:
+    def __init__(self, probe=_default_probe, pattern=None, poll_interval=1.0,
+                 max_workers=4, probe_delay=0.2, report_existing=True, use_inotify=True,
+                 watch_dir='/dev'):
+        self.probe = probe
+        self.watch_dir = watch_dir
+        # pattern задан явно - фильтр в обоих режимах, иначе только имена в /dev для inotify
+        self.pattern = re.compile(pattern) if pattern else None
+        self.dev_pattern = self.pattern or re.compile(DEFAULT_PATTERN)
+        self.poll_interval = poll_interval
+        self.probe_delay = probe_delay
+        self.report_existing = report_existing
+        self.use_inotify = use_inotify
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.subscribers = []
+        self.known = set()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.mode = None
+
+    def subscribe(self, callback):
+        """Подписка на события; callback вызывается из фонового потока"""
+        self.subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
+
+    def publish(self, event, device, result=None):
+        message = {'event': event, 'device': device, 'result': result,
+                   'time': datetime.now().strftime("%H:%M:%S.%f")[:-3]}
+        for callback in list(self.subscribers):
+            try:
+                callback(message)
+            except Exception as e:
+                print(f"Ошибка подписчика: {e}")
+
+    def _list_ports(self):
+        pattern = self.dev_pattern if self.mode == 'inotify' else self.pattern
+        return {port.device for port in serial.tools.list_ports.comports()
+                if pattern is None or pattern.match(os.path.basename(port.device))}
+
+    def _attach(self, device):
+        with self.lock:
+            if device in self.known:
+                return
+            self.known.add(device)
+        self.publish('attach', device)
+        self.executor.submit(self._probe, device)
+
+    def _detach(self, device):
+        with self.lock:
+            if device not in self.known:
+                return
+            self.known.discard(device)
+        self.publish('detach', device)
+
+    def _probe(self, device):
+        # udev выставляет права на узел чуть позже его создания
+        time.sleep(self.probe_delay)
+        with self.lock:
+            if device not in self.known:
+                return
+        try:
+            result = self.probe(device)
+        except Exception as e:
+            result = {'port': device, 'is_nanovna': False, 'error': str(e)}
+        self.publish('probe', device, result)
+
+    def _sync(self, current):
+        for device in sorted(current - self.known):
+            self._attach(device)
+        for device in sorted(self.known - current):
+            self._detach(device)
+
+    def _run_inotify(self, fd):
+        buffer = b''
+        while not self.stop_event.is_set():
+            ready, _, _ = select.select([fd], [], [], 0.5)
+            if not ready:
+                continue
+            try:
+                buffer += os.read(fd, 4096)
+            except BlockingIOError:
+                continue
+            while len(buffer) >= _EVENT_HEADER.size:
+                _, mask, _, length = _EVENT_HEADER.unpack_from(buffer)
+                end = _EVENT_HEADER.size + length
+                if len(buffer) < end:
+                    break
+                name = buffer[_EVENT_HEADER.size:end].rstrip(b'\0').decode(errors='ignore')
+                buffer = buffer[end:]
+                if not self.dev_pattern.match(name):
+                    continue
+                device = os.path.join(self.watch_dir, name)
+                if mask & (IN_CREATE | IN_ATTRIB):
+                    self._attach(device)
+                elif mask & IN_DELETE:
+                    self._detach(device)
+
+    def _run_polling(self):
+        while not self.stop_event.wait(self.poll_interval):
+            self._sync(self._list_ports())
+
+    def _run(self):
+        # Режим выбирается до первого списка - от него зависит фильтр портов
+        fd = _inotify_fd(self.watch_dir) if self.use_inotify else None
+        self.mode = 'polling' if fd is None else 'inotify'
+        current = self._list_ports()
+        if self.report_existing:
+            self._sync(current)
+        else:
+            self.known = set(current)
+
+        if fd is None:
+            print(f"Отслеживание портов: опрос каждые {self.poll_interval} с")
+            self._run_polling()
+            return
+        print(f"Отслеживание портов: inotify на {self.watch_dir}")
+        try:
+            self._run_inotify(fd)
+        finally:
+            os.close(fd)
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name='hotplug', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=2)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def run_forever(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.start()
+        try:
+            while self.thread.is_alive():
+                self.thread.join(timeout=0.5)
+        finally:
+            self.stop()
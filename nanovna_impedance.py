@@ -0,0 +1,184 @@
+"""
+Импеданс и диаграмма Смита по S11
+
+Все величины считаются сразу для всех точек сканирования операциями NumPy:
+комплексный импеданс, R/X, последовательные эквиваленты L/C, возвратные
+потери, КСВ, добротность и групповая задержка. Резонансы (X = 0) ищутся по
+смене знака реактивного сопротивления между соседними точками, частота
+уточняется линейной интерполяцией.
+
+Пример:
+  python nanovna_impedance.py --port /dev/ttyACM0 --range 140e6 150e6 --points 201 --cal-slot 0
+"""
+import argparse
+
+import numpy as np
+
+import nanovna_analysis
+from nanovna_analysis import sweep_arrays
+from nanovna_device import NanoVNA
+
+Z0 = 50.0
+
+
+def impedance(s11, z0=Z0):
+    """Комплексный импеданс Z = z0 (1 + Г) / (1 - Г); при Г = 1 - бесконечность"""
+    s11 = np.asarray(s11, dtype=np.complex128)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = z0 * (1 + s11) / (1 - s11)
+    z[s11 == 1] = np.inf
+    return z
+
+
+def reflection(z, z0=Z0):
+    """Обратное преобразование: Г = (Z - z0) / (Z + z0)"""
+    z = np.asarray(z, dtype=np.complex128)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (z - z0) / (z + z0)
+
+
+def series_equivalents(frequencies, z):
+    """
+    Последовательные эквиваленты реактивности: индуктивность (Гн) там, где
+    X > 0, и емкость (Ф) там, где X < 0; в остальных точках - nan
+    """
+    omega = 2 * np.pi * np.asarray(frequencies, dtype=np.float64)
+    x = np.imag(z)
+    inductance = np.full(x.shape, np.nan)
+    capacitance = np.full(x.shape, np.nan)
+    positive = (x > 0) & (omega > 0)
+    negative = (x < 0) & (omega > 0)
+    inductance[positive] = x[positive] / omega[positive]
+    capacitance[negative] = -1 / (omega[negative] * x[negative])
+    return inductance, capacitance
+
+
+def q_factor(z):
+    """Добротность |X| / R (при R <= 0 - inf)"""
+    r, x = np.real(z), np.abs(np.imag(z))
+    q = np.full(r.shape, np.inf)
+    ok = r > 0
+    q[ok] = x[ok] / r[ok]
+    return q
+
+
+def group_delay(frequencies, s):
+    """Групповая задержка -dφ/dω (с) по развернутой фазе, на неравномерной сетке тоже"""
+    frequencies = np.asarray(frequencies, dtype=np.float64)
+    if len(frequencies) < 2:
+        return np.zeros(len(frequencies))
+    phase = np.unwrap(np.angle(np.asarray(s)))
+    return -np.gradient(phase, 2 * np.pi * frequencies)
+
+
+def find_resonances(frequencies, z):
+    """
+    Резонансы по смене знака X между соседними точками. Последовательный
+    резонанс - X растет через ноль (минимум |Z|), параллельный - падает.
+    """
+    frequencies = np.asarray(frequencies, dtype=np.float64)
+    r, x = np.real(z), np.imag(z)
+    finite = np.isfinite(x)
+    sign = np.signbit(x)
+    i = np.nonzero((sign[:-1] != sign[1:]) & finite[:-1] & finite[1:])[0]
+    t = x[i] / (x[i] - x[i + 1])
+    freq = frequencies[i] + t * (frequencies[i + 1] - frequencies[i])
+    resistance = r[i] + t * (r[i + 1] - r[i])
+    kind = np.where(x[i + 1] > x[i], 'series', 'parallel')
+    return [{'freq': float(f), 'resistance': float(res), 'type': str(k), 'index': int(j)}
+            for f, res, k, j in zip(freq, resistance, kind, i)]
+
+
+def impedance_table(frequencies, s11=None, z0=Z0):
+    """Все величины по точкам: словарь массивов одинаковой длины"""
+    frequencies, s11, _ = sweep_arrays(frequencies, s11)
+    frequencies = np.asarray(frequencies, dtype=np.float64)
+    n = min(len(frequencies), len(s11))
+    frequencies, s11 = frequencies[:n], np.asarray(s11[:n], dtype=np.complex128)
+    z = impedance(s11, z0)
+    inductance, capacitance = series_equivalents(frequencies, z)
+    return {
+        'frequencies': frequencies,
+        'z': z,
+        'resistance': z.real,
+        'reactance': z.imag,
+        'inductance': inductance,
+        'capacitance': capacitance,
+        'return_loss': nanovna_analysis.calculate_return_loss(s11),
+        'vswr': nanovna_analysis.calculate_vswr(s11),
+        'q': q_factor(z),
+        'group_delay': group_delay(frequencies, s11),
+    }
+
+
+def analyze_impedance(frequencies, s11=None, z0=Z0):
+    """Сводка для антенн и согласующих цепей: лучшее согласование и резонансы"""
+    table = impedance_table(frequencies, s11, z0)
+    if len(table['frequencies']) == 0:
+        return {'best_freq': None, 'best_vswr': None, 'best_r': None, 'best_x': None,
+                'best_return_loss': None, 'resonances': []}
+    best = int(np.argmin(table['vswr']))
+    return {
+        'best_freq': float(table['frequencies'][best]),
+        'best_vswr': float(table['vswr'][best]),
+        'best_r': float(table['resistance'][best]),
+        'best_x': float(table['reactance'][best]),
+        'best_return_loss': float(table['return_loss'][best]),
+        'resonances': find_resonances(table['frequencies'], table['z']),
+    }
+
+
+def format_reactance(freq, x):
+    """Реактивность как эквивалент: "12.3 нГн" или "4.5 пФ" """
+    if not np.isfinite(x) or x == 0 or freq <= 0:
+        return "-"
+    omega = 2 * np.pi * freq
+    if x > 0:
+        return f"{x / omega * 1e9:.2f} нГн"
+    return f"{-1 / (omega * x) * 1e12:.2f} пФ"
+
+
+def print_impedance(table, summary, step=None):
+    frequencies = table['frequencies']
+    if summary['best_freq'] is None:
+        print("Нет данных S11")
+        return
+    print(f"\nЛучшее согласование: {summary['best_freq']/1e6:.3f} МГц, "
+          f"КСВ {summary['best_vswr']:.2f}, Z = {summary['best_r']:.1f} "
+          f"{'+' if summary['best_x'] >= 0 else '-'} j{abs(summary['best_x']):.1f} Ом, "
+          f"RL {summary['best_return_loss']:.1f} дБ")
+    if summary['resonances']:
+        print("Резонансы (X = 0):")
+        for resonance in summary['resonances']:
+            kind = "последовательный" if resonance['type'] == 'series' else "параллельный"
+            print(f"  {resonance['freq']/1e6:10.3f} МГц  R = {resonance['resistance']:8.1f} Ом  {kind}")
+    else:
+        print("Резонансов (X = 0) в диапазоне нет")
+
+    step = step or max(1, len(frequencies) // 20)
+    print(f"\n{'Частота(МГц)':>12} {'R(Ом)':>9} {'X(Ом)':>9} {'Экв.':>11} {'КСВ':>7} {'Q':>7} {'τ(нс)':>8}")
+    for i in range(0, len(frequencies), step):
+        print(f"{frequencies[i]/1e6:12.3f} {table['resistance'][i]:9.1f} {table['reactance'][i]:9.1f} "
+              f"{format_reactance(frequencies[i], table['reactance'][i]):>11} "
+              f"{table['vswr'][i]:7.2f} {table['q'][i]:7.1f} {table['group_delay'][i]*1e9:8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Импеданс, резонансы и эквиваленты по S11")
+    parser.add_argument('--port', default='/dev/ttyACM0')
+    parser.add_argument('--range', type=float, nargs=2, default=(1e6, 300e6), metavar=('START', 'STOP'))
+    parser.add_argument('--points', type=int, default=201)
+    parser.add_argument('--cal-slot', type=int)
+    parser.add_argument('--sweep-time', type=float, default=1.0)
+    parser.add_argument('--z0', type=float, default=Z0)
+    args = parser.parse_args()
+
+    with NanoVNA(args.port) as vna:
+        sweep = vna.measure(args.range[0], args.range[1], args.points, args.cal_slot,
+                            (0,), args.sweep_time)
+    table = impedance_table(sweep, z0=args.z0)
+    print_impedance(table, analyze_impedance(sweep, z0=args.z0))
+
+
+if __name__ == "__main__":
+    main()
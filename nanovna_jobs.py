@@ -0,0 +1,332 @@
+"""
+Пакетное выполнение измерений по плану (JSON)
+
+Пример плана:
+{
+    "devices": ["/dev/ttyACM0", "/dev/ttyACM1"],
+    "jobs": [
+        {"name": "cable", "sweep": [1e6, 500e6, 101], "analysis": "cable",
+         "params": {"vf": 0.66}, "output": "cable_results_{timestamp}.txt", "every": 3600},
+        {"name": "fm_notch", "sweep": [30e6, 250e6, 101], "cal_slot": 0,
+         "analysis": "filter", "output": "filter_response_{timestamp}.txt", "every": 3600},
+        {"name": "fm_notch_fine", "sweep": [30e6, 250e6, 51], "cal_slot": 0, "analysis": "filter",
+         "adaptive": {"zoom_points": 21, "max_features": 1}}
+    ],
+    "cache": "sweeps"
+}
+
+Задания с одинаковыми диапазоном и слотом калибровки выполняются за одно
+сканирование, а группы раздаются устройствам так, чтобы лишний раз не
+отправлять sweep / cal load. Если задан "cache", сырые сканирования
+сохраняются для повторного анализа (см. nanovna_cache.py).
+
+"adaptive" - грубое сканирование с числом точек из sweep и узкие проходы
+вокруг минимумов (параметры adaptive_measure из nanovna_adaptive.py).
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import nanovna_analysis
+import nanovna_impedance
+from nanovna_adaptive import adaptive_measure
+from nanovna_cache import SweepCache
+from nanovna_device import NanoVNA
+from nanovna_metrics import METRICS
+from nanovna_trace import TRACER, span
+
+# Анализ -> (нужные каналы, функция от (сканирование, параметры))
+ANALYSES = {
+    'cable': ((0,), lambda sweep, params: nanovna_analysis.analyze_cable(
+        sweep['frequencies'], sweep['data0'], **params)),
+    'filter': ((1,), lambda sweep, params: nanovna_analysis.analyze_filter(
+        sweep['frequencies'], sweep['data1'], **params)),
+    'two_port': ((0, 1), lambda sweep, params: nanovna_analysis.analyze_two_port(
+        sweep['frequencies'], sweep['data0'], sweep['data1'], **params)),
+    'impedance': ((0,), lambda sweep, params: nanovna_impedance.analyze_impedance(
+        sweep['frequencies'], sweep['data0'], **params)),
+    'raw': ((), lambda sweep, params: {}),
+}
+
+
+def load_plan(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        plan = json.load(f)
+    plan['jobs'] = [normalize_job(job, i) for i, job in enumerate(plan.get('jobs', []))]
+    if not plan['jobs']:
+        raise ValueError("В плане нет заданий")
+    if not plan.get('devices'):
+        raise ValueError("В плане не указаны устройства")
+    return plan
+
+
+def normalize_job(job, index=0):
+    """Приведение описания задания к единому виду"""
+    analysis = job.get('analysis', 'raw')
+    if analysis not in ANALYSES:
+        raise ValueError(f"Неизвестный анализ '{analysis}' в задании {index}")
+
+    sweep = job['sweep']
+    if isinstance(sweep, dict):
+        sweep = (sweep['start'], sweep['stop'], sweep.get('points', 101))
+    start, stop, points = sweep
+
+    channels = set(job.get('channels', ()))
+    channels.update(ANALYSES[analysis][0])
+    return {
+        'name': job.get('name', f"job{index}"),
+        'sweep': (int(start), int(stop), int(points)),
+        'cal_slot': job.get('cal_slot'),
+        'channels': tuple(sorted(channels)),
+        'analysis': analysis,
+        'params': job.get('params', {}),
+        'output': job.get('output'),
+        'every': job.get('every'),
+        'adaptive': job.get('adaptive'),
+    }
+
+
+def group_jobs(jobs):
+    """Группировка заданий по (слот калибровки, диапазон, режим) - одно сканирование на группу"""
+    groups = {}
+    for job in jobs:
+        adaptive = json.dumps(job['adaptive'], sort_keys=True) if job['adaptive'] else None
+        key = (job['cal_slot'], job['sweep'], adaptive)
+        groups.setdefault(key, []).append(job)
+
+    result = []
+    for (cal_slot, sweep, _), group in groups.items():
+        channels = sorted({ch for job in group for ch in job['channels']})
+        result.append({'cal_slot': cal_slot, 'sweep': sweep, 'adaptive': group[0]['adaptive'],
+                       'channels': tuple(channels), 'jobs': group})
+    # Группы с одним слотом идут подряд
+    result.sort(key=lambda g: (g['cal_slot'] is not None, g['cal_slot'] or 0, g['sweep']))
+    return result
+
+
+def write_output(path, job, device, sweep, result):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    if path.endswith('.json'):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'job': job['name'], 'device': device, 'time': datetime.now().isoformat(),
+                       'sweep': job['sweep'], 'cal_slot': job['cal_slot'], 'result': result,
+                       'frequencies': sweep['frequencies'].tolist()},
+                      f, ensure_ascii=False, indent=2, default=float)
+        return
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"Результаты задания {job['name']}\n")
+        f.write(f"Время: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        f.write(f"Устройство: {device}\n")
+        f.write(f"Диапазон: {job['sweep'][0]} - {job['sweep'][1]} Гц, {job['sweep'][2]} точек\n")
+        f.write(f"Слот калибровки: {job['cal_slot']}\n\n")
+        for key, value in result.items():
+            f.write(f"{key}: {value}\n")
+
+        columns = [sweep['frequencies'] / 1e6]
+        header = ["Частота(МГц)"]
+        for channel in job['channels']:
+            data = sweep[f"data{channel}"]
+            columns += [data.real, data.imag]
+            header += [f"Real{channel}", f"Imag{channel}"]
+        n = min(len(c) for c in columns)
+        f.write("\nИзмеренные данные:\n")
+        f.write('\t'.join(header) + '\n')
+        for row in zip(*(c[:n] for c in columns)):
+            f.write(f"{row[0]:.6f}\t" + '\t'.join(f"{v:.6f}" for v in row[1:]) + '\n')
+
+
+class JobRunner:
+    """Раздача групп заданий по устройствам; каждое устройство - свой поток"""
+
+    def __init__(self, devices, sweep_time=1.0, vna_factory=NanoVNA, cache=None):
+        self.device_names = list(devices)
+        self.sweep_time = sweep_time
+        self.cache = cache
+        self.vna_factory = vna_factory
+        self.vnas = {}
+        self.lock = threading.Lock()
+
+    def _get_vna(self, device):
+        vna = self.vnas.get(device)
+        if vna is None:
+            print(f"Подключение к {device}...")
+            vna = self.vna_factory(device).open()
+            self.vnas[device] = vna
+        return vna
+
+    def _pick_group(self, pending, device, vna):
+        """
+        Выбор группы, требующей меньше всего команд на этом устройстве;
+        группы, уже не выполненные на нем, пропускаются. None - брать нечего.
+        """
+        def cost(group):
+            state = vna.cal_slot if vna else None
+            sweep = vna.sweep_state if vna else None
+            c = 0
+            if group['cal_slot'] is not None and group['cal_slot'] != state:
+                c += 2
+            if group['sweep'] != sweep:
+                c += 1
+            return c
+        candidates = [i for i, group in enumerate(pending) if device not in group.get('failed_on', ())]
+        if not candidates:
+            return None
+        best = min(candidates, key=lambda i: cost(pending[i]))
+        return pending.pop(best)
+
+    def _worker(self, device, pending, results):
+        while True:
+            with self.lock:
+                group = self._pick_group(pending, device, self.vnas.get(device))
+                if group is None:
+                    return
+            try:
+                vna = self._get_vna(device)
+                start, stop, points = group['sweep']
+                if group['adaptive']:
+                    sweep, _ = adaptive_measure(vna, start, stop, points,
+                                                cal_slot=group['cal_slot'],
+                                                channels=group['channels'],
+                                                sweep_time=self.sweep_time, **group['adaptive'])
+                else:
+                    sweep = vna.measure(start, stop, points, group['cal_slot'],
+                                        group['channels'], self.sweep_time)
+            except Exception as e:
+                print(f"Ошибка на {device}: {e}")
+                self.close_device(device)
+                # Группа возвращается в очередь для других устройств, поток
+                # продолжает работу (порт переоткроется при следующей группе)
+                with self.lock:
+                    group.setdefault('failed_on', set()).add(device)
+                    group['error'] = (device, str(e))
+                    pending.append(group)
+                continue
+
+            cache_error = None
+            if self.cache is not None:
+                try:
+                    self.cache.store(device, group['sweep'], group['cal_slot'], sweep)
+                except Exception as e:
+                    print(f"Ошибка записи в кэш на {device}: {e}")
+                    cache_error = f"не сохранено в кэш: {e}"
+            for job in group['jobs']:
+                entry = self._run_analysis(job, device, sweep)
+                if cache_error and 'error' not in entry:
+                    entry['error'] = cache_error
+                results.append(entry)
+
+    def _run_analysis(self, job, device, sweep):
+        try:
+            with METRICS.timer('nanovna_analysis_seconds', analysis=job['analysis']), \
+                    span('analysis', analysis=job['analysis'], job=job['name']):
+                result = ANALYSES[job['analysis']][1](sweep, job['params'])
+        except Exception as e:
+            print(f"Ошибка анализа {job['name']}: {e}")
+            return {'job': job['name'], 'device': device, 'error': str(e)}
+
+        entry = {'job': job['name'], 'device': device, 'result': result}
+        if job['output']:
+            path = job['output'].format(
+                name=job['name'], device=os.path.basename(device),
+                timestamp=datetime.now().strftime("%Y%m%d_%H%M%S"))
+            try:
+                with METRICS.timer('nanovna_save_seconds', kind='job_output'), span('save', path=path):
+                    write_output(path, job, device, sweep, result)
+            except Exception as e:
+                # Результат анализа остается в записи, ошибка - рядом
+                print(f"Ошибка сохранения {job['name']}: {e}")
+                entry['error'] = f"не сохранено в {path}: {e}"
+                return entry
+            entry['output'] = path
+            print(f"{job['name']}: результаты сохранены в {path}")
+        return entry
+
+    def run_batch(self, jobs):
+        """Однократное выполнение списка заданий на всех устройствах"""
+        pending = group_jobs(jobs)
+        results = []
+        print(f"Заданий: {len(jobs)}, сканирований: {len(pending)}, устройств: {len(self.device_names)}")
+        while True:
+            # Устройства, которым есть что взять; повторяем, пока после сбоев
+            # в очереди остаются группы для еще не пробовавших их устройств
+            devices = [device for device in self.device_names
+                       if any(device not in group.get('failed_on', ()) for group in pending)]
+            if not devices:
+                break
+            threads = [threading.Thread(target=self._worker, args=(device, pending, results), daemon=True)
+                       for device in devices[:len(pending)]]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        # Группы, не выполненные ни на одном устройстве
+        for group in pending:
+            device, error = group['error']
+            results.extend({'job': job['name'], 'device': device, 'error': error} for job in group['jobs'])
+        return results
+
+    def run_schedule(self, jobs, once=False):
+        """Повторение заданий с периодом every (сек); задания без периода выполняются один раз"""
+        next_due = {i: 0.0 for i in range(len(jobs))}
+        while next_due:
+            now = time.monotonic()
+            due = [i for i, t in next_due.items() if t <= now]
+            if due:
+                self.run_batch([jobs[i] for i in due])
+                for i in due:
+                    every = jobs[i]['every']
+                    if every and not once:
+                        next_due[i] = now + every
+                    else:
+                        del next_due[i]
+            if next_due:
+                time.sleep(max(0.0, min(next_due.values()) - time.monotonic()))
+
+    def close_device(self, device):
+        vna = self.vnas.pop(device, None)
+        if vna:
+            vna.close()
+
+    def close(self):
+        for device in list(self.vnas):
+            self.close_device(device)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетные измерения NanoVNA по плану")
+    parser.add_argument('plan', help="JSON-файл плана")
+    parser.add_argument('--once', action='store_true', help="выполнить задания один раз")
+    parser.add_argument('--sweep-time', type=float, default=1.0, help="время одного сканирования, с")
+    parser.add_argument('--metrics-port', type=int, help="порт HTTP-сервера метрик Prometheus")
+    parser.add_argument('--metrics-host', default='127.0.0.1',
+                        help="адрес сервера метрик (0.0.0.0 - доступ со всех интерфейсов)")
+    parser.add_argument('--metrics-json', help="файл для сохранения метрик при завершении")
+    parser.add_argument('--trace', help="файл трассы в формате Chrome trace")
+    args = parser.parse_args()
+
+    plan = load_plan(args.plan)
+    if args.metrics_port:
+        METRICS.serve(args.metrics_port, args.metrics_host)
+    if args.trace:
+        TRACER.enable()
+    cache = SweepCache(plan['cache']) if plan.get('cache') else None
+    runner = JobRunner(plan['devices'], sweep_time=args.sweep_time, cache=cache)
+    try:
+        runner.run_schedule(plan['jobs'], once=args.once)
+    except KeyboardInterrupt:
+        print("\nВыполнение прервано")
+    finally:
+        runner.close()
+        if args.metrics_json:
+            METRICS.dump_json(args.metrics_json)
+        if args.trace:
+            TRACER.export(args.trace)
+            print(f"Трасса сохранена в: {args.trace}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Проверка годен/не годен по маскам допусков
+
+Маска - набор кусочно-линейных верхних и нижних границ для величин
+сканирования (S21 дБ, S11 дБ, КСВ). Граница интерполируется на сетку
+частот сканирования (np.interp), запас считается сразу для всех точек,
+поэтому проверка занимает доли миллисекунды.
+
+Пример маски (JSON):
+{
+    "name": "fm_notch",
+    "limits": [
+        {"name": "fm_rejection", "quantity": "s21_db", "upper": [[87.5e6, -30], [108e6, -30]]},
+        {"name": "passband", "quantity": "s21_db", "lower": [[30e6, -3], [70e6, -3]]},
+        {"name": "vswr", "quantity": "vswr", "upper": [[30e6, 2.0], [250e6, 2.0]]}
+    ]
+}
+
+Пример:
+  python nanovna_limits.py fm_notch.json --port /dev/ttyACM0 --range 30e6 250e6 --cal-slot 0
+"""
+import argparse
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+
+import nanovna_analysis
+from nanovna_device import NanoVNA
+
+DEFAULT_LOG_FILE = "limit_test_log.txt"
+
+# Величина -> (канал, функция от данных канала)
+QUANTITIES = {
+    's21_db': (1, nanovna_analysis.calculate_s21_db),
+    's11_db': (0, nanovna_analysis.calculate_s21_db),
+    'vswr': (0, nanovna_analysis.calculate_vswr),
+}
+
+# Итог проверки: INCOMPLETE - нарушений нет, но часть границ не проверена
+# (нет данных канала или точек в диапазоне границы)
+STATUS_TEXT = {'PASS': 'ГОДЕН', 'FAIL': 'НЕ ГОДЕН', 'INCOMPLETE': 'НЕ ПРОВЕРЕН ПОЛНОСТЬЮ'}
+
+
+def sweep_quantities(sweep, names):
+    """Величины для проверки по данным сканирования (только те, для которых есть канал)"""
+    result = {}
+    for name in names:
+        channel, fn = QUANTITIES[name]
+        data = sweep.get(f"data{channel}")
+        if data is not None and len(data):
+            result[name] = fn(data)
+    return result
+
+
+class Limit:
+    """Одна граница: величина, кусочно-линейные upper и/или lower"""
+
+    def __init__(self, name, quantity, upper=None, lower=None):
+        if quantity not in QUANTITIES:
+            raise ValueError(f"Неизвестная величина '{quantity}' в границе {name}")
+        if upper is None and lower is None:
+            raise ValueError(f"Граница {name} не задает ни upper, ни lower")
+        self.name = name
+        self.quantity = quantity
+        self.upper = self._segments(upper)
+        self.lower = self._segments(lower)
+
+    @staticmethod
+    def _segments(points):
+        if points is None:
+            return None
+        points = np.asarray(points, dtype=np.float64)
+        order = np.argsort(points[:, 0], kind='stable')
+        return points[order, 0], points[order, 1]
+
+    def evaluate(self, frequencies, values):
+        """Запас по точкам внутри диапазона границы (отрицательный - нарушение)"""
+        margins = []
+        for bound, sign in ((self.upper, 1), (self.lower, -1)):
+            if bound is None:
+                continue
+            mask_freq, mask_value = bound
+            inside = (frequencies >= mask_freq[0]) & (frequencies <= mask_freq[-1])
+            limit = np.interp(frequencies[inside], mask_freq, mask_value)
+            margin = np.full(len(frequencies), np.inf)
+            margin[inside] = sign * (limit - values[inside])
+            margins.append(margin)
+        margin = np.minimum.reduce(margins) if len(margins) > 1 else margins[0]
+
+        if not np.isfinite(margin).any():
+            # Ни одной точки в диапазоне границы - проверка не выполнена
+            return {'name': self.name, 'quantity': self.quantity, 'passed': False,
+                    'incomplete': True, 'worst_margin': None, 'worst_freq': None,
+                    'failed_points': 0}
+        worst = int(np.argmin(margin))
+        return {
+            'name': self.name,
+            'quantity': self.quantity,
+            'passed': bool(margin[worst] >= 0),
+            'incomplete': False,
+            'worst_margin': float(margin[worst]),
+            'worst_freq': float(frequencies[worst]),
+            'failed_points': int(np.count_nonzero(margin < 0)),
+        }
+
+
+class LimitMask:
+    def __init__(self, name, limits):
+        self.name = name
+        self.limits = [limit if isinstance(limit, Limit) else Limit(**limit) for limit in limits]
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            spec = json.load(f)
+        return cls(spec.get('name', os.path.splitext(os.path.basename(path))[0]), spec['limits'])
+
+    @property
+    def quantities(self):
+        return sorted({limit.quantity for limit in self.limits})
+
+    def evaluate(self, frequencies, quantities):
+        """
+        Проверка величин {имя: массив} на сетке frequencies.
+        Границы по величинам, которых нет в quantities, пропускаются;
+        пропущенная граница или граница без точек дает итог INCOMPLETE,
+        если нет нарушений (годен - только PASS).
+        """
+        frequencies = np.asarray(frequencies, dtype=np.float64)
+        results = []
+        skipped = []
+        for limit in self.limits:
+            values = quantities.get(limit.quantity)
+            if values is None:
+                skipped.append(limit.name)
+                continue
+            n = min(len(frequencies), len(values))
+            results.append(limit.evaluate(frequencies[:n], np.asarray(values[:n], dtype=np.float64)))
+
+        checked = [r for r in results if not r['incomplete']]
+        worst = min(checked, key=lambda r: r['worst_margin']) if checked else None
+        if not all(r['passed'] for r in checked):
+            status = 'FAIL'
+        elif skipped or len(checked) < len(results):
+            status = 'INCOMPLETE'
+        else:
+            status = 'PASS'
+        return {
+            'mask': self.name,
+            'status': status,
+            'passed': status == 'PASS',
+            'worst_margin': worst['worst_margin'] if worst else None,
+            'worst_limit': worst['name'] if worst else None,
+            'worst_freq': worst['worst_freq'] if worst else None,
+            'limits': results,
+            'skipped': skipped,
+        }
+
+    def evaluate_sweep(self, sweep):
+        """Проверка словаря сканирования (frequencies, data0, data1)"""
+        return self.evaluate(sweep['frequencies'], sweep_quantities(sweep, self.quantities))
+
+
+def log_result(result, serial_number, path=DEFAULT_LOG_FILE):
+    """Запись результата проверки DUT в журнал (одна строка через табуляцию)"""
+    new_file = not os.path.exists(path)
+    with open(path, 'a', encoding='utf-8') as f:
+        if new_file:
+            f.write("Время\tСерийный номер\tМаска\tРезультат\tХудший запас\tГраница\tЧастота(МГц)\n")
+        margin = result['worst_margin']
+        freq = result['worst_freq']
+        f.write('\t'.join([
+            datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            str(serial_number),
+            result['mask'],
+            result['status'],
+            f"{margin:.3f}" if margin is not None else "-",
+            result['worst_limit'] or "-",
+            f"{freq/1e6:.3f}" if freq is not None else "-",
+        ]) + '\n')
+
+
+def print_result(result, serial_number=None):
+    title = f"DUT {serial_number}: " if serial_number else ""
+    print(f"\n{title}{STATUS_TEXT[result['status']]} (маска {result['mask']})")
+    for limit in result['limits']:
+        if limit['incomplete']:
+            print(f"  {limit['name']:20} не проверена - нет точек в диапазоне границы")
+            continue
+        status = "OK" if limit['passed'] else f"нарушение в {limit['failed_points']} точках"
+        print(f"  {limit['name']:20} запас {limit['worst_margin']:+.2f} "
+              f"на {limit['worst_freq']/1e6:.2f} МГц  {status}")
+    for name in result['skipped']:
+        print(f"  {name:20} не проверена - нет данных канала")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка DUT по маске допусков")
+    parser.add_argument('mask', help="JSON-файл маски")
+    parser.add_argument('--port', default='/dev/ttyACM0')
+    parser.add_argument('--range', type=float, nargs=2, default=(30e6, 250e6), metavar=('START', 'STOP'))
+    parser.add_argument('--points', type=int, default=101)
+    parser.add_argument('--cal-slot', type=int)
+    parser.add_argument('--sweep-time', type=float, default=1.0)
+    parser.add_argument('--log', default=DEFAULT_LOG_FILE, help="журнал результатов")
+    parser.add_argument('--serial', help="серийный номер DUT (без него - запрос для каждого DUT)")
+    args = parser.parse_args()
+
+    mask = LimitMask.load(args.mask)
+    channels = tuple(sorted({QUANTITIES[name][0] for name in mask.quantities}))
+    with NanoVNA(args.port) as vna:
+        while True:
+            serial_number = args.serial or input("\nСерийный номер DUT (Enter - выход): ").strip()
+            if not serial_number:
+                break
+            sweep = vna.measure(args.range[0], args.range[1], args.points, args.cal_slot,
+                                channels, args.sweep_time)
+            result = mask.evaluate_sweep(sweep)
+            print_result(result, serial_number)
+            log_result(result, serial_number, args.log)
+            if args.serial:
+                break
+    print(f"Журнал: {args.log}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Метрики работы с NanoVNA: задержки команд, объем данных, таймауты,
+время парсинга и анализа.
+
+Экспорт в текстовом формате Prometheus (HTTP /metrics) и в JSON-файл.
+Переменные окружения для скриптов:
+  NANOVNA_METRICS_PORT - порт HTTP-сервера метрик
+  NANOVNA_METRICS_HOST - адрес сервера (по умолчанию 127.0.0.1 - только
+                         локально; 0.0.0.0 - все интерфейсы)
+  NANOVNA_METRICS_JSON - файл, куда сохранить метрики при завершении
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Границы корзин гистограмм в секундах
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    'nanovna_command_seconds': "Время выполнения команды (от отправки до приглашения ch>)",
+    'nanovna_command_timeouts_total': "Команды, не дождавшиеся приглашения ch>",
+    'nanovna_command_retries_total': "Повторы идемпотентных команд после сбоя",
+    'nanovna_resyncs_total': "Ресинхронизации протокола (сброшенные хвосты ответов)",
+    'nanovna_bytes_sent_total': "Отправлено байт в порт",
+    'nanovna_bytes_received_total': "Получено байт из порта",
+    'nanovna_parse_seconds': "Время парсинга ответов",
+    'nanovna_analysis_seconds': "Время анализа данных",
+    'nanovna_sweep_seconds': "Время получения одного сканирования",
+    'nanovna_save_seconds': "Время сохранения графиков и файлов результатов",
+    'nanovna_stream_frames_total': "Кадров отправлено клиентам трансляции",
+    'nanovna_stream_bytes_total': "Байт отправлено клиентам трансляции",
+    'nanovna_drift_alarms_total': "Тревоги контроля кабелей по базовой линии",
+}
+
+
+def command_name(command):
+    """Имя команды для метки (без аргументов, чтобы не плодить ряды)"""
+    parts = command.split()
+    return parts[0] if parts else ''
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+
+class Metrics:
+    """Потокобезопасный реестр счетчиков и гистограмм с метками"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def to_prometheus(self):
+        """Текстовый формат экспозиции Prometheus"""
+        def fmt_labels(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ''
+            body = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                            for k, v in items)
+            return '{' + body + '}'
+
+        lines = []
+        seen = set()
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                    lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name}{fmt_labels(labels)} {value}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                    lines.append(f"# TYPE {name} histogram")
+                for bound, total in histogram.cumulative():
+                    lines.append(f"{name}_bucket{fmt_labels(labels, [('le', bound)])} {total}")
+                lines.append(f"{name}_bucket{fmt_labels(labels, [('le', '+Inf')])} {histogram.count}")
+                lines.append(f"{name}_sum{fmt_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{fmt_labels(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self):
+        with self.lock:
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            histograms = [{'name': name, 'labels': dict(labels), 'count': h.count, 'sum': h.sum,
+                           'avg': h.sum / h.count if h.count else None,
+                           'buckets': dict(zip(map(str, h.buckets), h.counts))}
+                          for (name, labels), h in sorted(self.histograms.items())]
+        return {'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'counters': counters,
+                'histograms': histograms}
+
+    def dump_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        return path
+
+    def serve(self, port=9100, host='127.0.0.1'):
+        """HTTP-сервер метрик в отдельном потоке: /metrics и /metrics.json"""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith('/metrics.json'):
+                    body = json.dumps(metrics.to_dict(), ensure_ascii=False).encode('utf-8')
+                    content_type = 'application/json; charset=utf-8'
+                elif self.path.startswith('/metrics'):
+                    body = metrics.to_prometheus().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Метрики доступны на http://{host}:{port}/metrics")
+        return server
+
+
+METRICS = Metrics()
+
+
+def start_from_env():
+    """Запуск HTTP-сервера метрик, если задан NANOVNA_METRICS_PORT"""
+    port = os.environ.get('NANOVNA_METRICS_PORT')
+    if port:
+        return METRICS.serve(int(port), os.environ.get('NANOVNA_METRICS_HOST', '127.0.0.1'))
+    return None
+
+
+def dump_from_env():
+    """Сохранение метрик в NANOVNA_METRICS_JSON, если переменная задана"""
+    path = os.environ.get('NANOVNA_METRICS_JSON')
+    if path:
+        METRICS.dump_json(path)
+        print(f"Метрики сохранены в: {path}")
+    return path
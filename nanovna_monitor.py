@@ -0,0 +1,282 @@
+"""
+Контроль фидеров: базовая линия и тревоги по изменению
+
+Базовая линия - среднее S11 нескольких сканирований исправного кабеля,
+разброс по точкам (шум) и рефлектограмма. Каждое новое сканирование
+сравнивается с ней одним проходом NumPy:
+  complex_rms / complex_max - отклонение комплексного S11 от базы;
+  tdr_delta, tdr_distance   - наибольшее изменение рефлектограммы и где оно;
+  band_rl_db                - изменение средних возвратных потерь по полосам.
+Каждая величина делится на свой порог, максимум - оценка (score).
+
+Тревога с гистерезисом: поднимается после hold сканирований подряд с
+score >= raise_at, снимается после hold сканирований с score < clear_at.
+Повторная тревога раньше min_interval после предыдущего уведомления не
+сообщается (дребезг), но состояние учитывается.
+
+Пример:
+  python nanovna_monitor.py baseline mast_feed --port /dev/ttyACM0 --range 1e6 300e6 --cal-slot 0
+  python nanovna_monitor.py watch mast_feed roof_feed --interval 60
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+import nanovna_analysis
+from nanovna_device import NanoVNA, ProtocolError
+from nanovna_metrics import METRICS
+from nanovna_sweep import Sweep
+
+DEFAULT_STORE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'nanovna', 'baselines')
+DEFAULT_LOG_FILE = "drift_log.txt"
+
+# Пороги величин: при таком отклонении score = 1
+THRESHOLDS = {
+    'complex_rms': 0.02,
+    'complex_max': 0.08,
+    'tdr_delta': 0.05,
+    'band_rl_db': 1.5,
+}
+# Отклонение в единицах шума базовой линии, ниже которого изменение не считается
+NOISE_SIGMAS = 5
+NOISE_FLOOR = 1e-3
+
+
+def default_bands(frequencies, count=4):
+    """Диапазон сканирования, разбитый на count равных полос"""
+    edges = np.linspace(frequencies[0], frequencies[-1], count + 1)
+    return [(float(lo), float(hi)) for lo, hi in zip(edges[:-1], edges[1:])]
+
+
+class Baseline:
+    def __init__(self, name, frequencies, s11, noise, device=None, plan=None, cal_slot=None,
+                 vf=0.66, bands=None, thresholds=None, created=None):
+        self.name = name
+        self.frequencies = np.asarray(frequencies, dtype=np.float64)
+        self.s11 = np.asarray(s11, dtype=np.complex128)
+        self.noise = np.maximum(np.asarray(noise, dtype=np.float64), NOISE_FLOOR)
+        self.device = device
+        self.plan = tuple(plan) if plan else None
+        self.cal_slot = cal_slot
+        self.vf = vf
+        self.bands = bands or default_bands(self.frequencies)
+        self.thresholds = dict(THRESHOLDS, **(thresholds or {}))
+        self.created = created or datetime.now().isoformat(timespec='seconds')
+
+        # Все, что не зависит от нового сканирования, считается один раз
+        self.tdr_distance, self.tdr = nanovna_analysis.tdr(self.frequencies, self.s11, vf)
+        lo, hi = np.array(self.bands, dtype=np.float64).T
+        self.band_mask = ((self.frequencies >= lo[:, None]) & (self.frequencies <= hi[:, None])).astype(np.float64)
+        self.band_count = np.maximum(self.band_mask.sum(axis=1), 1)
+        self.band_rl = self.band_mask @ nanovna_analysis.calculate_return_loss(self.s11) / self.band_count
+        noise_rms = float(np.sqrt(np.mean(self.noise ** 2)))
+        self.limits = dict(self.thresholds)
+        self.limits['complex_rms'] = max(self.thresholds['complex_rms'], NOISE_SIGMAS * noise_rms)
+        self.limits['complex_max'] = max(self.thresholds['complex_max'], NOISE_SIGMAS * float(np.max(self.noise)))
+
+    @classmethod
+    def capture(cls, name, sweeps, vf=0.66, bands=None, thresholds=None):
+        """Базовая линия по нескольким сканированиям (Sweep) одного кабеля"""
+        sweeps = [Sweep.from_dict(sweep) for sweep in sweeps]
+        n = min(sweep.points for sweep in sweeps)
+        data = np.array([sweep.data0[:n] for sweep in sweeps])
+        noise = np.std(data, axis=0) if len(sweeps) > 1 else np.zeros(n)
+        first = sweeps[0]
+        return cls(name, first.frequencies[:n], data.mean(axis=0), noise, first.device,
+                   first.plan, first.cal_slot, vf, bands, thresholds)
+
+    def path(self, store_dir=DEFAULT_STORE_DIR):
+        return os.path.join(store_dir, f"{self.name}.npz")
+
+    def save(self, store_dir=DEFAULT_STORE_DIR):
+        os.makedirs(store_dir, exist_ok=True)
+        meta = {'name': self.name, 'device': self.device, 'plan': self.plan, 'cal_slot': self.cal_slot,
+                'vf': self.vf, 'bands': self.bands, 'thresholds': self.thresholds, 'created': self.created}
+        np.savez(self.path(store_dir), frequencies=self.frequencies, s11=self.s11, noise=self.noise,
+                 meta=np.array(json.dumps(meta, ensure_ascii=False)))
+        return self.path(store_dir)
+
+    @classmethod
+    def load(cls, name, store_dir=DEFAULT_STORE_DIR):
+        path = name if name.endswith('.npz') else os.path.join(store_dir, f"{name}.npz")
+        with np.load(path) as f:
+            meta = json.loads(str(f['meta']))
+            return cls(meta.pop('name'), f['frequencies'], f['s11'], f['noise'], **meta)
+
+    def compare(self, sweep, s11=None):
+        """Отклонения сканирования от базовой линии и общая оценка score"""
+        frequencies, s11, _ = nanovna_analysis.sweep_arrays(sweep, s11)
+        frequencies = np.asarray(frequencies, dtype=np.float64)
+        s11 = np.asarray(s11, dtype=np.complex128)
+        n = min(len(frequencies), len(s11))
+        if n != len(self.frequencies) or not np.allclose(frequencies[:n], self.frequencies):
+            # Другая сетка частот - переносим на сетку базовой линии
+            s11 = (np.interp(self.frequencies, frequencies[:n], s11[:n].real) +
+                   1j * np.interp(self.frequencies, frequencies[:n], s11[:n].imag))
+
+        distance = np.abs(s11 - self.s11)
+        worst = int(np.argmax(distance))
+        _, tdr = nanovna_analysis.tdr(self.frequencies, s11, self.vf)
+        tdr_diff = np.abs(tdr - self.tdr)
+        tdr_worst = int(np.argmax(tdr_diff))
+        band_delta = self.band_mask @ nanovna_analysis.calculate_return_loss(s11) / self.band_count - self.band_rl
+        band_worst = int(np.argmax(np.abs(band_delta)))
+
+        values = {
+            'complex_rms': float(np.sqrt(np.mean(distance ** 2))),
+            'complex_max': float(distance[worst]),
+            'tdr_delta': float(tdr_diff[tdr_worst]),
+            'band_rl_db': float(abs(band_delta[band_worst])),
+        }
+        ratios = {key: value / self.limits[key] for key, value in values.items()}
+        cause = max(ratios, key=ratios.get)
+        return dict(values, **{
+            'score': float(ratios[cause]),
+            'cause': cause,
+            'complex_max_freq': float(self.frequencies[worst]),
+            'tdr_distance': float(self.tdr_distance[tdr_worst]),
+            'band_deltas_db': [float(v) for v in band_delta],
+            'worst_band': self.bands[band_worst],
+        })
+
+
+class DriftAlarm:
+    """Тревога с гистерезисом и ограничением частоты уведомлений"""
+
+    def __init__(self, raise_at=1.0, clear_at=0.7, hold=2, min_interval=600.0):
+        self.raise_at = raise_at
+        self.clear_at = clear_at
+        self.hold = hold
+        self.min_interval = min_interval
+        self.active = False
+        self.count = 0
+        self.notified = False
+        self.last_notice = None
+        self.suppressed = 0
+
+    def update(self, score, now=None):
+        """Учет оценки; 'raised' / 'cleared', если об этом нужно сообщить, иначе None"""
+        now = time.monotonic() if now is None else now
+        crossing = score < self.clear_at if self.active else score >= self.raise_at
+        self.count = self.count + 1 if crossing else 0
+        if self.count < self.hold:
+            return None
+        self.count = 0
+        self.active = not self.active
+        if self.active:
+            if self.last_notice is not None and now - self.last_notice < self.min_interval:
+                # Дребезг: тревога учтена, но повторно не сообщается
+                self.notified = False
+                self.suppressed += 1
+                return None
+            self.notified = True
+            self.last_notice = now
+            return 'raised'
+        if not self.notified:
+            return None
+        self.notified = False
+        return 'cleared'
+
+
+def log_event(path, name, event, result):
+    new_file = not os.path.exists(path)
+    with open(path, 'a', encoding='utf-8') as f:
+        if new_file:
+            f.write("Время\tКабель\tСобытие\tОценка\tПричина\tRMS S11\tTDR\tРасстояние(м)\n")
+        f.write('\t'.join([
+            datetime.now().strftime('%Y-%m-%d %H:%M:%S'), name, event, f"{result['score']:.2f}",
+            result['cause'], f"{result['complex_rms']:.4f}", f"{result['tdr_delta']:.4f}",
+            f"{result['tdr_distance']:.2f}",
+        ]) + '\n')
+
+
+def capture_baseline(args):
+    with NanoVNA(args.port) as vna:
+        sweeps = []
+        for i in range(args.sweeps):
+            sweeps.append(vna.measure(args.range[0], args.range[1], args.points, args.cal_slot,
+                                      (0,), args.sweep_time))
+            print(f"Сканирование {i + 1}/{args.sweeps}")
+    baseline = Baseline.capture(args.name, sweeps, args.vf)
+    path = baseline.save(args.store)
+    print(f"Базовая линия {args.name}: {len(baseline.frequencies)} точек, "
+          f"шум S11 {np.sqrt(np.mean(baseline.noise ** 2)):.4f} (RMS)")
+    print(f"Сохранена в {path}")
+
+
+def watch(args):
+    baselines = [Baseline.load(name, args.store) for name in args.names]
+    alarms = {b.name: DriftAlarm(args.raise_at, args.clear_at, args.hold, args.min_interval)
+              for b in baselines}
+    vnas = {}
+    try:
+        while True:
+            started = time.monotonic()
+            for baseline in baselines:
+                device = args.port or baseline.device
+                try:
+                    vna = vnas.get(device) or vnas.setdefault(device, NanoVNA(device).open())
+                    start, stop, points = baseline.plan
+                    sweep = vna.measure(start, stop, points, baseline.cal_slot, (0,), args.sweep_time)
+                except (ProtocolError, OSError) as e:
+                    print(f"{baseline.name}: ошибка измерения на {device}: {e}")
+                    vna = vnas.pop(device, None)
+                    if vna:
+                        vna.close()
+                    continue
+                result = baseline.compare(sweep)
+                event = alarms[baseline.name].update(result['score'])
+                state = "ТРЕВОГА" if alarms[baseline.name].active else "норма"
+                print(f"{baseline.name}: {state}, оценка {result['score']:.2f} ({result['cause']}), "
+                      f"TDR {result['tdr_delta']:.3f} на {result['tdr_distance']:.2f} м")
+                if event:
+                    if event == 'raised':
+                        METRICS.inc('nanovna_drift_alarms_total', cable=baseline.name)
+                    print(f"*** {baseline.name}: {'тревога' if event == 'raised' else 'тревога снята'}")
+                    log_event(args.log, baseline.name, event, result)
+            if args.once:
+                break
+            time.sleep(max(0.0, args.interval - (time.monotonic() - started)))
+    finally:
+        for vna in vnas.values():
+            vna.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Контроль кабелей по базовой линии")
+    parser.add_argument('command', choices=['baseline', 'watch'])
+    parser.add_argument('names', nargs='+', help="имя базовой линии (для watch - несколько)")
+    parser.add_argument('--port', help="порт NanoVNA (для watch - вместо сохраненного в базовой линии)")
+    parser.add_argument('--range', type=float, nargs=2, default=(1e6, 300e6), metavar=('START', 'STOP'))
+    parser.add_argument('--points', type=int, default=201)
+    parser.add_argument('--cal-slot', type=int)
+    parser.add_argument('--sweep-time', type=float, default=1.0)
+    parser.add_argument('--sweeps', type=int, default=5, help="сканирований для базовой линии")
+    parser.add_argument('--vf', type=float, default=0.66)
+    parser.add_argument('--store', default=DEFAULT_STORE_DIR, help="каталог базовых линий")
+    parser.add_argument('--interval', type=float, default=60.0, help="период контроля, с")
+    parser.add_argument('--raise-at', type=float, default=1.0)
+    parser.add_argument('--clear-at', type=float, default=0.7)
+    parser.add_argument('--hold', type=int, default=2, help="сканирований подряд для смены состояния")
+    parser.add_argument('--min-interval', type=float, default=600.0, help="мин. интервал уведомлений, с")
+    parser.add_argument('--log', default=DEFAULT_LOG_FILE)
+    parser.add_argument('--once', action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'baseline':
+        args.name = args.names[0]
+        args.port = args.port or '/dev/ttyACM0'
+        capture_baseline(args)
+    else:
+        try:
+            watch(args)
+        except KeyboardInterrupt:
+            print("\nКонтроль остановлен")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Пакетные отчеты по сохраненным сканированиям
+
+Для каждого файла результатов (форматы nanovna_batch) строится отчет PNG
+или PDF: КСВ, фаза S11 и рефлектограмма (если S11 комплексный), S21 и
+границы маски допусков с итогом годен/не годен. Файлы раздаются пулу
+процессов, графики строятся бэкендом Agg - без дисплея и без блокировки
+процесса измерений. Рядом с отчетами пишется сводка report_index.tsv.
+
+Пример:
+  python nanovna_report.py /home/frolov --output reports --format pdf --mask fm_notch.json
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use('Agg')  # Без GUI: отчеты строятся в фоновых процессах
+import matplotlib.pyplot as plt
+import numpy as np
+
+import nanovna_analysis
+from nanovna_batch import find_files, parse_result_file
+from nanovna_limits import STATUS_TEXT, LimitMask
+
+# Панель -> (подпись оси, канал, функция от данных канала)
+PANELS = {
+    'vswr': ('КСВ', 0, nanovna_analysis.calculate_vswr),
+    's11_db': ('S11 (дБ)', 0, nanovna_analysis.calculate_s21_db),
+    'phase': ('Фаза S11 (°)', 0, lambda s11: np.degrees(nanovna_analysis.calculate_phase(s11))),
+    's21_db': ('S21 (дБ)', 1, nanovna_analysis.calculate_s21_db),
+}
+
+
+def report_panels(sweep, mask=None):
+    """Панели, для которых в сканировании есть данные"""
+    s11, s21 = sweep.get('data0'), sweep.get('data1')
+    panels = []
+    if s11 is not None:
+        panels.append('vswr')
+        if mask is not None and 's11_db' in mask.quantities:
+            panels.append('s11_db')
+        if np.iscomplexobj(s11):
+            panels += ['phase', 'tdr']
+    if s21 is not None:
+        panels.append('s21_db')
+    return panels
+
+
+def _plot_limits(ax, mask, quantity):
+    for limit in mask.limits:
+        if limit.quantity != quantity:
+            continue
+        for bound in (limit.upper, limit.lower):
+            if bound is not None:
+                ax.plot(bound[0] / 1e6, bound[1], 'r--', linewidth=1.5, label=limit.name)
+
+
+def render_report(sweep, path, title, mask=None, vf=0.66):
+    """Отчет по одному сканированию; результат проверки маской или None"""
+    panels = report_panels(sweep, mask)
+    if not panels:
+        raise ValueError("Нет данных для отчета")
+    result = mask.evaluate_sweep(sweep) if mask is not None else None
+    if result is not None:
+        title += f" - {STATUS_TEXT[result['status']]} ({result['mask']})"
+
+    frequencies_mhz = sweep['frequencies'] / 1e6
+    # Поля в дюймах вместо tight_layout - на отчет уходит заметно меньше времени
+    height = 3.2 * len(panels)
+    fig, axes = plt.subplots(len(panels), 1, figsize=(11, height), squeeze=False,
+                             gridspec_kw={'left': 0.08, 'right': 0.97, 'top': 1 - 0.45 / height,
+                                          'bottom': 0.6 / height, 'hspace': 0.45})
+    for ax, panel in zip(axes[:, 0], panels):
+        if panel == 'tdr':
+            distance, response = nanovna_analysis.tdr(sweep['frequencies'], sweep['data0'], vf)
+            ax.plot(distance, response, 'k-', linewidth=1)
+            ax.set_xlabel(f'Расстояние (м), VF={vf}')
+            ax.set_ylabel('Отражение')
+        else:
+            label, channel, fn = PANELS[panel]
+            values = fn(sweep[f"data{channel}"])
+            if panel == 'vswr':
+                values = np.minimum(values, 10)
+            ax.plot(frequencies_mhz, values, 'b-', linewidth=1.5)
+            ax.set_ylabel(label)
+            ax.set_xlabel('Частота (МГц)')
+            if mask is not None:
+                _plot_limits(ax, mask, panel)
+                if ax.get_legend_handles_labels()[0]:
+                    ax.legend(fontsize=8)
+        ax.grid(True, alpha=0.3)
+    axes[0, 0].set_title(title, fontsize=12, fontweight='bold',
+                         color='black' if result is None or result['passed'] else 'red')
+    fig.savefig(path, dpi=100)
+    plt.close(fig)
+    return result
+
+
+def render_file(path, output_dir, fmt='png', mask=None, vf=0.66):
+    """Отчет по файлу результатов; строка сводки (ошибки - в 'error')"""
+    name = os.path.splitext(os.path.basename(path))[0]
+    row = {'path': path, 'report': os.path.join(output_dir, f"{name}.{fmt}")}
+    try:
+        sweep = parse_result_file(path)
+    except (OSError, ValueError) as e:
+        row['error'] = str(e)
+        return row
+    # Сбой построения одного отчета не должен останавливать весь пул
+    try:
+        result = render_report(sweep, row['report'], f"{name} ({sweep['time']:%Y-%m-%d %H:%M})", mask, vf)
+    except Exception as e:
+        plt.close('all')
+        row['error'] = f"ошибка отчета: {type(e).__name__}: {e}"
+        return row
+    if result is not None:
+        row.update({'status': result['status'], 'passed': result['passed'],
+                    'worst_margin': result['worst_margin'],
+                    'worst_limit': result['worst_limit']})
+    return row
+
+
+def _render_chunk(paths, output_dir, fmt, mask, vf):
+    return [render_file(path, output_dir, fmt, mask, vf) for path in paths]
+
+
+def render_reports(files, output_dir, fmt='png', mask=None, vf=0.66, workers=None, chunk_size=8):
+    """Отчеты по списку файлов в пуле процессов; строки сводки в порядке files"""
+    os.makedirs(output_dir, exist_ok=True)
+    chunks = [files[i:i + chunk_size] for i in range(0, len(files), chunk_size)]
+    if len(chunks) <= 1 or workers == 1:
+        return [row for chunk in chunks for row in _render_chunk(chunk, output_dir, fmt, mask, vf)]
+    rows = []
+    n = len(chunks)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk_rows in pool.map(_render_chunk, chunks, [output_dir] * n, [fmt] * n,
+                                   [mask] * n, [vf] * n):
+            rows.extend(chunk_rows)
+    return rows
+
+
+def write_index(path, rows):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("Файл\tОтчет\tРезультат\tХудший запас\tГраница\n")
+        for row in rows:
+            if 'error' in row:
+                status = f"ошибка: {row['error']}"
+            elif 'status' in row:
+                status = row['status']
+            else:
+                status = "-"
+            margin = row.get('worst_margin')
+            f.write('\t'.join([row['path'], row['report'], status,
+                               f"{margin:.3f}" if margin is not None else "-",
+                               row.get('worst_limit') or "-"]) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетные отчеты по файлам результатов NanoVNA")
+    parser.add_argument('paths', nargs='+', help="файлы, маски или каталоги")
+    parser.add_argument('--output', default='reports', help="каталог отчетов")
+    parser.add_argument('--format', choices=['png', 'pdf'], default='png')
+    parser.add_argument('--mask', help="JSON-файл маски допусков")
+    parser.add_argument('--vf', type=float, default=0.66, help="коэффициент укорочения для рефлектограммы")
+    parser.add_argument('--workers', type=int, help="число процессов (по умолчанию - по числу ядер)")
+    args = parser.parse_args()
+
+    files = find_files(args.paths)
+    if not files:
+        print("Файлы результатов не найдены")
+        return
+    mask = LimitMask.load(args.mask) if args.mask else None
+    print(f"Файлов: {len(files)}")
+    started = time.monotonic()
+    rows = render_reports(files, args.output, args.format, mask, args.vf, args.workers)
+    index = os.path.join(args.output, 'report_index.tsv')
+    write_index(index, rows)
+    errors = [row for row in rows if 'error' in row]
+    failed = [row for row in rows if row.get('status') == 'FAIL']
+    incomplete = [row for row in rows if row.get('status') == 'INCOMPLETE']
+    print(f"Отчетов: {len(rows) - len(errors)} за {time.monotonic() - started:.1f} с, "
+          f"ошибок: {len(errors)}" + (f", не годны: {len(failed)}, "
+                                      f"не проверены полностью: {len(incomplete)}" if mask else ""))
+    for row in errors[:10]:
+        print(f"  {row['path']}: {row['error']}")
+    print(f"Сводка: {index}")
+
+
+if __name__ == "__main__":
+    main()
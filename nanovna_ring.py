@@ -0,0 +1,279 @@
+"""
+Кольцо сканирований в разделяемой памяти между процессами
+
+Процесс сбора пишет сканирования в кольцо слотов фиксированного размера,
+процессы анализа и построения графиков читают их как NumPy-представления
+поверх той же памяти - без pickle и копирования. Так сбор, анализ и
+matplotlib работают на разных ядрах, а не по очереди под одним GIL.
+
+Каждый слот защищен счетчиком (seqlock): во время записи он нечетный,
+после записи - 2 * номер кадра. Читатель берет представление кадра и после
+обработки проверяет valid(frame): если писатель успел переписать слот
+(читатель отстал на целое кольцо), результат нужно отбросить.
+
+Пример:
+  python nanovna_ring.py --port /dev/ttyACM0 --sweep 1e6 500e6 101
+"""
+import argparse
+import multiprocessing
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Заголовок: номер последнего записанного кадра, число слотов, точек, каналов
+_HEAD, _SLOTS, _POINTS, _CHANNELS = range(4)
+HEADER_WORDS = 8
+
+
+def _attach_shared_memory(name):
+    """Подключение к существующему сегменту без регистрации в resource_tracker"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        # Python < 3.13 регистрирует и подключение: отдельный процесс удалил бы
+        # сегмент при выходе. Дочерние процессы делят resource_tracker с
+        # создателем, для них снимать регистрацию нельзя.
+        if multiprocessing.parent_process() is None:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class SweepRing:
+    def __init__(self, shm, owner=False):
+        self.shm = shm
+        self.owner = owner
+        header = np.ndarray((HEADER_WORDS,), np.int64, shm.buf)
+        slots, points, channels = (int(header[i]) for i in (_SLOTS, _POINTS, _CHANNELS))
+        self.slots, self.points, self.channels = slots, points, channels
+
+        offset = header.nbytes
+        def array(shape, dtype):
+            nonlocal offset
+            a = np.ndarray(shape, dtype, shm.buf, offset)
+            offset += a.nbytes
+            return a
+        self.header = header
+        self.seq = array((slots,), np.int64)       # seqlock слотов
+        self.count = array((slots,), np.int64)     # фактическое число точек
+        self.time = array((slots,), np.float64)
+        self.lengths = array((slots, channels), np.int64)  # точек канала в кадре, 0 - канала нет
+        self.frequencies = array((slots, points), np.float64)
+        self.data = array((slots, channels, points), np.complex128)
+
+    @staticmethod
+    def size(slots, points, channels):
+        return 8 * HEADER_WORDS + slots * (8 * 3 + 8 * channels + 8 * points + 16 * channels * points)
+
+    @classmethod
+    def create(cls, slots=8, points=401, channels=2, name=None):
+        shm = shared_memory.SharedMemory(name=name, create=True,
+                                         size=cls.size(slots, points, channels))
+        header = np.ndarray((HEADER_WORDS,), np.int64, shm.buf)
+        header[:] = 0
+        header[_SLOTS], header[_POINTS], header[_CHANNELS] = slots, points, channels
+        ring = cls(shm, owner=True)
+        ring.seq[:] = 0
+        return ring
+
+    @classmethod
+    def attach(cls, name):
+        return cls(_attach_shared_memory(name))
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def write(self, sweep):
+        """Запись сканирования (dict frequencies, data0, data1) в следующий слот; номер кадра"""
+        frame = int(self.header[_HEAD]) + 1
+        slot = frame % self.slots
+        n = min(len(sweep['frequencies']), self.points)
+
+        self.seq[slot] = 2 * frame - 1
+        self.frequencies[slot, :n] = sweep['frequencies'][:n]
+        for channel in range(self.channels):
+            data = sweep.get(f"data{channel}")
+            m = 0 if data is None else min(n, len(data))
+            self.data[slot, channel, :m] = data[:m] if m else 0
+            # Хвост и отсутствующий канал не должны остаться от прежнего кадра слота
+            self.data[slot, channel, m:n] = 0
+            self.lengths[slot, channel] = m
+        self.count[slot] = n
+        self.time[slot] = time.time()
+        self.seq[slot] = 2 * frame
+        self.header[_HEAD] = frame
+        return frame
+
+    def latest(self):
+        """Номер последнего записанного кадра (0 - кадров еще нет)"""
+        return int(self.header[_HEAD])
+
+    def valid(self, frame):
+        """Кадр еще в кольце и не переписывается"""
+        return frame > 0 and int(self.seq[frame % self.slots]) == 2 * frame
+
+    def view(self, frame):
+        """
+        Представления кадра без копирования или None, если кадр уже переписан.
+        Каналов, которых не было в записанном сканировании, в результате нет.
+        """
+        slot = frame % self.slots
+        if not self.valid(frame):
+            return None
+        n = int(self.count[slot])
+        result = {'frame': frame, 'time': float(self.time[slot]),
+                  'frequencies': self.frequencies[slot, :n]}
+        for channel in range(self.channels):
+            m = int(self.lengths[slot, channel])
+            if m:
+                result[f"data{channel}"] = self.data[slot, channel, :m]
+        return result if self.valid(frame) else None
+
+    def copy(self, frame):
+        """Копия кадра с проверкой, что он не переписан во время копирования"""
+        view = self.view(frame)
+        if view is None:
+            return None
+        result = {key: value.copy() if isinstance(value, np.ndarray) else value
+                  for key, value in view.items()}
+        return result if self.valid(frame) else None
+
+    def wait(self, after, timeout=None, poll=0.002):
+        """Ожидание кадра новее after; номер кадра или None по таймауту"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            frame = self.latest()
+            if frame > after:
+                return frame
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(poll)
+
+    def close(self):
+        # Представления держат буфер - освобождаем их до закрытия
+        self.header = self.seq = self.count = self.time = self.lengths = None
+        self.frequencies = self.data = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # Вызывающий код еще держит представления кадров - память освободится с процессом
+            pass
+        if self.owner:
+            self.shm.unlink()
+
+
+def acquisition_process(name, device, sweep, cal_slot, sweep_time, stop_event):
+    from nanovna_device import NanoVNA
+    ring = SweepRing.attach(name)
+    start, stop, points = sweep
+    try:
+        with NanoVNA(device) as vna:
+            while not stop_event.is_set():
+                frame = ring.write(vna.measure(start, stop, points, cal_slot, (0, 1), sweep_time))
+                print(f"Сбор: кадр {frame}")
+    finally:
+        ring.close()
+
+
+def analysis_process(name, vf, stop_event):
+    import nanovna_analysis
+    ring = SweepRing.attach(name)
+    frame = 0
+    try:
+        while not stop_event.is_set():
+            latest = ring.wait(frame, timeout=0.5)
+            if latest is None:
+                continue
+            frame = latest
+            view = ring.view(frame)
+            if view is None:
+                continue
+            cable = nanovna_analysis.analyze_cable(view['frequencies'], view['data0'], vf)
+            notch = nanovna_analysis.analyze_filter(view['frequencies'], view['data1'])
+            if not ring.valid(frame):
+                print(f"Анализ: кадр {frame} переписан во время обработки, пропущен")
+                continue
+            length = cable['cable_length']
+            print(f"Анализ: кадр {frame}, длина " +
+                  (f"{length:.3f} м" if length else "-") +
+                  f", провал S21 {notch['notch_freq'] / 1e6:.2f} МГц")
+    finally:
+        ring.close()
+
+
+def plot_process(name, path, interval, stop_event):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import nanovna_analysis
+    ring = SweepRing.attach(name)
+    frame = 0
+    try:
+        while not stop_event.wait(interval):
+            latest = ring.latest()
+            if latest == frame:
+                continue
+            frame = latest
+            sweep = ring.copy(frame)
+            if sweep is None:
+                continue
+            frequencies_mhz = sweep['frequencies'] / 1e6
+            fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 8))
+            ax1.plot(frequencies_mhz, nanovna_analysis.calculate_vswr(sweep['data0']), 'b-')
+            ax1.set_ylabel('КСВ')
+            ax1.grid(True, alpha=0.3)
+            ax2.plot(frequencies_mhz, nanovna_analysis.calculate_s21_db(sweep['data1']), 'r-')
+            ax2.set_ylabel('S21 (дБ)')
+            ax2.set_xlabel('Частота (МГц)')
+            ax2.grid(True, alpha=0.3)
+            fig.savefig(path, dpi=100)
+            plt.close(fig)
+            print(f"График: кадр {frame} сохранен в {path}")
+    finally:
+        ring.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сбор, анализ и графики в отдельных процессах")
+    parser.add_argument('--port', default='/dev/ttyACM0')
+    parser.add_argument('--sweep', type=float, nargs=3, default=(1e6, 500e6, 101),
+                        metavar=('START', 'STOP', 'POINTS'))
+    parser.add_argument('--cal-slot', type=int)
+    parser.add_argument('--sweep-time', type=float, default=1.0)
+    parser.add_argument('--slots', type=int, default=8)
+    parser.add_argument('--vf', type=float, default=0.66)
+    parser.add_argument('--plot', default='live_sweep.png')
+    parser.add_argument('--plot-interval', type=float, default=5.0)
+    args = parser.parse_args()
+
+    sweep = tuple(int(v) for v in args.sweep)
+    ring = SweepRing.create(args.slots, sweep[2], 2)
+    stop_event = multiprocessing.Event()
+    processes = [
+        multiprocessing.Process(target=acquisition_process, name='acquisition',
+                                args=(ring.name, args.port, sweep, args.cal_slot,
+                                      args.sweep_time, stop_event)),
+        multiprocessing.Process(target=analysis_process, name='analysis',
+                                args=(ring.name, args.vf, stop_event)),
+        multiprocessing.Process(target=plot_process, name='plot',
+                                args=(ring.name, args.plot, args.plot_interval, stop_event)),
+    ]
+    for process in processes:
+        process.start()
+    try:
+        while all(process.is_alive() for process in processes):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        print("\nОстановка")
+    finally:
+        stop_event.set()
+        for process in processes:
+            process.join(timeout=5)
+        ring.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+"""
+Локальный сервер трансляции сканирований для нескольких зрителей
+
+Сервер владеет прибором: сканирует в отдельном потоке, пока есть хотя бы
+один подписчик, и рассылает каждое сканирование по WebSocket (asyncio,
+без внешних зависимостей). Порт прибора открыт один раз, сколько бы
+панелей ни смотрели.
+
+Каждый клиент получает бинарные кадры:
+  заголовок <2sBBIHB: b'NV', версия, тип (0 - полный, 1 - изменения),
+  номер сканирования, число точек, маска каналов (бит 0 - S11, бит 1 - S21)
+  полный кадр: частоты float64[n], затем по каналам complex64[n]
+  кадр изменений: число k (uint16), индексы uint16[k], по каналам complex64[k]
+Изменения считаются относительно последнего кадра, отправленного именно
+этому клиенту, поэтому клиент с ограничением частоты (/ws?rate=2) просто
+пропускает промежуточные сканирования и получает самое свежее.
+
+HTTP:
+  /           - простая панель в браузере
+  /ws         - поток кадров (параметр rate - кадров в секунду)
+  /latest.json - последнее сканирование
+  /status     - число клиентов и номер сканирования
+
+Пример:
+  python nanovna_server.py --port /dev/ttyACM0 --sweep 1e6 500e6 101 --http-port 8080
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from nanovna_device import NanoVNA
+from nanovna_metrics import METRICS
+
+FRAME_HEADER = struct.Struct('<2sBBIHB')
+FRAME_VERSION = 1
+FRAME_KEY = 0
+FRAME_DELTA = 1
+WS_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+VIEWER_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>NanoVNA</title></head>
+<body style="font-family:sans-serif">
+<div id="info">Подключение...</div>
+<canvas id="plot" width="900" height="400" style="border:1px solid #ccc"></canvas>
+<script>
+const channels = [null, null];
+let freqs = null;
+const ws = new WebSocket(`ws://${location.host}/ws?rate=5`);
+ws.binaryType = 'arraybuffer';
+ws.onmessage = (event) => {
+  const view = new DataView(event.data);
+  const kind = view.getUint8(3), seq = view.getUint32(4, true);
+  const n = view.getUint16(8, true), mask = view.getUint8(10);
+  let offset = 11;
+  if (kind === 0) {
+    freqs = new Float64Array(event.data.slice(offset, offset + 8 * n)); offset += 8 * n;
+    for (let ch = 0; ch < 2; ch++) if (mask & (1 << ch)) {
+      channels[ch] = new Float32Array(event.data.slice(offset, offset + 8 * n)); offset += 8 * n;
+    }
+  } else {
+    const k = view.getUint16(offset, true); offset += 2;
+    const idx = new Uint16Array(event.data.slice(offset, offset + 2 * k)); offset += 2 * k;
+    for (let ch = 0; ch < 2; ch++) if (mask & (1 << ch)) {
+      const values = new Float32Array(event.data.slice(offset, offset + 8 * k)); offset += 8 * k;
+      idx.forEach((i, j) => { channels[ch][2 * i] = values[2 * j]; channels[ch][2 * i + 1] = values[2 * j + 1]; });
+    }
+  }
+  draw(seq, n);
+};
+function draw(seq, n) {
+  const c = document.getElementById('plot'), g = c.getContext('2d');
+  g.clearRect(0, 0, c.width, c.height);
+  ['blue', 'red'].forEach((color, ch) => {
+    const d = channels[ch]; if (!d) return;
+    g.strokeStyle = color; g.beginPath();
+    for (let i = 0; i < n; i++) {
+      const db = 10 * Math.log10(d[2 * i] ** 2 + d[2 * i + 1] ** 2 + 1e-12);
+      const x = i * c.width / (n - 1), y = -db * c.height / 80;
+      i ? g.lineTo(x, y) : g.moveTo(x, y);
+    }
+    g.stroke();
+  });
+  document.getElementById('info').textContent =
+    `Сканирование ${seq}: ${(freqs[0] / 1e6).toFixed(3)}-${(freqs[n - 1] / 1e6).toFixed(3)} МГц, ` +
+    `${n} точек (S11 - синий, S21 - красный, 0...-80 дБ)`;
+}
+</script></body></html>
+"""
+
+
+def channel_mask(channels):
+    return sum(1 << channel for channel in channels)
+
+
+def encode_key_frame(seq, sweep, channels):
+    n = len(sweep['frequencies'])
+    parts = [FRAME_HEADER.pack(b'NV', FRAME_VERSION, FRAME_KEY, seq, n, channel_mask(channels)),
+             np.asarray(sweep['frequencies'], dtype='<f8').tobytes()]
+    parts += [np.asarray(sweep[f"data{channel}"][:n], dtype='<c8').tobytes() for channel in channels]
+    return b''.join(parts)
+
+
+def encode_delta_frame(seq, sweep, channels, indices):
+    n = len(sweep['frequencies'])
+    parts = [FRAME_HEADER.pack(b'NV', FRAME_VERSION, FRAME_DELTA, seq, n, channel_mask(channels)),
+             struct.pack('<H', len(indices)), indices.astype('<u2').tobytes()]
+    parts += [np.asarray(sweep[f"data{channel}"][indices], dtype='<c8').tobytes() for channel in channels]
+    return b''.join(parts)
+
+
+def decode_frame(data, state=None):
+    """Разбор кадра на стороне клиента; state - результат предыдущего вызова"""
+    magic, version, kind, seq, n, mask = FRAME_HEADER.unpack_from(data)
+    if magic != b'NV' or version != FRAME_VERSION:
+        raise ValueError("Неизвестный формат кадра")
+    channels = [channel for channel in (0, 1) if mask & (1 << channel)]
+    offset = FRAME_HEADER.size
+    if kind == FRAME_KEY:
+        state = {'frequencies': np.frombuffer(data, '<f8', n, offset).copy()}
+        offset += 8 * n
+        for channel in channels:
+            state[f"data{channel}"] = np.frombuffer(data, '<c8', n, offset).astype(np.complex128)
+            offset += 8 * n
+    else:
+        if state is None:
+            raise ValueError("Кадр изменений без полного кадра")
+        (k,) = struct.unpack_from('<H', data, offset)
+        offset += 2
+        indices = np.frombuffer(data, '<u2', k, offset).astype(np.intp)
+        offset += 2 * k
+        for channel in channels:
+            state[f"data{channel}"][indices] = np.frombuffer(data, '<c8', k, offset)
+            offset += 8 * k
+    state['seq'] = seq
+    return state
+
+
+def ws_frame(payload, opcode=0x2):
+    """Кадр WebSocket сервера (без маски)"""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+class StreamClient:
+    """Подписчик: ограничение частоты и последнее отправленное ему состояние"""
+
+    def __init__(self, writer, rate):
+        self.writer = writer
+        self.interval = 1.0 / rate
+        self.next_time = 0.0
+        self.frequencies = None
+        self.sent = {}
+        self.closed = False
+
+    def encode(self, seq, sweep, channels, threshold):
+        """Кадр изменений относительно отправленного клиенту или полный кадр"""
+        frequencies = sweep['frequencies']
+        if self.frequencies is None or not np.array_equal(self.frequencies, frequencies):
+            frame = encode_key_frame(seq, sweep, channels)
+        else:
+            changed = np.zeros(len(frequencies), dtype=bool)
+            for channel in channels:
+                changed |= np.abs(sweep[f"data{channel}"] - self.sent[channel]) > threshold
+            indices = np.nonzero(changed)[0]
+            # Изменений слишком много - полный кадр не больше по размеру
+            delta_size = 2 + len(indices) * (2 + 8 * len(channels))
+            if delta_size >= 8 * len(frequencies) * (1 + len(channels)):
+                frame = encode_key_frame(seq, sweep, channels)
+            else:
+                frame = encode_delta_frame(seq, sweep, channels, indices)
+                for channel in channels:
+                    self.sent[channel][indices] = sweep[f"data{channel}"][indices]
+                return frame
+        self.frequencies = frequencies.copy()
+        self.sent = {channel: sweep[f"data{channel}"].astype(np.complex64)
+                     for channel in channels}
+        return frame
+
+
+class StreamServer:
+    def __init__(self, device, sweep, channels=(0, 1), cal_slot=None, sweep_time=1.0,
+                 host='127.0.0.1', http_port=8080, max_rate=10.0, threshold=1e-4,
+                 vna_factory=NanoVNA):
+        self.device = device
+        self.sweep = tuple(int(v) for v in sweep)
+        self.channels = tuple(sorted(channels))
+        self.cal_slot = cal_slot
+        self.sweep_time = sweep_time
+        self.host = host
+        self.http_port = http_port
+        self.max_rate = max_rate
+        self.threshold = threshold
+        self.vna_factory = vna_factory
+        self.vna = None
+        self.clients = set()
+        self.latest = None
+        self.seq = 0
+        self.condition = None
+
+    def _measure(self):
+        """Одно сканирование (в потоке, чтобы не блокировать цикл событий)"""
+        if self.vna is None:
+            self.vna = self.vna_factory(self.device).open()
+        start, stop, points = self.sweep
+        # Sweep выравнивает длины каналов при создании
+        return self.vna.measure(start, stop, points, self.cal_slot, self.channels, self.sweep_time)
+
+    async def _notify(self):
+        async with self.condition:
+            self.condition.notify_all()
+
+    async def acquire(self):
+        """Сканирование, пока есть подписчики"""
+        loop = asyncio.get_running_loop()
+        while True:
+            async with self.condition:
+                await self.condition.wait_for(lambda: self.clients)
+            try:
+                sweep = await loop.run_in_executor(None, self._measure)
+            except Exception as e:
+                print(f"Ошибка сканирования: {e}")
+                if self.vna is not None:
+                    self.vna.close()
+                    self.vna = None
+                await asyncio.sleep(1.0)
+                continue
+            self.latest = sweep
+            self.seq += 1
+            await self._notify()
+
+    async def _send_loop(self, client):
+        loop = asyncio.get_running_loop()
+        last_seq = 0
+        while not client.closed:
+            async with self.condition:
+                await self.condition.wait_for(lambda: self.seq != last_seq or client.closed)
+            if client.closed:
+                return
+            # Ограничение частоты: ждем и берем самое свежее сканирование
+            delay = client.next_time - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            seq, sweep = self.seq, self.latest
+            frame = client.encode(seq, sweep, self.channels, self.threshold)
+            client.writer.write(ws_frame(frame))
+            await client.writer.drain()
+            kind = 'key' if frame[3] == FRAME_KEY else 'delta'
+            METRICS.inc('nanovna_stream_frames_total', kind=kind)
+            METRICS.inc('nanovna_stream_bytes_total', len(frame), kind=kind)
+            last_seq = seq
+            client.next_time = loop.time() + client.interval
+
+    async def _read_loop(self, reader, client):
+        """Чтение кадров клиента: закрытие и ping, остальное игнорируется"""
+        try:
+            while True:
+                first, second = await reader.readexactly(2)
+                opcode = first & 0x0F
+                length = second & 0x7F
+                if length == 126:
+                    (length,) = struct.unpack('!H', await reader.readexactly(2))
+                elif length == 127:
+                    (length,) = struct.unpack('!Q', await reader.readexactly(8))
+                mask = await reader.readexactly(4) if second & 0x80 else None
+                payload = await reader.readexactly(length)
+                if mask:
+                    payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+                if opcode == 0x8:
+                    client.writer.write(ws_frame(b'', 0x8))
+                    return
+                if opcode == 0x9:
+                    client.writer.write(ws_frame(payload, 0xA))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return
+
+    async def _websocket(self, reader, writer, headers, query):
+        key = headers.get('sec-websocket-key')
+        if not key:
+            self._respond(writer, 400, b'Expected WebSocket', 'text/plain')
+            return
+        accept = base64.b64encode(hashlib.sha1(key.encode() + WS_GUID).digest()).decode()
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                      f"Connection: Upgrade\r\nSec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        await writer.drain()
+
+        try:
+            rate = float(query.get('rate', [self.max_rate])[0])
+        except ValueError:
+            rate = self.max_rate
+        client = StreamClient(writer, min(max(rate, 0.01), self.max_rate))
+        self.clients.add(client)
+        await self._notify()
+        print(f"Клиент подключен ({len(self.clients)}), {1 / client.interval:.2f} кадр/с")
+
+        sender = asyncio.create_task(self._send_loop(client))
+        try:
+            await self._read_loop(reader, client)
+        finally:
+            client.closed = True
+            self.clients.discard(client)
+            await self._notify()
+            try:
+                await sender
+            except (ConnectionError, asyncio.CancelledError):
+                pass
+            print(f"Клиент отключен ({len(self.clients)})")
+
+    @staticmethod
+    def _respond(writer, status, body, content_type):
+        reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found'}[status]
+        writer.write((f"HTTP/1.1 {status} {reason}\r\nContent-Type: {content_type}\r\n"
+                      f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode() + body)
+
+    async def handle(self, reader, writer):
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        lines = request.decode('latin-1').split('\r\n')
+        method, target, _ = (lines[0].split(' ') + ['', ''])[:3]
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(':')
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+
+        try:
+            if url.path == '/ws':
+                await self._websocket(reader, writer, headers, query)
+            elif url.path == '/':
+                self._respond(writer, 200, VIEWER_HTML.encode('utf-8'), 'text/html; charset=utf-8')
+            elif url.path == '/latest.json':
+                sweep = self.latest or {}
+                body = {'seq': self.seq}
+                body.update({key: value.tolist() for key, value in sweep.items()
+                             if not np.iscomplexobj(value)})
+                body.update({f"{key}_re": value.real.tolist() for key, value in sweep.items()
+                             if np.iscomplexobj(value)})
+                body.update({f"{key}_im": value.imag.tolist() for key, value in sweep.items()
+                             if np.iscomplexobj(value)})
+                self._respond(writer, 200, json.dumps(body).encode(), 'application/json')
+            elif url.path == '/status':
+                body = {'device': self.device, 'sweep': self.sweep, 'seq': self.seq,
+                        'clients': len(self.clients), 'time': time.time()}
+                self._respond(writer, 200, json.dumps(body).encode(), 'application/json')
+            else:
+                self._respond(writer, 404, b'Not Found', 'text/plain')
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def run(self):
+        self.condition = asyncio.Condition()
+        server = await asyncio.start_server(self.handle, self.host, self.http_port)
+        print(f"Трансляция: http://{self.host}:{self.http_port}/ (WebSocket /ws)")
+        acquisition = asyncio.create_task(self.acquire())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            acquisition.cancel()
+            if self.vna is not None:
+                self.vna.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Трансляция сканирований NanoVNA по WebSocket")
+    parser.add_argument('--port', default='/dev/ttyACM0', help="порт прибора")
+    parser.add_argument('--sweep', type=float, nargs=3, default=(1e6, 500e6, 101),
+                        metavar=('START', 'STOP', 'POINTS'))
+    parser.add_argument('--channels', type=int, nargs='+', default=[0, 1], choices=[0, 1])
+    parser.add_argument('--cal-slot', type=int)
+    parser.add_argument('--sweep-time', type=float, default=1.0)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--http-port', type=int, default=8080)
+    parser.add_argument('--max-rate', type=float, default=10.0, help="предел кадров в секунду на клиента")
+    parser.add_argument('--threshold', type=float, default=1e-4, help="порог изменения точки")
+    args = parser.parse_args()
+
+    server = StreamServer(args.port, args.sweep, args.channels, args.cal_slot, args.sweep_time,
+                          args.host, args.http_port, args.max_rate, args.threshold)
+    try:
+        asyncio.run(server.run())
+    except KeyboardInterrupt:
+        print("\nСервер остановлен")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Компактное представление одного сканирования
+
+Sweep хранит частоты (float64) и каналы S11/S21 (complex128 или complex64)
+в массивах NumPy одинаковой длины плюс метаданные: прибор, слот калибровки,
+время и план сканирования (start, stop, points). Точка занимает 24-40 байт
+вместо ~100 в списках кортежей, длины каналов выравниваются один раз при
+создании.
+
+Sweep читается как словарь {'frequencies', 'data0', 'data1'} (sweep['data0'],
+get, keys, items) - код, принимающий словари сканирования, работает с ним
+без изменений, - а len() - число точек. Срез, маска или band() дают новый
+Sweep (для срезов - представления без копирования).
+"""
+import numpy as np
+
+KEYS = ('frequencies', 'data0', 'data1')
+
+
+class Sweep:
+    __slots__ = ('frequencies', 'data0', 'data1', 'device', 'cal_slot', 'timestamp', 'plan')
+
+    def __init__(self, frequencies, data0=None, data1=None, device=None, cal_slot=None,
+                 timestamp=None, plan=None, dtype=np.complex128):
+        frequencies = np.asarray(frequencies, dtype=np.float64)
+        channels = [None if data is None else np.asarray(data, dtype=dtype) for data in (data0, data1)]
+        n = min([len(frequencies)] + [len(data) for data in channels if data is not None])
+        self.frequencies = frequencies[:n]
+        self.data0, self.data1 = (None if data is None else data[:n] for data in channels)
+        self.device = device
+        self.cal_slot = cal_slot
+        self.timestamp = timestamp
+        self.plan = plan
+
+    @classmethod
+    def from_dict(cls, sweep, **metadata):
+        """Sweep из словаря сканирования (frequencies, data0, data1)"""
+        if isinstance(sweep, Sweep):
+            return sweep
+        return cls(sweep['frequencies'], sweep.get('data0'), sweep.get('data1'), **metadata)
+
+    def _metadata(self):
+        return {'device': self.device, 'cal_slot': self.cal_slot,
+                'timestamp': self.timestamp, 'plan': self.plan}
+
+    def _derive(self, index, dtype=None):
+        channels = [None if data is None else data[index] for data in (self.data0, self.data1)]
+        return Sweep(self.frequencies[index], *channels, **self._metadata(),
+                     dtype=dtype or self.dtype)
+
+    # Словарь каналов: sweep['data0'], sweep.get('data1'), sweep.items()
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            value = getattr(self, key) if key in KEYS else None
+            if value is None:
+                raise KeyError(key)
+            return value
+        if isinstance(key, (int, np.integer)):
+            key = slice(key, key + 1 or None)
+        return self._derive(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return [key for key in KEYS if getattr(self, key) is not None]
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, key):
+        return key in KEYS and getattr(self, key) is not None
+
+    def __len__(self):
+        """Число точек"""
+        return self.points
+
+    def __repr__(self):
+        channels = ', '.join(key for key in self if key != 'frequencies')
+        return f"Sweep({self.points} точек, {channels or 'без данных'}, прибор {self.device})"
+
+    @property
+    def points(self):
+        return len(self.frequencies)
+
+    @property
+    def dtype(self):
+        data = self.data0 if self.data0 is not None else self.data1
+        return np.complex128 if data is None else data.dtype
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, key).nbytes for key in self)
+
+    def band(self, start, stop):
+        """Точки в диапазоне [start, stop] Гц - представление без копирования"""
+        lo = np.searchsorted(self.frequencies, start, side='left')
+        hi = np.searchsorted(self.frequencies, stop, side='right')
+        return self._derive(slice(lo, hi))
+
+    def copy(self):
+        return self._derive(slice(None), self.dtype)._own()
+
+    def compact(self):
+        """Копия с каналами complex64 - для колец и архивов"""
+        return self._derive(slice(None), np.complex64)._own()
+
+    def _own(self):
+        # Срез - представление исходных массивов; для копии отвязываемся от них
+        for key in self:
+            value = getattr(self, key)
+            if value.base is not None:
+                setattr(self, key, value.copy())
+        return self
+
+    def to_dict(self):
+        result = dict(self)
+        result.update(self._metadata())
+        return result
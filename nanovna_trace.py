@@ -0,0 +1,108 @@
+"""
+Трассировка этапов измерения в формате Chrome trace (chrome://tracing, Perfetto)
+
+По умолчанию выключена: span() возвращает общий пустой контекст и почти
+ничего не стоит. Включение из скриптов - переменная окружения
+NANOVNA_TRACE=<файл.json>, трасса сохраняется при завершении процесса.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+_NULL_SPAN = nullcontext()
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'cat', 'args', 'start')
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        if exc_type is not None:
+            self.args['error'] = repr(exc)
+        self.tracer._add({
+            'name': self.name, 'cat': self.cat, 'ph': 'X',
+            'ts': (self.start - self.tracer.origin) * 1e6,
+            'dur': (end - self.start) * 1e6,
+            'pid': os.getpid(), 'tid': threading.get_ident(),
+            'args': self.args,
+        })
+        return False
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+
+    def enable(self):
+        self.origin = time.perf_counter()
+        self.events = []
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, name, cat='nanovna', **args):
+        """Контекст участка; при выключенной трассировке - пустой"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, cat, args)
+
+    def instant(self, name, cat='nanovna', **args):
+        if self.enabled:
+            self._add({'name': name, 'cat': cat, 'ph': 'i', 's': 't',
+                       'ts': (time.perf_counter() - self.origin) * 1e6,
+                       'pid': os.getpid(), 'tid': threading.get_ident(), 'args': args})
+
+    def _add(self, event):
+        with self.lock:
+            self.events.append(event)
+
+    def export(self, path):
+        """Сохранение трассы в JSON для chrome://tracing или ui.perfetto.dev"""
+        with self.lock:
+            events = list(self.events)
+        threads = {(e['pid'], e['tid']) for e in events}
+        names = {t.ident: t.name for t in threading.enumerate()}
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                     'args': {'name': names.get(tid, str(tid))}} for pid, tid in threads]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'},
+                      f, ensure_ascii=False, default=str)
+        return path
+
+
+TRACER = Tracer()
+
+
+def span(name, cat='nanovna', **args):
+    return TRACER.span(name, cat, **args)
+
+
+def enable_from_env():
+    """Включение трассировки, если задан NANOVNA_TRACE; экспорт при выходе"""
+    path = os.environ.get('NANOVNA_TRACE')
+    if not path or TRACER.enabled:
+        return None
+    TRACER.enable()
+
+    def _export():
+        TRACER.export(path)
+        print(f"Трасса сохранена в: {path}")
+    atexit.register(_export)
+    return path